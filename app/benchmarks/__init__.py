@@ -0,0 +1,4 @@
+####
+# Benchmarks and local stand-ins for the external services used by the agents.
+# Run them from the /app directory, e.g. python -m benchmarks.concurrent_query_chat
+####
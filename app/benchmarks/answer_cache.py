@@ -0,0 +1,131 @@
+####
+# Measures the QueryAgent semantic answer cache on a workload of repeated questions.
+# Runs the same question stream with the cache disabled and enabled against a fake LLM, an in-memory qdrant
+# and a fakeredis server, then checks that a reindex (generation bump) stops the old answers from being served.
+# Usage: python -m benchmarks.answer_cache --queries 100 --distinct 10 --latency 0.3
+####
+
+import os
+import argparse
+import asyncio
+import random
+import tempfile
+import time
+from langchain_community.embeddings import DeterministicFakeEmbedding
+from langchain_core.documents import Document
+from qdrant_client import QdrantClient
+from qdrant_client.models import Distance, VectorParams
+
+from benchmarks.server_utils import run_server_in_thread, start_fake_redis
+from benchmarks.fake_openai import create_fake_openai_app
+
+
+COLLECTION = "bench_answer_cache"
+HISTORY = [{"role": "user", "content": "Hello"}, {"role": "assistant", "content": "Hi, how can I help?"}]
+
+
+def build_index(embedding) -> QdrantClient:
+    """
+    Creates an in-memory collection with a few help articles
+    """
+    from langchain_qdrant import QdrantVectorStore
+
+    client = QdrantClient(location=":memory:")
+    client.create_collection(COLLECTION, vectors_config=VectorParams(size=768, distance=Distance.COSINE))
+
+    vector_store = QdrantVectorStore(client=client, embedding=embedding, collection_name=COLLECTION)
+    vector_store.add_documents([
+        Document(page_content=f"Help article {i} about buying credits and sender ID approval.",
+                 metadata={"source": f"https://uellosend.com/help/{i}", "title": f"Help {i}"})
+        for i in range(20)
+    ])
+
+    return client
+
+
+async def run_workload(questions, enabled: bool):
+    """
+    Asks every question in a fresh session, returns the mean latency in seconds
+    """
+    from src.agents.rag_agent import QueryAgent
+    from src.utils.manage_answer_cache import answer_cache
+
+    answer_cache.enabled = enabled
+    latencies = []
+
+    for i, question in enumerate(questions):
+        agent = QueryAgent(list(HISTORY))
+
+        start = time.perf_counter()
+        await agent.generate_response(question, f"bench-{i}")
+        latencies.append(time.perf_counter() - start)
+
+    return sum(latencies) / len(latencies)
+
+
+async def main_async(args, fake_llm):
+    #Imported here so the environment is set before the clients are created
+    from src.utils.manage_resources import register_resource, close_resources
+    from src.utils.manage_db import create_QueryAgent_messages_table
+    from src.utils.manage_answer_cache import answer_cache
+
+    embedding = DeterministicFakeEmbedding(size=768)
+    register_resource("embedding_client", embedding)
+    register_resource("qdrant_client", build_index(embedding))
+    await create_QueryAgent_messages_table()
+
+    rng = random.Random(3)
+    distinct = [f"How do I buy credits, variant {i}?" for i in range(args.distinct)]
+    #Skewed towards the first questions, like real support traffic
+    questions = rng.choices(distinct, weights=[1 / (i + 1) for i in range(args.distinct)], k=args.queries)
+
+    print(f"{'cache':<10}{'LLM calls':>12}{'hit rate':>12}{'mean latency':>16}")
+
+    for enabled in (False, True):
+        llm_calls = fake_llm.state.requests
+        mean = await run_workload(questions, enabled)
+        llm_calls = fake_llm.state.requests - llm_calls
+
+        hit_rate = f"{answer_cache.hit_rate:.0%}" if enabled else "-"
+        print(f"{'on' if enabled else 'off':<10}{llm_calls:>12}{hit_rate:>12}{mean * 1000:>14.1f}ms")
+
+    assert answer_cache.hits >= args.queries - args.distinct, "Repeated questions were not served from the cache"
+
+    #After a reindex the same question has to go to the LLM again
+    await answer_cache.invalidate()
+    llm_calls = fake_llm.state.requests
+    await run_workload(questions[:1], True)
+
+    assert fake_llm.state.requests == llm_calls + 1, "Cached answer was served after a reindex"
+    print("OK: repeated questions skip the LLM and a reindex invalidates the cache")
+
+    await close_resources()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures the QueryAgent semantic answer cache on a workload of repeated questions")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--distinct", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.3, help="Latency of the fake LLM in seconds")
+    args = parser.parse_args()
+
+    fake_llm = create_fake_openai_app(latency=args.latency)
+    base_url, server = run_server_in_thread(fake_llm)
+    redis_port, redis_process = start_fake_redis()
+
+    os.environ["OPEN_ROUTER_URL"] = base_url
+    os.environ["OPEN_ROUTER_KEY"] = "fake-key"
+    os.environ["QDRANT_COLLECTION"] = COLLECTION
+    os.environ["REDIS_HOST"] = "127.0.0.1"
+    os.environ["REDIS_PORT"] = str(redis_port)
+    os.environ["QUERY_AGENT_DB"] = os.path.join(tempfile.mkdtemp(), "query_agent")
+
+    try:
+        asyncio.run(main_async(args, fake_llm))
+    finally:
+        server.should_exit = True
+        redis_process.terminate()
+
+
+if __name__ == "__main__":
+    main()
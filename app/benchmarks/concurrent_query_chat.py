@@ -0,0 +1,68 @@
+####
+# Checks that concurrent QueryAgent chats do not block each other.
+# N chats against a fake OpenAI compatible server should finish in about one LLM latency, not N times that.
+# Usage: python -m benchmarks.concurrent_query_chat --concurrency 20 --latency 0.5
+####
+
+import os
+import argparse
+import asyncio
+import tempfile
+import time
+from langchain_community.embeddings import DeterministicFakeEmbedding
+from qdrant_client import QdrantClient
+
+from benchmarks.server_utils import run_server_in_thread
+from benchmarks.fake_openai import create_fake_openai_app
+
+
+async def run_benchmark(concurrency: int, latency: float) -> float:
+    """
+    Runs N chats at the same time and returns how long they took in total
+    """
+    #Imported here so the environment is set before the clients are created
+    from src.utils.manage_resources import register_resource, close_resources
+    from src.utils.manage_db import create_QueryAgent_messages_table
+    from src.agents.rag_agent import QueryAgent
+
+    register_resource("embedding_client", DeterministicFakeEmbedding(size=768))
+    register_resource("qdrant_client", QdrantClient(location=":memory:"))
+    await create_QueryAgent_messages_table()
+
+    agents = [QueryAgent([]) for _ in range(concurrency)]
+
+    #First turn of each session goes straight to the LLM
+    start = time.perf_counter()
+    await asyncio.gather(*[agent.generate_response(f"Question number {i}", f"bench-{i}") for i, agent in enumerate(agents)])
+    elapsed = time.perf_counter() - start
+
+    await close_resources()
+
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Checks that concurrent QueryAgent chats do not block each other")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.5, help="Latency of the fake LLM in seconds")
+    args = parser.parse_args()
+
+    base_url, server = run_server_in_thread(create_fake_openai_app(latency=args.latency))
+
+    os.environ["OPEN_ROUTER_URL"] = base_url
+    os.environ["OPEN_ROUTER_KEY"] = "fake-key"
+    os.environ["LLM_MAX_CONCURRENCY"] = str(args.concurrency)
+    os.environ["QUERY_AGENT_DB"] = os.path.join(tempfile.mkdtemp(), "query_agent")
+
+    elapsed = asyncio.run(run_benchmark(args.concurrency, args.latency))
+    server.should_exit = True
+
+    print(f"{args.concurrency} concurrent chats, LLM latency {args.latency}s -> total {elapsed:.3f}s")
+    print(f"Sequential time would be about {args.concurrency * args.latency:.3f}s")
+
+    assert elapsed < 2 * args.latency, "Concurrent chats are blocking each other"
+    print("OK: chats ran concurrently")
+
+
+if __name__ == "__main__":
+    main()
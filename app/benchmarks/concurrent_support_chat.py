@@ -0,0 +1,75 @@
+####
+# Checks that concurrent UelloSendAgent conversations do not block each other.
+# Runs against local stand-ins for Gemini and the UelloSend API, each conversation triggers one tool call.
+# Usage: python -m benchmarks.concurrent_support_chat --concurrency 10 --model-latency 0.3 --tool-latency 0.2
+####
+
+import os
+import argparse
+import asyncio
+import tempfile
+import time
+
+from benchmarks.server_utils import run_server_in_thread
+from benchmarks.fake_gemini import create_fake_gemini_app
+from benchmarks.fake_uellosend import create_fake_uellosend_app, set_tool_urls
+
+
+async def run_benchmark(concurrency: int) -> float:
+    """
+    Runs N support conversations at the same time and returns how long they took in total
+    """
+    #Imported here so the environment is set before the agent and tools read it
+    from src.utils.manage_resources import close_resources
+    from src.utils.manage_db import create_UelloSendAgent_messages_table
+    from src.agents.gemini_agent import UelloSendAgent
+
+    await create_UelloSendAgent_messages_table()
+
+    agents = [UelloSendAgent() for _ in range(concurrency)]
+
+    start = time.perf_counter()
+    replies = await asyncio.gather(*[
+        agent.run_agent(f"Hi, my email is customer{i}@example.com", f"bench-{i}") for i, agent in enumerate(agents)
+    ])
+    elapsed = time.perf_counter() - start
+
+    await close_resources()
+
+    assert all(replies), "Some conversations did not get a reply"
+
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Checks that concurrent UelloSendAgent conversations do not block each other")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--model-latency", type=float, default=0.3, help="Latency of the fake Gemini model in seconds")
+    parser.add_argument("--tool-latency", type=float, default=0.2, help="Latency of the fake UelloSend API in seconds")
+    args = parser.parse_args()
+
+    gemini_url, gemini_server = run_server_in_thread(create_fake_gemini_app(latency=args.model_latency))
+    api_url, api_server = run_server_in_thread(create_fake_uellosend_app(latency=args.tool_latency))
+
+    os.environ["GEMINI_API_ENDPOINT"] = gemini_url
+    os.environ["GEMINI_TRANSPORT"] = "rest"
+    os.environ["GEMINI_API_KEY"] = "fake-key"
+    os.environ["UELLOSEND_AGENT_DB"] = os.path.join(tempfile.mkdtemp(), "uellosend_agent")
+    set_tool_urls(api_url, os.environ)
+
+    elapsed = asyncio.run(run_benchmark(args.concurrency))
+    gemini_server.should_exit = True
+    api_server.should_exit = True
+
+    #One conversation is a model call, a tool call and a second model call
+    one_conversation = 2 * args.model_latency + args.tool_latency
+
+    print(f"{args.concurrency} concurrent conversations -> total {elapsed:.3f}s")
+    print(f"One conversation takes about {one_conversation:.3f}s, sequential would be about {args.concurrency * one_conversation:.3f}s")
+
+    assert elapsed < 2 * one_conversation, "Support conversations are blocking each other"
+    print("OK: conversations ran concurrently")
+
+
+if __name__ == "__main__":
+    main()
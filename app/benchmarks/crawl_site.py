@@ -0,0 +1,104 @@
+####
+# Measures re-indexing a site with the async conditional crawler against a local fixture site.
+# Before: WebBaseLoader loads every url one after another.
+# After: the /scraper pipeline (crawl, split, incremental index, save validators) on a cold run,
+# an unchanged re-run (all pages answered with 304) and a re-run with a few pages edited or removed.
+# Uses a fakeredis server for the validators, a fake embedding and an in-memory qdrant.
+# Usage: python -m benchmarks.crawl_site --pages 100 --latency 0.1
+####
+
+import os
+import argparse
+import asyncio
+import time
+from langchain_community.embeddings import DeterministicFakeEmbedding
+from qdrant_client import QdrantClient
+
+from benchmarks.server_utils import run_server_in_thread, start_fake_redis
+from benchmarks.fake_site import create_fake_site_app
+
+
+async def scrape_and_index(agent, urls):
+    """
+    Same steps as the /scraper endpoint
+    """
+    start = time.perf_counter()
+
+    crawl = await agent.scrape_web_content(urls)
+    counts = await agent.embed_and_save_documents(crawl.documents, sources=crawl.changed_sources)
+    await agent.crawler.save_validators(crawl)
+
+    return time.perf_counter() - start, crawl.summary(), counts
+
+
+async def main_async(args, site, urls):
+    #Imported here so the environment is set before the clients are created
+    from src.utils.manage_resources import register_resource, close_resources
+    from src.agents.rag_agent import QueryAgent
+
+    register_resource("embedding_client", DeterministicFakeEmbedding(size=384))
+    register_resource("qdrant_client", QdrantClient(location=":memory:"))
+
+    agent = QueryAgent([])
+    agent.crawler.per_host_concurrency = args.per_host
+    agent.crawler.host_delay = args.host_delay
+
+    print(f"{'run':<24}{'seconds':>9}  pages / index counts")
+
+    elapsed, pages, counts = await scrape_and_index(agent, urls)
+    print(f"{'crawler, cold':<24}{elapsed:>9.2f}  {pages} {counts}")
+
+    elapsed, pages, counts = await scrape_and_index(agent, urls)
+    print(f"{'crawler, unchanged':<24}{elapsed:>9.2f}  {pages} {counts}")
+    assert pages["fetched"] == 0 and pages["not_modified"] == len(urls), "Unchanged pages were downloaded again"
+    assert counts["removed"] == 0, "Pages answered with 304 lost their chunks"
+
+    for page in range(5):
+        site.state.versions[page] += 1
+    for page in range(len(urls) - 2, len(urls)):
+        site.state.versions[page] = None
+
+    elapsed, pages, counts = await scrape_and_index(agent, urls)
+    print(f"{'crawler, 5 edited 2 gone':<24}{elapsed:>9.2f}  {pages} {counts}")
+    assert pages["fetched"] == 5 and pages["gone"] == 2, pages
+
+    assert site.state.max_in_flight <= args.per_host, "Per-host concurrency limit was exceeded"
+    print(f"OK: peak concurrent requests to the host was {site.state.max_in_flight} (limit {args.per_host})")
+
+    await close_resources()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures re-indexing a site with the async conditional crawler against a local fixture site")
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.1, help="Response time of the fixture site in seconds")
+    parser.add_argument("--per-host", type=int, default=4)
+    parser.add_argument("--host-delay", type=float, default=0.01)
+    args = parser.parse_args()
+
+    site = create_fake_site_app(pages=args.pages, latency=args.latency)
+    base_url, server = run_server_in_thread(site)
+    urls = [f"{base_url}/page/{i}" for i in range(args.pages)]
+
+    redis_port, redis_process = start_fake_redis()
+    os.environ["REDIS_HOST"] = "127.0.0.1"
+    os.environ["REDIS_PORT"] = str(redis_port)
+    os.environ["QDRANT_COLLECTION"] = "bench_crawl"
+    os.environ["OPEN_ROUTER_KEY"] = "fake-key"
+
+    try:
+        from langchain_community.document_loaders import WebBaseLoader
+
+        start = time.perf_counter()
+        WebBaseLoader(web_path=urls).load()
+        print(f"WebBaseLoader, sequential: {time.perf_counter() - start:.2f}s for {args.pages} pages")
+
+        site.state.max_in_flight = 0
+        asyncio.run(main_async(args, site, urls))
+    finally:
+        server.should_exit = True
+        redis_process.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+####
+# Compares the embedding backends: PyTorch (default), ONNX Runtime and an int8 quantized ONNX export.
+# Every backend is loaded in its own process with the server's embedding settings and reports load time,
+# single query latency (p50/p99), batch throughput and peak RSS.
+# Accuracy check: cosine agreement of every backend with PyTorch on a fixture corpus, and overlap of the
+# top-5 retrieved chunks for the fixture questions. Fails when agreement is below --min-cosine.
+# Needs the model weights and the optional ONNX packages: pip install "optimum[onnxruntime]"
+# Usage: python -m benchmarks.embedding_backends --quantize avx512_vnni
+####
+
+import os
+import sys
+import json
+import argparse
+import resource
+import statistics
+import subprocess
+import tempfile
+import time
+import numpy as np
+
+
+CORPUS = [
+    "To buy SMS credits, log in to the UelloSend dashboard, open Billing and choose a credit bundle.",
+    "Credits can be paid for with mobile money (MTN, Telecel, AirtelTigo) or with a Visa or Mastercard card.",
+    "Credits bought with mobile money are added to your account as soon as the payment is confirmed.",
+    "If a top-up was charged but the credits did not arrive, contact support with the transaction id.",
+    "A sender ID is the name recipients see instead of a phone number, it can be up to 11 characters.",
+    "Sender ID requests are reviewed by the networks and are usually approved within 24 hours.",
+    "Sender IDs that impersonate banks, government agencies or other brands are rejected.",
+    "You can send bulk SMS by uploading a CSV file of contacts or by selecting a contact group.",
+    "Messages longer than 160 characters are split into several parts and each part uses one credit.",
+    "Messages that contain unicode characters such as emojis are limited to 70 characters per part.",
+    "Delivery reports show whether every message was delivered, pending or failed.",
+    "Failed messages are not charged, their credits are returned to your balance.",
+    "Campaigns can be scheduled to be sent at a later date and time from the Campaigns page.",
+    "Contact groups let you organize recipients, a contact can belong to several groups.",
+    "The UelloSend API lets developers send SMS from their own applications with an API key.",
+    "API keys are created on the Developers page and can be revoked at any time.",
+    "The API accepts JSON requests and returns a message id for every message sent.",
+    "Use the balance endpoint of the API to check how many credits are left.",
+    "To reset your password, click Forgot password on the login page and follow the email link.",
+    "Password reset links expire after one hour for security reasons.",
+    "Accounts have to be verified with the code sent to the registered email address.",
+    "If the verification email did not arrive, check the spam folder or request a new code.",
+    "Two factor authentication can be enabled from the Security settings of your account.",
+    "Enterprise customers can request dedicated short codes for two-way messaging.",
+    "Opt-out requests from recipients are handled automatically for promotional messages.",
+    "Promotional messages can only be sent between 8am and 8pm local time.",
+    "Transactional messages such as OTPs can be sent at any time of the day.",
+    "UelloSend support is available by email and live chat from Monday to Saturday.",
+    "Refunds for unused credits are not available, credits do not expire.",
+    "Invoices for every payment can be downloaded from the Billing page.",
+    "Credits can be transferred between sub-accounts of the same organization.",
+    "Sub-accounts let agencies manage several clients with separate balances and sender IDs.",
+]
+
+QUESTIONS = [
+    "how do I buy credits",
+    "pricing of sms bundles?",
+    "my payment went through but no credits",
+    "how long does sender id approval take",
+    "why was my sender id rejected",
+    "how do I send to many people at once",
+    "how many characters can one sms have",
+    "where do I see if my message was delivered",
+    "how do I get an api key",
+    "I forgot my password",
+    "verification code not received",
+    "can I schedule a message",
+]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[max(0, int(len(values) * p) - 1)]
+
+
+def run_backend(args):
+    """
+    Child process: loads one backend with the server's settings and measures it
+    """
+    from src.utils.manage_resources import get_embedding_client
+
+    start = time.perf_counter()
+    embedding = get_embedding_client()
+    embedding.embed_query("warm up")
+    load_seconds = time.perf_counter() - start
+
+    latencies = []
+    for i in range(args.repeat):
+        question = QUESTIONS[i % len(QUESTIONS)]
+        start = time.perf_counter()
+        embedding.embed_query(question)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    corpus_vectors = embedding.embed_documents(CORPUS * 4)[:len(CORPUS)]
+    batch_seconds = time.perf_counter() - start
+
+    np.save(args.output, np.asarray(corpus_vectors + [embedding.embed_query(q) for q in QUESTIONS], dtype=np.float32))
+
+    print(json.dumps({
+        "load_seconds": load_seconds,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "batch_texts_per_second": len(CORPUS) * 4 / batch_seconds,
+        #ru_maxrss is in KB on linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }))
+
+
+def normalize(vectors):
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares the embedding backends: PyTorch (default), ONNX Runtime and an int8 quantized ONNX export")
+    parser.add_argument("--repeat", type=int, default=200, help="Single queries per backend")
+    parser.add_argument("--quantize", default="avx512_vnni", choices=["arm64", "avx2", "avx512", "avx512_vnni", "none"])
+    parser.add_argument("--min-cosine", type=float, default=0.98, help="Lowest acceptable cosine agreement with PyTorch")
+    parser.add_argument("--backend-worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.backend_worker:
+        run_backend(args)
+        return
+
+    from dotenv import load_dotenv
+    load_dotenv()
+    model = os.getenv("HUG_EMBED_MODEL")
+    workdir = tempfile.mkdtemp()
+
+    backends = [("torch", {"HUG_EMBED_BACKEND": "torch"}), ("onnx", {"HUG_EMBED_BACKEND": "onnx", "HUG_EMBED_ONNX_FILE": ""})]
+
+    if args.quantize != "none":
+        from src.utils.manage_onnx import export_onnx_model
+
+        export_dir = os.path.join(workdir, "onnx-model")
+        onnx_file = export_onnx_model(model, export_dir, args.quantize)
+        backends.append((f"onnx int8 ({args.quantize})", {"HUG_EMBED_BACKEND": "onnx", "HUG_EMBED_MODEL": export_dir, "HUG_EMBED_ONNX_FILE": onnx_file}))
+
+    results = {}
+    vectors = {}
+
+    for name, env in backends:
+        output = os.path.join(workdir, f"{len(results)}.npy")
+        child = subprocess.run(
+            [sys.executable, "-m", "benchmarks.embedding_backends", "--backend-worker", "--repeat", str(args.repeat), "--output", output],
+            env={**os.environ, **env}, capture_output=True, text=True, check=True
+        )
+        results[name] = json.loads(child.stdout.strip().splitlines()[-1])
+        vectors[name] = normalize(np.load(output))
+
+    reference = vectors["torch"]
+    reference_top5 = np.argsort(-(reference[len(CORPUS):] @ reference[:len(CORPUS)].T), axis=1)[:, :5]
+
+    print(f"{'backend':<26}{'load':>8}{'p50':>9}{'p99':>9}{'batch/s':>9}{'RSS':>9}{'cos min':>9}{'cos mean':>9}{'top5':>7}")
+
+    failed = []
+    for name, result in results.items():
+        cosines = np.sum(vectors[name] * reference, axis=1)
+        top5 = np.argsort(-(vectors[name][len(CORPUS):] @ vectors[name][:len(CORPUS)].T), axis=1)[:, :5]
+        overlap = np.mean([len(set(a) & set(b)) / 5 for a, b in zip(top5, reference_top5)])
+
+        print(f"{name:<26}{result['load_seconds']:>7.1f}s{result['p50_ms']:>7.1f}ms{result['p99_ms']:>7.1f}ms"
+              f"{result['batch_texts_per_second']:>9.0f}{result['peak_rss_mb']:>7.0f}MB{cosines.min():>9.4f}{cosines.mean():>9.4f}{overlap:>7.0%}")
+
+        if cosines.min() < args.min_cosine:
+            failed.append(name)
+
+    assert not failed, f"Cosine agreement with PyTorch below {args.min_cosine}: {failed}"
+    print(f"OK: every backend agrees with PyTorch above cosine {args.min_cosine}")
+
+
+if __name__ == "__main__":
+    main()
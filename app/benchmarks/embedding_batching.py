@@ -0,0 +1,92 @@
+####
+# Measures query embedding throughput and latency with the micro-batching embedding service.
+# Before: every embed_query runs the model on the event loop thread, concurrent queries wait in line.
+# After: queries are collected for up to EMBED_MAX_WAIT_MS and run as one batch in the thread pool.
+# The fake model sleeps (releasing the GIL like torch does) for a fixed cost plus a per-text cost,
+# so a batch is cheaper than the same texts one by one. Pass --model to use a real sentence-transformer.
+# Usage: python -m benchmarks.embedding_batching --queries 256 --base-ms 12 --per-text-ms 1
+####
+
+import argparse
+import asyncio
+import time
+from langchain_community.embeddings import DeterministicFakeEmbedding
+
+from src.utils.manage_embeddings import EmbeddingService
+
+
+class BatchCostFakeEmbedding(DeterministicFakeEmbedding):
+    """
+    Deterministic fake embedding with the cost profile of a forward pass
+    """
+    base_ms: float = 12
+    per_text_ms: float = 1
+
+    def embed_documents(self, texts):
+        time.sleep((self.base_ms + self.per_text_ms * len(texts)) / 1000)
+        return [self._get_embedding(seed=self._get_seed(text)) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+async def run(embed, queries: int, concurrency: int):
+    """
+    Runs the queries from concurrent clients, returns embeddings/sec and p99 latency in ms
+    """
+    latencies = []
+
+    async def client(client_id):
+        for i in range(client_id, queries, concurrency):
+            start = time.perf_counter()
+            #Yield first so time spent waiting for the event loop counts as latency
+            await asyncio.sleep(0)
+            await embed(f"how do I buy credits, question {i}")
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client(c) for c in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+
+    return queries / elapsed, latencies[max(0, int(len(latencies) * 0.99) - 1)] * 1000
+
+
+async def main_async(args, embedding):
+    service = EmbeddingService(embedding, max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+
+    async def on_event_loop(text):
+        return embedding.embed_query(text)
+
+    print(f"{'concurrency':>12}{'mode':>16}{'embeddings/s':>15}{'p99':>12}")
+
+    for concurrency in (1, 8, 32):
+        for name, embed in (("event loop", on_event_loop), ("micro-batched", service.embed_query)):
+            throughput, p99 = await run(embed, args.queries, concurrency)
+            print(f"{concurrency:>12}{name:>16}{throughput:>15.1f}{p99:>10.1f}ms")
+
+    service.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures query embedding throughput and latency with the micro-batching embedding service")
+    parser.add_argument("--queries", type=int, default=256)
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5)
+    parser.add_argument("--base-ms", type=float, default=12, help="Fixed cost of one fake forward pass")
+    parser.add_argument("--per-text-ms", type=float, default=1, help="Cost of every text in a fake forward pass")
+    parser.add_argument("--model", default=None, help="Sentence-transformer model to use instead of the fake")
+    args = parser.parse_args()
+
+    if args.model:
+        from langchain_huggingface import HuggingFaceEmbeddings
+        embedding = HuggingFaceEmbeddings(model_name=args.model, model_kwargs={"device": "cpu"})
+    else:
+        embedding = BatchCostFakeEmbedding(size=768, base_ms=args.base_ms, per_text_ms=args.per_text_ms)
+
+    asyncio.run(main_async(args, embedding))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+####
+# Measures query embed latency with the embedding cache on a realistic stream of support questions.
+# Questions repeat with a skewed distribution and trivial variations (case, spacing, punctuation).
+# Compares: no cache, in-process LRU only, and a cold worker that is served from the shared redis tier.
+# Uses a fake embedding that burns --embed-ms of CPU per call, pass --model to use a real sentence-transformer.
+# Usage: python -m benchmarks.embedding_cache --queries 2000 --distinct 300 --embed-ms 15
+####
+
+import os
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from langchain_community.embeddings import DeterministicFakeEmbedding
+
+from benchmarks.server_utils import start_fake_redis
+
+
+class CpuBoundFakeEmbedding(DeterministicFakeEmbedding):
+    """
+    Deterministic fake embedding that takes about as long as a real forward pass
+    """
+    embed_ms: float = 15
+
+    def embed_query(self, text: str):
+        deadline = time.perf_counter() + self.embed_ms / 1000
+        while time.perf_counter() < deadline:
+            pass
+
+        return super().embed_query(text)
+
+
+def build_questions(rng: random.Random, queries: int, distinct: int):
+    topics = ["buy credits", "sender id approval", "pricing", "reset password", "delivery report", "api key",
+              "mobile money payment", "bulk sms", "schedule a campaign", "contact groups"]
+    base = [f"how do I {rng.choice(topics)} for account type {i}" for i in range(distinct)]
+    base[:3] = ["Hi", "pricing?", "how do I buy credits"]
+
+    variants = [str.lower, str.upper, str.capitalize, lambda q: f"  {q}  ", lambda q: q + "?", lambda q: q + "!"]
+    picks = rng.choices(base, weights=[1 / (i + 1) for i in range(distinct)], k=queries)
+
+    return [rng.choice(variants)(question) for question in picks]
+
+
+async def measure(questions, embed):
+    latencies = []
+
+    for question in questions:
+        start = time.perf_counter()
+        await embed(question)
+        latencies.append(time.perf_counter() - start)
+
+    latencies.sort()
+
+    return statistics.mean(latencies) * 1000, latencies[int(len(latencies) * 0.99) - 1] * 1000
+
+
+async def main_async(args, embedding):
+    from src.utils.manage_embedding_cache import EmbeddingCache
+    from src.utils.manage_resources import close_resources
+
+    rng = random.Random(11)
+    questions = build_questions(rng, args.queries, args.distinct)
+
+    async def no_cache(question):
+        return embedding.embed_query(question)
+
+    memory = EmbeddingCache(model_name="bench", max_entries=args.cache_size, use_redis=False)
+    shared = EmbeddingCache(model_name="bench", max_entries=args.cache_size, use_redis=True)
+
+    async def embed(text):
+        return embedding.embed_query(text)
+
+    async def shared_tier(question):
+        return await shared.get_or_embed(question, embed)
+
+    #Another worker fills the redis tier, this worker starts with an empty LRU
+    await measure(questions, shared_tier)
+    shared.clear()
+
+    calls = 0
+
+    async def counting_embed(text):
+        nonlocal calls
+        calls += 1
+        return embedding.embed_query(text)
+
+    async def counted_memory(question):
+        return await memory.get_or_embed(question, counting_embed)
+
+    print(f"{'mode':<30}{'mean':>10}{'p99':>10}{'hit rate':>10}")
+
+    mean, p99 = await measure(questions, no_cache)
+    print(f"{'no cache':<30}{mean:>8.2f}ms{p99:>8.2f}ms{'-':>10}")
+
+    mean, p99 = await measure(questions, counted_memory)
+    hit_rate = 1 - calls / len(questions)
+    print(f"{'in-process LRU':<30}{mean:>8.2f}ms{p99:>8.2f}ms{hit_rate:>10.0%}")
+
+    mean, p99 = await measure(questions, shared_tier)
+    print(f"{'cold worker + warm redis tier':<30}{mean:>8.2f}ms{p99:>8.2f}ms{'-':>10}")
+
+    await close_resources()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures query embed latency with the embedding cache on a realistic stream of support questions")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--distinct", type=int, default=300)
+    parser.add_argument("--cache-size", type=int, default=2048)
+    parser.add_argument("--embed-ms", type=float, default=15, help="CPU time of one fake embed call")
+    parser.add_argument("--model", default=None, help="Sentence-transformer model to use instead of the fake")
+    args = parser.parse_args()
+
+    if args.model:
+        from langchain_huggingface import HuggingFaceEmbeddings
+        embedding = HuggingFaceEmbeddings(model_name=args.model, model_kwargs={"device": "cpu"})
+    else:
+        embedding = CpuBoundFakeEmbedding(size=768, embed_ms=args.embed_ms)
+
+    redis_port, redis_process = start_fake_redis()
+    os.environ["REDIS_HOST"] = "127.0.0.1"
+    os.environ["REDIS_PORT"] = str(redis_port)
+
+    try:
+        asyncio.run(main_async(args, embedding))
+    finally:
+        redis_process.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+####
+# Local stand-in for the Gemini generateContent REST API with configurable latency.
+# latency is the time until the first token, every following token takes token_delay seconds.
+# Point the agent at it with GEMINI_TRANSPORT=rest and GEMINI_API_ENDPOINT=<base url>
+# faults injects per model latency tails and errors, see benchmarks.fake_openai
+####
+
+import asyncio
+import json
+import random
+import re
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from benchmarks.fake_openai import pick_fault
+
+
+EMAIL_PATTERN = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+
+
+def _last_part(body: dict) -> dict:
+    """
+    Returns the last part of the last message sent by the client
+    """
+    contents = body.get("contents", [])
+    if not contents or not contents[-1].get("parts"):
+        return {}
+
+    return contents[-1]["parts"][-1]
+
+
+def _text_response(text: str) -> dict:
+    return {
+        "candidates": [
+            {
+                "content": {"role": "model", "parts": [{"text": text}]},
+                "finishReason": "STOP",
+                "index": 0
+            }
+        ]
+    }
+
+
+def _function_call_response(calls: list) -> dict:
+    return {
+        "candidates": [
+            {
+                "content": {"role": "model", "parts": [{"functionCall": call} for call in calls]},
+                "finishReason": "STOP",
+                "index": 0
+            }
+        ]
+    }
+
+
+def decide_reply(body: dict) -> dict:
+    """
+    Scripted model behaviour:
+    - a user message containing an email address triggers verify_customer_exist for it
+    - a tool result is answered with a short summary
+    - anything else gets a greeting
+    """
+    part = _last_part(body)
+    text = part.get("text", "")
+
+    if "functionResponse" in part or text.startswith("Tool called:"):
+        return _text_response("I have checked that for you, anything else I can help with?")
+
+    emails = EMAIL_PATTERN.findall(text)
+    if emails:
+        return _function_call_response([
+            {"name": "verify_customer_exist", "args": {"customer_email": email}} for email in emails
+        ])
+
+    return _text_response("Hello, I am UelloGent. How can I help you today?")
+
+
+def _split_into_chunks(reply: dict) -> list:
+    """
+    Splits a text reply into one chunk per word, function calls are sent as a single chunk
+    """
+    parts = reply["candidates"][0]["content"]["parts"]
+
+    if "text" not in parts[0]:
+        return [reply]
+
+    words = parts[0]["text"].split(" ")
+
+    return [_text_response(word + (" " if i < len(words) - 1 else "")) for i, word in enumerate(words)]
+
+
+def create_fake_gemini_app(latency: float = 0.5, token_delay: float = 0.0, faults: dict = None, seed: int = 25):
+    """
+    Creates an app that answers generateContent and streamGenerateContent calls after sleeping for the given latency
+    """
+    app = FastAPI(title="Fake Gemini Server")
+    app.state.latency = latency
+    app.state.token_delay = token_delay
+    app.state.faults = faults or {}
+    app.state.rng = random.Random(seed)
+    app.state.requests = 0
+    app.state.model_requests = {}
+
+    def _count(model):
+        app.state.requests += 1
+        app.state.model_requests[model] = app.state.model_requests.get(model, 0) + 1
+
+    async def _error(latency, error_status):
+        await asyncio.sleep(latency)
+        return JSONResponse({"error": {"code": error_status, "message": "Injected fault", "status": "INTERNAL"}}, status_code=error_status)
+
+    @app.post("/v1beta/models/{model}:generateContent")
+    async def generate_content(model: str, request: Request):
+        body = await request.json()
+        _count(model)
+
+        latency, error_status = pick_fault(app, model)
+        if error_status:
+            return await _error(latency, error_status)
+
+        reply = decide_reply(body)
+
+        #Without streaming the client waits for the whole generation
+        await asyncio.sleep(latency + app.state.token_delay * (len(_split_into_chunks(reply)) - 1))
+
+        return reply
+
+    @app.post("/v1beta/models/{model}:streamGenerateContent")
+    async def stream_generate_content(model: str, request: Request):
+        body = await request.json()
+        _count(model)
+
+        latency, error_status = pick_fault(app, model)
+        if error_status:
+            return await _error(latency, error_status)
+
+        chunks = _split_into_chunks(decide_reply(body))
+
+        async def stream():
+            #The REST client reads the stream as one JSON array
+            await asyncio.sleep(latency)
+            yield "["
+
+            for i, chunk in enumerate(chunks):
+                if i > 0:
+                    await asyncio.sleep(app.state.token_delay)
+                    yield ","
+                yield json.dumps(chunk)
+
+            yield "]"
+
+        return StreamingResponse(stream(), media_type="application/json")
+
+    return app
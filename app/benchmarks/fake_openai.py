@@ -0,0 +1,109 @@
+####
+# Local stand-in for an OpenAI compatible chat completions API (e.g. OPEN ROUTER) with configurable latency.
+# latency is the time until the first token, every following token takes token_delay seconds.
+# faults injects per model behaviour, e.g. {"model-a": {"latency": 0.1, "tail_rate": 0.1, "tail_latency": 2, "error_rate": 0.5}}:
+# a share of tail_rate requests takes tail_latency instead, a share of error_rate requests fails with error_status.
+####
+
+import asyncio
+import json
+import random
+import time
+import uuid
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+def pick_fault(app, model: str):
+    """
+    Returns the latency and the error status (None for success) of one request to the model
+    """
+    fault = app.state.faults.get(model, {})
+    latency = fault.get("latency", app.state.latency)
+
+    if app.state.rng.random() < fault.get("tail_rate", 0):
+        latency = fault["tail_latency"]
+
+    error_status = fault.get("error_status", 500) if app.state.rng.random() < fault.get("error_rate", 0) else None
+
+    return latency, error_status
+
+
+def create_fake_openai_app(latency: float = 0.5, reply: str = "This is a reply from the fake model.", token_delay: float = 0.0, faults: dict = None, seed: int = 25):
+    """
+    Creates an app that answers every chat completion after sleeping for the given latency.
+    Requests with stream=true are answered as Server-Sent Events, one word per chunk.
+    """
+    app = FastAPI(title="Fake OpenAI Server")
+    app.state.latency = latency
+    app.state.token_delay = token_delay
+    app.state.faults = faults or {}
+    app.state.rng = random.Random(seed)
+    app.state.requests = 0
+    app.state.model_requests = {}
+
+    words = reply.split(" ")
+    tokens = [word + (" " if i < len(words) - 1 else "") for i, word in enumerate(words)]
+
+    def _chunk(completion_id, model, content, finish_reason=None):
+        return {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": finish_reason,
+                    "delta": {"role": "assistant", "content": content}
+                }
+            ]
+        }
+
+    async def _stream(completion_id, model, latency):
+        await asyncio.sleep(latency)
+
+        for i, token in enumerate(tokens):
+            if i > 0:
+                await asyncio.sleep(app.state.token_delay)
+            yield f"data: {json.dumps(_chunk(completion_id, model, token))}\n\n"
+
+        yield f"data: {json.dumps(_chunk(completion_id, model, '', 'stop'))}\n\n"
+        yield "data: [DONE]\n\n"
+
+    @app.post("/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        model = body.get("model")
+        app.state.model_requests[model] = app.state.model_requests.get(model, 0) + 1
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        latency, error_status = pick_fault(app, model)
+
+        if error_status:
+            await asyncio.sleep(latency)
+            return JSONResponse({"error": {"message": "Injected fault", "code": error_status}}, status_code=error_status)
+
+        if body.get("stream"):
+            return StreamingResponse(_stream(completion_id, model, latency), media_type="text/event-stream")
+
+        #Without streaming the client waits for the whole generation
+        await asyncio.sleep(latency + app.state.token_delay * (len(tokens) - 1))
+
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": reply}
+                }
+            ],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        }
+
+    return app
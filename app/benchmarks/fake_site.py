@@ -0,0 +1,59 @@
+####
+# Local fixture website for crawler benchmarks.
+# Serves /page/{i} with configurable latency, ETag and Last-Modified validators, and answers conditional
+# requests with 304. Pages can be edited or removed between crawls through app.state.
+####
+
+import asyncio
+import hashlib
+from email.utils import formatdate
+from fastapi import FastAPI, Request, Response
+
+
+def create_fake_site_app(pages: int = 100, latency: float = 0.1, paragraphs: int = 20):
+    """
+    Creates the fixture site. app.state.versions holds the version of every page (None when removed),
+    app.state.requests / not_modified count requests and app.state.max_in_flight the peak concurrency.
+    """
+    app = FastAPI(title="Fake Help Site")
+    app.state.latency = latency
+    app.state.versions = {i: 1 for i in range(pages)}
+    app.state.requests = 0
+    app.state.not_modified = 0
+    app.state.in_flight = 0
+    app.state.max_in_flight = 0
+
+    def render(page: int, version: int) -> str:
+        body = "\n\n".join(
+            f"<p>Help page {page} (version {version}), paragraph {i}: to buy credits open the dashboard, "
+            f"choose a bundle and pay with mobile money or card. Sender IDs are approved within 24 hours.</p>"
+            for i in range(paragraphs)
+        )
+        return f"<html lang='en'><head><title>Help {page}</title></head><body>{body}</body></html>"
+
+    @app.get("/page/{page}")
+    async def get_page(page: int, request: Request):
+        app.state.requests += 1
+        app.state.in_flight += 1
+        app.state.max_in_flight = max(app.state.max_in_flight, app.state.in_flight)
+
+        try:
+            await asyncio.sleep(app.state.latency)
+
+            version = app.state.versions.get(page)
+            if version is None:
+                return Response(status_code=404)
+
+            etag = '"' + hashlib.sha1(f"{page}:{version}".encode()).hexdigest() + '"'
+            headers = {"ETag": etag, "Last-Modified": formatdate(1700000000 + version, usegmt=True)}
+
+            if request.headers.get("if-none-match") == etag:
+                app.state.not_modified += 1
+                return Response(status_code=304, headers=headers)
+
+            return Response(content=render(page, version), media_type="text/html", headers=headers)
+
+        finally:
+            app.state.in_flight -= 1
+
+    return app
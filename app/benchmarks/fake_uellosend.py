@@ -0,0 +1,61 @@
+####
+# Local stand-in for the UelloSend API endpoints called by the tools, with configurable latency
+####
+
+import asyncio
+from fastapi import FastAPI, Request
+
+
+def create_fake_uellosend_app(latency: float = 0.2, slow_latency: float = 10.0):
+    """
+    Creates an app that serves the customer, transaction, verification and reset endpoints.
+    Emails starting with "missing" are treated as unknown customers, emails starting with "slow"
+    are answered after slow_latency seconds.
+    """
+    app = FastAPI(title="Fake UelloSend API")
+    app.state.latency = latency
+    app.state.slow_latency = slow_latency
+    app.state.requests = {}
+
+    async def _handle(name: str, request: Request) -> dict:
+        body = await request.json()
+        app.state.requests[name] = app.state.requests.get(name, 0) + 1
+
+        slow = str(body.get("email", "")).startswith("slow")
+        await asyncio.sleep(app.state.slow_latency if slow else app.state.latency)
+
+        if str(body.get("email", "")).startswith("missing"):
+            return {"code": 404, "result": "Not Found"}
+
+        if name == "customer":
+            return {"code": 200, "result": 675}
+
+        return {"code": 200, "result": "ok"}
+
+    @app.post("/customer")
+    async def customer(request: Request):
+        return await _handle("customer", request)
+
+    @app.post("/transaction")
+    async def transaction(request: Request):
+        return await _handle("transaction", request)
+
+    @app.post("/verification")
+    async def verification(request: Request):
+        return await _handle("verification", request)
+
+    @app.post("/reset")
+    async def reset(request: Request):
+        return await _handle("reset", request)
+
+    return app
+
+
+def set_tool_urls(base_url: str, environ: dict):
+    """
+    Points the tool endpoint settings at the fake API
+    """
+    environ["CUSTOMER_URL"] = f"{base_url}/customer"
+    environ["TRANSACTION_URL"] = f"{base_url}/transaction"
+    environ["VERIFICATION_URL"] = f"{base_url}/verification"
+    environ["RESET_URL"] = f"{base_url}/reset"
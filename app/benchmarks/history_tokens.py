@@ -0,0 +1,65 @@
+####
+# Reports prompt tokens per QueryAgent turn before and after the token-budgeted history window.
+# Before: every turn resent the whole history, including the full RAG prompt (five context chunks) of each past question.
+# After: system prompt, rolling summary, the last HISTORY_MAX_TURNS turns with bare questions and the current prompt.
+# Usage: python -m benchmarks.history_tokens --turns 30
+####
+
+import argparse
+import random
+
+from src.utils.define_system_prompt import RAG_SYSTEM_PROMPT
+from src.utils.manage_history import HistoryManager, count_message_tokens
+
+
+WORDS = ("uellosend bulk sms credits dashboard sender id approval payment mobile money card account verify "
+         "reset password customer support message delivery report contacts group schedule campaign api key").split()
+
+
+def random_text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def rag_prompt(rng: random.Random, question: str) -> str:
+    """
+    Prompt shaped like QueryAgent.prepare_prompt, five context chunks of about 500 characters
+    """
+    context = "\n".join(f"[{i + 1}] {random_text(rng, 80)} (Source: Help - https://uellosend.com/help)" for i in range(5))
+    return f"Answer the following question based on the provided context information.\n\nContext information:\n{context}\n\nQuestion: {question}\n\nAnswer:"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reports prompt tokens per QueryAgent turn before and after the token-budgeted history window")
+    parser.add_argument("--turns", type=int, default=30)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    manager = HistoryManager()
+
+    legacy_history = [{"role": "system", "content": RAG_SYSTEM_PROMPT}]
+    history, summary = [], ""
+
+    print(f"{'turn':>5}{'before':>10}{'after':>10}")
+
+    for turn in range(1, args.turns + 1):
+        question = random_text(rng, 12) + "?"
+        prompt = rag_prompt(rng, question)
+        answer = random_text(rng, 70)
+
+        #Before: the whole history with every past RAG prompt
+        legacy_history.append({"role": "user", "content": prompt})
+        before = count_message_tokens(legacy_history)
+        legacy_history.append({"role": "assistant", "content": answer})
+
+        #After: the same turn through the history window
+        history.append({"role": "user", "content": question})
+        history, summary = manager.fit(RAG_SYSTEM_PROMPT, history, summary, prompt)
+        after = count_message_tokens(manager.build_messages(RAG_SYSTEM_PROMPT, history, summary, prompt))
+        history.append({"role": "assistant", "content": answer})
+
+        if turn in (1, 2, 5, 10) or turn % 10 == 0 or turn == args.turns:
+            print(f"{turn:>5}{before:>10}{after:>10}")
+
+
+if __name__ == "__main__":
+    main()
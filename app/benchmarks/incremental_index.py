@@ -0,0 +1,105 @@
+####
+# Compares re-indexing the same site with QdrantVectorStore.from_documents (random ids) and the incremental indexer.
+# Runs: initial index, re-scrape with no changes, re-scrape with one page edited and one page gone.
+# Reports embedded chunks, points in the collection and the reported counts, using an in-memory qdrant.
+# Usage: python -m benchmarks.incremental_index --pages 50 --chunks 20
+####
+
+import argparse
+import random
+import time
+from langchain_community.embeddings import DeterministicFakeEmbedding
+from langchain_core.documents import Document
+from langchain_qdrant import QdrantVectorStore
+from qdrant_client import QdrantClient
+from qdrant_client.models import Distance, VectorParams
+
+from src.utils.manage_index import index_documents
+
+
+class CountingEmbedding(DeterministicFakeEmbedding):
+    """
+    Fake embedding that counts how many texts it embedded
+    """
+    embedded: int = 0
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return super().embed_documents(texts)
+
+
+def build_site(rng: random.Random, pages: int, chunks: int):
+    """
+    Returns the chunks of a fake site, shaped like the output of the text splitter
+    """
+    site = {}
+
+    for page in range(pages):
+        url = f"https://uellosend.com/help/{page}"
+        site[url] = [
+            Document(
+                page_content=f"Page {page} chunk {i}: " + " ".join(rng.choice(["credits", "sender", "sms", "api"]) for _ in range(60)),
+                metadata={"source": url, "title": f"Help {page}", "start_index": i * 450}
+            )
+            for i in range(chunks)
+        ]
+
+    return site
+
+
+def flatten(site):
+    return [chunk for chunks in site.values() for chunk in chunks]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares re-indexing the same site with QdrantVectorStore.from_documents (random ids) and the incremental indexer")
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--chunks", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(5)
+    site = build_site(rng, args.pages, args.chunks)
+
+    #Second and third scrape: same site, then one page edited and the last page gone
+    edited = dict(site)
+    first_url, last_url = list(site)[0], list(site)[-1]
+    edited[first_url] = [Document(page_content=chunk.page_content + " edited", metadata=dict(chunk.metadata)) for chunk in site[first_url]]
+    del edited[last_url]
+
+    runs = [("initial", site), ("unchanged", site), ("1 edited, 1 gone", edited)]
+    sources = list(site)
+
+    print(f"{'run':<20}{'mode':<14}{'embedded':>10}{'points':>10}{'seconds':>10}  counts")
+
+    #from_documents appends to an existing collection with new random ids, like the old /scraper
+    legacy_client = QdrantClient(location=":memory:")
+    legacy_client.create_collection("legacy", vectors_config=VectorParams(size=384, distance=Distance.COSINE))
+    legacy_embedding = CountingEmbedding(size=384)
+    legacy_store = QdrantVectorStore(client=legacy_client, collection_name="legacy", embedding=legacy_embedding)
+
+    client = QdrantClient(location=":memory:")
+    embedding = CountingEmbedding(size=384)
+
+    for name, pages in runs:
+        legacy_embedding.embedded = 0
+        start = time.perf_counter()
+        legacy_store.add_documents(flatten(pages))
+        elapsed = time.perf_counter() - start
+        points = legacy_client.count("legacy").count
+        print(f"{name:<20}{'random ids':<14}{legacy_embedding.embedded:>10}{points:>10}{elapsed:>10.2f}")
+
+        embedding.embedded = 0
+        start = time.perf_counter()
+        counts = index_documents(client, embedding, "incremental", flatten(pages), sources)
+        elapsed = time.perf_counter() - start
+        points = client.count("incremental").count
+        print(f"{name:<20}{'incremental':<14}{embedding.embedded:>10}{points:>10}{elapsed:>10.2f}  {counts}")
+
+    total = args.pages * args.chunks
+    assert counts == {"added": 0, "updated": args.chunks, "unchanged": total - 2 * args.chunks, "removed": args.chunks}, counts
+    assert client.count("incremental").count == total - args.chunks
+    print("OK: unchanged chunks are not embedded again and no duplicates are stored")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+####
+# End-to-end load test of the chat endpoints with local stand-ins for every dependency:
+# fake OpenAI compatible and Gemini servers with configurable latency, a fake UelloSend API, a fakeredis
+# server, and the real app running in benchmarks.stub_server with a fake embedding model and in-memory qdrant.
+# Concurrent clients run multi-turn conversations against /agent/query/chat and /agent/support/chat and the
+# test reports p50/p95/p99 latency, throughput and the RSS of the server process.
+# Results are stored as JSON, pass --baseline with an earlier result to fail on a regression.
+# Usage: python -m benchmarks.load_test --clients 16 --duration 30 --baseline benchmarks/results/baseline.json
+####
+
+import os
+import sys
+import json
+import argparse
+import asyncio
+import resource
+import statistics
+import subprocess
+import tempfile
+import time
+import uuid
+from datetime import datetime
+import httpx
+
+from benchmarks.server_utils import run_server_in_thread, get_free_port, start_fake_redis
+from benchmarks.fake_openai import create_fake_openai_app
+from benchmarks.fake_gemini import create_fake_gemini_app
+from benchmarks.fake_uellosend import create_fake_uellosend_app, set_tool_urls
+from benchmarks.embedding_backends import percentile
+from benchmarks.support_worker_scaling import CONVERSATION as SUPPORT_CONVERSATION
+
+
+QUERY_CONVERSATION = [
+    "How do I buy SMS credits?",
+    "Can I pay with mobile money?",
+    "How long does sender ID approval take?",
+]
+
+ENDPOINTS = {
+    "query": ("/agent/query/chat", QUERY_CONVERSATION),
+    "support": ("/agent/support/chat", SUPPORT_CONVERSATION),
+}
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def start_stub_server(env: dict, embed_ms: float):
+    """
+    Starts the app with the stand-in resources and waits until it answers
+    """
+    port = get_free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.stub_server", "--port", str(port), "--embed-ms", str(embed_ms)],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 120
+
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"{base_url}/", timeout=1).status_code == 200:
+                return base_url, process
+        except httpx.HTTPError:
+            pass
+
+        if process.poll() is not None:
+            raise RuntimeError("Server exited during startup")
+        time.sleep(0.5)
+
+    process.terminate()
+    raise RuntimeError("Server did not start")
+
+
+async def drive_load(base_url: str, path: str, conversation: list, clients: int, duration: float) -> dict:
+    """
+    Runs conversations from concurrent clients for the given duration, every turn is timed
+    """
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def client(http):
+        nonlocal errors
+
+        while time.perf_counter() < deadline:
+            session_id = str(uuid.uuid4())
+
+            for query in conversation:
+                start = time.perf_counter()
+                try:
+                    response = await http.post(f"{base_url}{path}", json={"query": query, "session_id": session_id})
+                    ok = response.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+
+                if ok:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as http:
+        start = time.perf_counter()
+        await asyncio.gather(*[client(http) for _ in range(clients)])
+        elapsed = time.perf_counter() - start
+
+    if not latencies:
+        return {"turns": 0, "errors": errors, "throughput": 0.0}
+
+    return {
+        "turns": len(latencies),
+        "errors": errors,
+        "throughput": len(latencies) / elapsed,
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def server_stats(base_url: str) -> dict:
+    return httpx.get(f"{base_url}/_bench/stats", timeout=5).json()
+
+
+def compare(results: dict, baseline: dict, max_regression: float) -> list:
+    """
+    Prints the change of every endpoint against the baseline and returns the regressions
+    """
+    regressions = []
+
+    for name, result in results["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(name)
+        if not before or not result["turns"]:
+            continue
+
+        for metric, higher_is_better in (("throughput", True), ("p95_ms", False), ("p99_ms", False)):
+            change = (result[metric] - before[metric]) / before[metric] if before.get(metric) else 0.0
+            print(f"{name:>8} {metric:<11}{before[metric]:>10.1f} -> {result[metric]:>10.1f} ({change:+.0%})")
+
+            if (-change if higher_is_better else change) > max_regression:
+                regressions.append(f"{name} {metric} {change:+.0%}")
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end load test of the chat endpoints with local stand-ins for every dependency")
+    parser.add_argument("--endpoints", nargs="+", choices=list(ENDPOINTS), default=list(ENDPOINTS))
+    parser.add_argument("--clients", type=int, default=16, help="Concurrent conversations")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of load per endpoint")
+    parser.add_argument("--model-latency", type=float, default=0.05, help="Latency of the fake LLMs in seconds")
+    parser.add_argument("--tool-latency", type=float, default=0.02, help="Latency of the fake UelloSend API in seconds")
+    parser.add_argument("--embed-ms", type=float, default=12, help="Fixed cost of one fake embedding forward pass")
+    parser.add_argument("--cold", action="store_true", help="Turn the answer and embedding caches off")
+    parser.add_argument("--output", default=None, help="Result file, by default benchmarks/results/load_test-<time>.json")
+    parser.add_argument("--baseline", default=None, help="Earlier result file to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed relative loss of throughput or p95/p99")
+    args = parser.parse_args()
+
+    openai_url, _ = run_server_in_thread(create_fake_openai_app(latency=args.model_latency))
+    gemini_url, _ = run_server_in_thread(create_fake_gemini_app(latency=args.model_latency))
+    api_url, _ = run_server_in_thread(create_fake_uellosend_app(latency=args.tool_latency))
+    redis_port, redis_process = start_fake_redis()
+
+    workdir = tempfile.mkdtemp()
+    env = dict(os.environ)
+    env.update({
+        "SUPPORT_SESSION_BACKEND": "redis",
+        "RATE_LIMIT_ENABLED": "false",
+        "REDIS_HOST": "127.0.0.1",
+        "REDIS_PORT": str(redis_port),
+        "OPEN_ROUTER_URL": openai_url,
+        "OPEN_ROUTER_KEY": "fake-key",
+        "GEMINI_API_ENDPOINT": gemini_url,
+        "GEMINI_TRANSPORT": "rest",
+        "GEMINI_API_KEY": "fake-key",
+        "QDRANT_COLLECTION": "bench_load",
+        "UELLOSEND_AGENT_DB": os.path.join(workdir, "uellosend_agent"),
+        "QUERY_AGENT_DB": os.path.join(workdir, "query_agent"),
+    })
+    set_tool_urls(api_url, env)
+
+    if args.cold:
+        env.update({"ANSWER_CACHE_ENABLED": "false", "EMBED_CACHE_SIZE": "0", "EMBED_CACHE_REDIS": "false"})
+
+    base_url, process = start_stub_server(env, args.embed_ms)
+
+    results = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "endpoints": {},
+    }
+
+    try:
+        results["server"] = {"rss_mb_start": server_stats(base_url)["rss_mb"]}
+
+        for name in args.endpoints:
+            path, conversation = ENDPOINTS[name]
+            result = asyncio.run(drive_load(base_url, path, conversation, args.clients, args.duration))
+            results["endpoints"][name] = result
+
+            if result["turns"]:
+                print(f"{path:<22}{result['throughput']:>8.1f} turns/s  p50 {result['p50_ms']:.1f}ms  "
+                      f"p95 {result['p95_ms']:.1f}ms  p99 {result['p99_ms']:.1f}ms  ({result['turns']} turns, {result['errors']} errors)")
+            else:
+                print(f"{path:<22} no successful turns ({result['errors']} errors)")
+
+        stats = server_stats(base_url)
+        results["server"].update({"rss_mb_end": stats["rss_mb"], "peak_rss_mb": stats["peak_rss_mb"]})
+
+    finally:
+        process.terminate()
+        process.wait()
+        redis_process.terminate()
+
+    #ru_maxrss is in KB on linux
+    results["driver_peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    server = results["server"]
+    print(f"server RSS {server['rss_mb_start'] or 0:.0f}MB -> {server['rss_mb_end'] or 0:.0f}MB, peak {server['peak_rss_mb']:.0f}MB")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"load_test-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {output}")
+
+    errors = sum(result["errors"] for result in results["endpoints"].values())
+    assert not errors, f"{errors} requests failed"
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+        regressions = compare(results, baseline, args.max_regression)
+        assert not regressions, f"Regressions over {args.max_regression:.0%}: {regressions}"
+        print(f"OK: no regression over {args.max_regression:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+####
+# Compares the old connect-insert-commit-close message logging with the background group-commit writer.
+# Simulates concurrent requests that each log a few messages, and reports inserts/sec and p99 request-path latency.
+# Usage: python -m benchmarks.message_log_writes --requests 500 --messages-per-request 4
+####
+
+import os
+import argparse
+import asyncio
+import sqlite3
+import tempfile
+import time
+
+
+async def legacy_insert(db_name, message_session_id, message_role, message_text):
+    """
+    The message insert as it was before the background writer: one connection and one commit per row
+    """
+    conn = sqlite3.connect(f"{db_name}.db")
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO messages(message_session_id, message_role, message_text) VALUES(?, ?, ?)",
+                (message_session_id, message_role, message_text))
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def count_rows(db_name):
+    conn = sqlite3.connect(f"{db_name}.db")
+    count = conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+    conn.close()
+    return count
+
+
+async def run_requests(insert, requests: int, messages_per_request: int):
+    """
+    Runs all requests concurrently, each one logging its messages in order like run_agent does.
+    Returns the latency of every request
+    """
+    latencies = []
+
+    async def one_request(i):
+        start = time.perf_counter()
+        for m in range(messages_per_request):
+            await insert(f"session-{i}", "user" if m % 2 == 0 else "model", f"Message {m} of request {i} " * 10)
+        latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*[one_request(i) for i in range(requests)])
+
+    return latencies
+
+
+async def benchmark(name, db_name, insert, finish, requests, messages_per_request):
+    start = time.perf_counter()
+    latencies = await run_requests(insert, requests, messages_per_request)
+    await finish()
+    elapsed = time.perf_counter() - start
+
+    rows = count_rows(db_name)
+    assert rows == requests * messages_per_request, f"{name}: expected {requests * messages_per_request} rows, found {rows}"
+
+    print(f"{name:<14} {rows / elapsed:>12.0f} inserts/sec   p99 request latency {percentile(latencies, 99) * 1000:>9.3f} ms")
+
+
+async def main_async(requests, messages_per_request):
+    from src.utils import manage_db
+
+    workdir = tempfile.mkdtemp()
+
+    #Before: direct inserts on the event loop
+    os.environ["QUERY_AGENT_DB"] = os.path.join(workdir, "legacy")
+    await manage_db.create_QueryAgent_messages_table()
+    legacy_db = os.environ["QUERY_AGENT_DB"]
+
+    async def legacy(*row):
+        await legacy_insert(legacy_db, *row)
+
+    async def nothing():
+        return None
+
+    await benchmark("before", legacy_db, legacy, nothing, requests, messages_per_request)
+
+    #After: enqueue on the request path, the background writer commits in batches
+    os.environ["QUERY_AGENT_DB"] = os.path.join(workdir, "group_commit")
+    await manage_db.create_QueryAgent_messages_table()
+
+    await benchmark("group commit", os.environ["QUERY_AGENT_DB"], manage_db.insert_QueryAgent_messages,
+                    manage_db.stop_message_writers, requests, messages_per_request)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares the old connect-insert-commit-close message logging with the background group-commit writer")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--messages-per-request", type=int, default=4)
+    args = parser.parse_args()
+
+    asyncio.run(main_async(args.requests, args.messages_per_request))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+####
+# Measures the latency of a support turn in which Gemini asks for several tools at once.
+# Before: the function calls ran one at a time and every result was sent to the model separately,
+# a turn took one model call plus (tool + model call) per function call.
+# After: the calls run concurrently and all results go back in one message, a turn takes about
+# two model calls plus the slowest tool.
+# Also checks that a tool that hangs is cut off once its retries have run into CUSTOMER_TIMEOUT, before the server answers.
+# Usage: python -m benchmarks.parallel_tool_calls --model-latency 0.3 --tool-latency 0.2
+####
+
+import os
+import argparse
+import asyncio
+import tempfile
+import time
+
+from benchmarks.server_utils import run_server_in_thread
+from benchmarks.fake_gemini import create_fake_gemini_app
+from benchmarks.fake_uellosend import create_fake_uellosend_app, set_tool_urls
+
+
+async def legacy_run_agent(agent, user_prompt: str, session_id: str) -> str:
+    """
+    The turn before concurrent function calls: one tool and one model round trip per function call
+    """
+    responses = await agent.send_message(user_prompt)
+
+    for part in responses.candidates[0].content.parts:
+        if part.function_call.name:
+            func_name = part.function_call.name
+
+            try:
+                result = await agent.available_tools[func_name]["function"](**part.function_call.args)
+                rs = f"Tool called: {func_name} and result is: {result}"
+            except Exception as e:
+                rs = f"Tool called: {func_name} and result is: Error - {str(e)}"
+
+            responses = await agent.send_message({"parts": rs})
+
+    return responses.text
+
+
+def prompt_with_emails(count: int, prefix: str = "customer") -> str:
+    return "Please check these accounts: " + ", ".join(f"{prefix}{i}@example.com" for i in range(count))
+
+
+async def run_benchmark(args):
+    #Imported here so the environment is set before the agent and tools read it
+    from src.utils.manage_resources import close_resources
+    from src.utils.manage_db import create_UelloSendAgent_messages_table, stop_message_writers
+    from src.agents.gemini_agent import UelloSendAgent
+
+    await create_UelloSendAgent_messages_table()
+
+    print(f"{'function calls':>15}{'sequential':>12}{'concurrent':>12}{'expected':>10}")
+    results = {}
+
+    for calls in args.calls:
+        prompt = prompt_with_emails(calls)
+
+        start = time.perf_counter()
+        await legacy_run_agent(UelloSendAgent(), prompt, "bench-legacy")
+        sequential = time.perf_counter() - start
+
+        agent = UelloSendAgent()
+        start = time.perf_counter()
+        reply = await agent.run_agent(prompt, "bench-concurrent")
+        concurrent = time.perf_counter() - start
+
+        #The results of every call go back in one function response message
+        tool_message = agent.conversation.history[-2]
+        assert reply and len([part for part in tool_message.parts if part.function_response.name]) == calls
+
+        expected = 2 * args.model_latency + args.tool_latency
+        results[calls] = concurrent
+        print(f"{calls:>15}{sequential:>11.2f}s{concurrent:>11.2f}s{expected:>9.2f}s")
+
+    #A tool that hangs fails once its retries time out, the other results still reach the model
+    agent = UelloSendAgent()
+    start = time.perf_counter()
+    reply = await agent.run_agent(f"{prompt_with_emails(2)}, slow0@example.com", "bench-timeout")
+    with_timeout = time.perf_counter() - start
+
+    tool_message = agent.conversation.history[-2]
+    errors = [part.function_response.response.get("error") for part in tool_message.parts]
+    print(f"\nTurn with a hanging tool (timeout {args.tool_timeout}s): {with_timeout:.2f}s, errors: {[e for e in errors if e]}")
+
+    await stop_message_writers()
+    await close_resources()
+
+    #The fake API is local, so only the read timeouts and backoff of each attempt count
+    from src.tools.http_client import request_budget
+    tool_budget = request_budget(args.tool_timeout, idempotent=True, connect_timeout=0)
+
+    limit = 2 * args.model_latency + args.tool_latency * 1.5 + 0.2
+    assert all(elapsed < limit for elapsed in results.values()), "Function calls of one response did not run concurrently"
+    assert with_timeout < 2 * args.model_latency + tool_budget + 0.5 and any(errors), "The hanging tool was not cut off"
+    print("OK: a multi-tool turn takes about the slowest tool plus one extra model call")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures the latency of a support turn in which Gemini asks for several tools at once")
+    parser.add_argument("--calls", type=int, nargs="+", default=[1, 3, 5], help="Function calls per model response")
+    parser.add_argument("--model-latency", type=float, default=0.3, help="Latency of the fake Gemini model in seconds")
+    parser.add_argument("--tool-latency", type=float, default=0.2, help="Latency of the fake UelloSend API in seconds")
+    parser.add_argument("--tool-timeout", type=float, default=1.0, help="CUSTOMER_TIMEOUT used for the run")
+    args = parser.parse_args()
+
+    gemini_url, gemini_server = run_server_in_thread(create_fake_gemini_app(latency=args.model_latency))
+    api_url, api_server = run_server_in_thread(create_fake_uellosend_app(latency=args.tool_latency, slow_latency=args.tool_timeout * 5))
+
+    os.environ["GEMINI_API_ENDPOINT"] = gemini_url
+    os.environ["GEMINI_TRANSPORT"] = "rest"
+    os.environ["GEMINI_API_KEY"] = "fake-key"
+    os.environ["CUSTOMER_TIMEOUT"] = str(args.tool_timeout)
+    os.environ["UELLOSEND_AGENT_DB"] = os.path.join(tempfile.mkdtemp(), "uellosend_agent")
+    set_tool_urls(api_url, os.environ)
+
+    asyncio.run(run_benchmark(args))
+
+    gemini_server.should_exit = True
+    api_server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
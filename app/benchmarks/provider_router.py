@@ -0,0 +1,295 @@
+####
+# Checks the LLM provider router against fake providers that inject latency tails and errors.
+# - hedging: the primary model answers slowly on a few requests, compares p50/p99 of QueryAgent turns with
+#   hedging off and on, and the extra requests hedging costs
+# - failover: the primary model fails every request, turns still succeed on the secondary and the circuit
+#   breaker keeps the primary from being called on every turn, it gets traffic again once it recovers
+# - cancelled trial: the half open trial request of the primary is cancelled (client disconnect), the next
+#   request still gets to try the primary and closes the breaker
+# - support agent: UelloSendAgent turns with tool calls fail over and hedge between Gemini models,
+#   the chat history holds exactly one copy of every message
+# Usage: python -m benchmarks.provider_router --turns 300 --tail-rate 0.04 --tail-latency 2
+####
+
+import os
+import argparse
+import asyncio
+import tempfile
+import time
+from langchain_community.embeddings import DeterministicFakeEmbedding
+from qdrant_client import QdrantClient
+
+from benchmarks.server_utils import run_server_in_thread
+from benchmarks.fake_openai import create_fake_openai_app
+from benchmarks.fake_gemini import create_fake_gemini_app
+from benchmarks.fake_uellosend import create_fake_uellosend_app, set_tool_urls
+from benchmarks.embedding_backends import percentile
+
+
+PRIMARY, SECONDARY = "primary-model", "secondary-model"
+WARMUP_TURNS = 30
+
+
+async def query_turns(turns: int, concurrency: int, offset: int = 0) -> list:
+    """
+    Runs QueryAgent turns with distinct questions and returns their latencies
+    """
+    from src.agents.rag_agent import QueryAgent
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def turn(i):
+        async with semaphore:
+            start = time.perf_counter()
+            await QueryAgent([]).generate_response(f"Question number {offset + i}", f"bench-{offset + i}")
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*[turn(i) for i in range(turns)])
+
+    return latencies
+
+
+async def hedging_scenario(args, openai_app) -> dict:
+    from src.utils.manage_resources import register_resource
+    from src.utils.manage_providers import ProviderRouter
+
+    faults = {
+        PRIMARY: {"latency": args.latency, "tail_rate": args.tail_rate, "tail_latency": args.tail_latency},
+        SECONDARY: {"latency": args.latency * 1.5},
+    }
+
+    print(f"Hedging: {args.turns} turns, primary {args.latency}s with {args.tail_rate:.0%} of requests at {args.tail_latency}s")
+    print(f"{'hedging':<10}{'p50':>9}{'p99':>9}{'max':>9}{'LLM requests':>15}{'hedges':>8}")
+
+    results = {}
+    for hedge in (False, True):
+        router = ProviderRouter("open_router", [PRIMARY, SECONDARY], hedge=hedge, hedge_min_delay=args.hedge_min_delay)
+        register_resource("chat_router", router)
+
+        #Healthy turns fill the rolling stats the hedge delay is based on
+        openai_app.state.faults = {}
+        await query_turns(WARMUP_TURNS, args.concurrency, offset=100000 * hedge)
+        openai_app.state.faults = faults
+        openai_app.state.requests = 0
+
+        latencies = await query_turns(args.turns, args.concurrency, offset=100000 * hedge + WARMUP_TURNS)
+        hedges = openai_app.state.requests - args.turns
+
+        results[hedge] = {"p50": percentile(latencies, 0.5), "p99": percentile(latencies, 0.99), "max": max(latencies), "requests": openai_app.state.requests}
+        print(f"{'on' if hedge else 'off':<10}{results[hedge]['p50']:>8.3f}s{results[hedge]['p99']:>8.3f}s{results[hedge]['max']:>8.3f}s"
+              f"{openai_app.state.requests:>15}{hedges:>8}")
+
+    return results
+
+
+async def failover_scenario(args, openai_app) -> dict:
+    from src.utils.manage_resources import register_resource
+    from src.utils.manage_providers import ProviderRouter
+
+    openai_app.state.faults = {
+        PRIMARY: {"latency": 0.05, "error_rate": 1.0},
+        SECONDARY: {"latency": args.latency},
+    }
+
+    router = ProviderRouter("open_router", [PRIMARY, SECONDARY], hedge=False, failure_threshold=args.breaker_failures, cooldown=args.breaker_cooldown)
+    register_resource("chat_router", router)
+    openai_app.state.model_requests.clear()
+
+    failed = 0
+    start = time.perf_counter()
+    for i in range(args.failover_turns):
+        try:
+            await query_turns(1, 1, offset=200000 + i)
+        except Exception:
+            failed += 1
+    elapsed = time.perf_counter() - start
+
+    primary_requests = openai_app.state.model_requests.get(PRIMARY, 0)
+    print(f"\nFailover: primary fails every request, {args.failover_turns} turns in {elapsed:.2f}s, breaker after {args.breaker_failures} failures for {args.breaker_cooldown}s")
+    print(f"failed turns: {failed}, primary requests: {primary_requests}, secondary requests: {openai_app.state.model_requests.get(SECONDARY, 0)}")
+
+    #Once the primary recovers, the trial request after the cooldown closes the breaker
+    openai_app.state.faults[PRIMARY]["error_rate"] = 0.0
+    await asyncio.sleep(args.breaker_cooldown)
+    openai_app.state.model_requests.clear()
+
+    for i in range(5):
+        await query_turns(1, 1, offset=300000 + i)
+
+    recovered = openai_app.state.model_requests.get(PRIMARY, 0)
+    print(f"after recovery: {recovered} of 5 turns answered by the primary, circuit open: {router.endpoints[0].is_open}")
+
+    return {"failed": failed, "primary_requests": primary_requests, "elapsed": elapsed, "recovered": recovered}
+
+
+async def cancelled_trial_scenario(args, openai_app) -> dict:
+    """
+    The half open trial of the primary hangs and its client goes away, the next request must get to try the primary again
+    """
+    from src.utils.manage_resources import register_resource
+    from src.utils.manage_providers import ProviderRouter
+
+    router = ProviderRouter("open_router", [PRIMARY, SECONDARY], hedge=False, failure_threshold=args.breaker_failures, cooldown=args.breaker_cooldown)
+    register_resource("chat_router", router)
+    primary = router.endpoints[0]
+
+    openai_app.state.faults = {PRIMARY: {"latency": 0.05, "error_rate": 1.0}}
+    for i in range(args.breaker_failures):
+        await query_turns(1, 1, offset=400000 + i)
+
+    await asyncio.sleep(args.breaker_cooldown)
+
+    #Looking at the candidates must not use up the trial
+    orders = [[endpoint.name for endpoint in router.candidates()] for _ in range(3)]
+
+    #The trial hangs and the client disconnects before it answers
+    openai_app.state.faults = {PRIMARY: {"latency": args.tail_latency * 5}}
+    turn = asyncio.create_task(query_turns(1, 1, offset=400100))
+    await asyncio.sleep(0.5)
+    trial_started = primary.trial_running
+    turn.cancel()
+    await asyncio.gather(turn, return_exceptions=True)
+
+    #The primary has recovered, the next request is the new trial and closes the breaker
+    openai_app.state.faults = {}
+    openai_app.state.model_requests.clear()
+    await query_turns(1, 1, offset=400200)
+
+    result = {
+        "orders": orders,
+        "trial_started": trial_started,
+        "closed": not primary.is_open,
+        "primary_requests": openai_app.state.model_requests.get(PRIMARY, 0),
+    }
+
+    print(f"\nCancelled trial: candidates while half open {orders[0]}, trial started: {trial_started}, "
+          f"next request sent to the primary: {result['primary_requests'] == 1}, circuit open afterwards: {primary.is_open}")
+
+    return result
+
+
+async def support_scenario(args, gemini_app) -> dict:
+    from src.utils.manage_resources import register_resource
+    from src.utils.manage_providers import ProviderRouter
+    from src.agents.gemini_agent import UelloSendAgent
+
+    prompt = "Please check these accounts: customer0@example.com, customer1@example.com"
+    results = {}
+
+    print(f"\nSupport agent: turns with two tool calls, {args.support_turns} per run, every second failover turn streamed")
+    print(f"{'run':<34}{'mean':>9}{'history ok':>12}{'primary':>9}{'secondary':>11}")
+
+    runs = (
+        ("failover, primary down", {PRIMARY: {"latency": 0.05, "error_rate": 1.0}}, False),
+        ("hedging, slow primary", {PRIMARY: {"latency": args.latency, "tail_rate": 0.5, "tail_latency": args.tail_latency}, SECONDARY: {"latency": args.latency}}, True),
+    )
+
+    for name, faults, hedge in runs:
+        router = ProviderRouter("gemini", [PRIMARY, SECONDARY], hedge=hedge, hedge_min_delay=args.hedge_min_delay, hedge_min_samples=2)
+        register_resource("gemini_router", router)
+
+        if hedge:
+            #A healthy turn fills the rolling stats the hedge delay is based on
+            gemini_app.state.faults = {}
+            await UelloSendAgent().run_agent(prompt, "bench-support-warmup")
+
+        gemini_app.state.faults = faults
+        gemini_app.state.model_requests.clear()
+
+        history_ok = True
+        elapsed = []
+
+        for i in range(args.support_turns):
+            agent = UelloSendAgent()
+            start = time.perf_counter()
+
+            if i % 2 and not hedge:
+                reply = "".join([token async for token in agent.run_agent_stream(prompt, f"bench-support-{i}")])
+            else:
+                reply = await agent.run_agent(prompt, f"bench-support-{i}")
+
+            elapsed.append(time.perf_counter() - start)
+
+            #user prompt, function calls, function responses, answer
+            roles = [content.role for content in agent.conversation.history]
+            history_ok = history_ok and bool(reply) and roles == ["user", "model", "user", "model"]
+
+        results[name] = history_ok
+        print(f"{name:<34}{sum(elapsed) / len(elapsed):>8.3f}s{str(history_ok):>12}"
+              f"{gemini_app.state.model_requests.get(PRIMARY, 0):>9}{gemini_app.state.model_requests.get(SECONDARY, 0):>11}")
+
+    return results
+
+
+async def run_benchmark(args, openai_app, gemini_app):
+    #Imported here so the environment is set before the clients are created
+    from src.utils.manage_resources import register_resource, close_resources
+    from src.utils.manage_db import create_QueryAgent_messages_table, create_UelloSendAgent_messages_table, stop_message_writers
+
+    register_resource("embedding_client", DeterministicFakeEmbedding(size=768))
+    register_resource("qdrant_client", QdrantClient(location=":memory:"))
+    await create_QueryAgent_messages_table()
+    await create_UelloSendAgent_messages_table()
+
+    hedging = await hedging_scenario(args, openai_app)
+    failover = await failover_scenario(args, openai_app)
+    cancelled_trial = await cancelled_trial_scenario(args, openai_app)
+    support = await support_scenario(args, gemini_app)
+
+    await stop_message_writers()
+    await close_resources()
+
+    assert hedging[True]["p99"] < hedging[False]["p99"] / 2, "Hedging did not cut the tail latency"
+    assert hedging[True]["requests"] < args.turns * (1 + args.tail_rate * 3), "Hedging sent too many extra requests"
+    assert failover["failed"] == 0, "Turns failed although the secondary model was healthy"
+    assert failover["primary_requests"] < args.failover_turns / 2, "The circuit breaker did not stop calls to the failing model"
+    assert failover["recovered"] == 5, "The primary model did not get its traffic back after recovering"
+    assert all(order == [PRIMARY, SECONDARY] for order in cancelled_trial["orders"]), "Listing the candidates used up the half open trial"
+    assert cancelled_trial["trial_started"] and cancelled_trial["closed"] and cancelled_trial["primary_requests"] == 1, "A cancelled half open trial kept the primary demoted"
+    assert all(support.values()), "A failed or hedged attempt left traces in the support chat history"
+    print("OK: hedging cuts the tail, failover keeps turns answered and the breaker sheds the failing model")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Checks the LLM provider router against fake providers that inject latency tails and errors")
+    parser.add_argument("--turns", type=int, default=300, help="QueryAgent turns of each hedging run")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.1, help="Usual latency of the fake models in seconds")
+    parser.add_argument("--tail-rate", type=float, default=0.04, help="Share of slow primary requests")
+    parser.add_argument("--tail-latency", type=float, default=2.0, help="Latency of a slow primary request in seconds")
+    parser.add_argument("--hedge-min-delay", type=float, default=0.2, help="LLM_HEDGE_MIN_DELAY used for the run")
+    parser.add_argument("--failover-turns", type=int, default=50)
+    parser.add_argument("--breaker-failures", type=int, default=3)
+    parser.add_argument("--breaker-cooldown", type=float, default=1.0)
+    parser.add_argument("--support-turns", type=int, default=6)
+    args = parser.parse_args()
+
+    openai_app = create_fake_openai_app(latency=args.latency)
+    gemini_app = create_fake_gemini_app(latency=args.latency)
+    openai_url, openai_server = run_server_in_thread(openai_app)
+    gemini_url, gemini_server = run_server_in_thread(gemini_app)
+    api_url, api_server = run_server_in_thread(create_fake_uellosend_app(latency=0.05))
+
+    os.environ["OPEN_ROUTER_URL"] = openai_url
+    os.environ["OPEN_ROUTER_KEY"] = "fake-key"
+    #Every failed request goes to the router instead of being retried by the client
+    os.environ["LLM_MAX_RETRIES"] = "0"
+    os.environ["LLM_MAX_CONCURRENCY"] = str(args.concurrency * 2)
+    os.environ["GEMINI_API_ENDPOINT"] = gemini_url
+    os.environ["GEMINI_TRANSPORT"] = "rest"
+    os.environ["GEMINI_API_KEY"] = "fake-key"
+    os.environ["GEMINI_MODELS"] = f"{PRIMARY},{SECONDARY}"
+    os.environ["QUERY_AGENT_DB"] = os.path.join(tempfile.mkdtemp(), "query_agent")
+    os.environ["UELLOSEND_AGENT_DB"] = os.path.join(tempfile.mkdtemp(), "uellosend_agent")
+    set_tool_urls(api_url, os.environ)
+
+    asyncio.run(run_benchmark(args, openai_app, gemini_app))
+
+    openai_server.should_exit = True
+    gemini_server.should_exit = True
+    api_server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
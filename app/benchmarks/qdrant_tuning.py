@@ -0,0 +1,124 @@
+####
+# Compares recall@5 and search latency of qdrant collection configurations on a synthetic corpus.
+# Configurations: default HNSW, denser HNSW, int8 scalar quantization with and without rescoring, on-disk vectors,
+# each over HTTP and gRPC. Recall is measured against an exact numpy search of the same corpus.
+# Needs a qdrant server (QDRANT_HOST or --qdrant-url), the in-memory fallback searches exactly so every recall is 1.
+# Usage: python -m benchmarks.qdrant_tuning --points 20000 --queries 200
+####
+
+import os
+import argparse
+import time
+import statistics
+import numpy as np
+from dotenv import load_dotenv
+from qdrant_client import QdrantClient
+from qdrant_client.models import PointStruct
+
+from src.utils.manage_index import provision_collection, search_params
+
+
+CONFIGS = [
+    #name, m, ef_construct, quantization, on_disk, rescore
+    ("default (m16, ef100)", 16, 100, "none", False, True),
+    ("dense (m32, ef200)", 32, 200, "none", False, True),
+    ("int8, no rescore", 16, 100, "scalar", False, False),
+    ("int8 + rescore", 16, 100, "scalar", False, True),
+    ("on-disk vectors", 16, 100, "none", True, True),
+]
+
+
+def build_corpus(rng: np.random.Generator, points: int, queries: int, dim: int):
+    """
+    Clustered unit vectors, like chunks of a few hundred help pages, and queries near random chunks
+    """
+    centers = rng.normal(size=(max(1, points // 50), dim))
+    corpus = centers[rng.integers(0, len(centers), points)] + 0.35 * rng.normal(size=(points, dim))
+    corpus /= np.linalg.norm(corpus, axis=1, keepdims=True)
+
+    query_vectors = corpus[rng.integers(0, points, queries)] + 0.2 * rng.normal(size=(queries, dim))
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+
+    return corpus.astype(np.float32), query_vectors.astype(np.float32)
+
+
+def wait_for_index(client: QdrantClient, collection: str, timeout: float = 600):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        #Green once the optimizers finished building the index
+        if client.get_collection(collection).status.value == "green":
+            return
+        time.sleep(0.5)
+
+
+def run_config(client, collection, corpus, query_vectors, truth, config, hnsw_ef):
+    name, m, ef_construct, quantization, on_disk, rescore = config
+
+    if client.collection_exists(collection):
+        client.delete_collection(collection)
+
+    provision_collection(client, collection, corpus.shape[1], m=m, ef_construct=ef_construct, quantization=quantization, on_disk=on_disk)
+
+    for start in range(0, len(corpus), 1000):
+        client.upsert(
+            collection_name=collection,
+            points=[PointStruct(id=i, vector=corpus[i].tolist(), payload={"metadata": {"source": f"page-{i // 50}"}})
+                    for i in range(start, min(start + 1000, len(corpus)))]
+        )
+
+    wait_for_index(client, collection)
+
+    params = search_params(hnsw_ef=hnsw_ef, quantization=quantization, rescore=rescore)
+    latencies, hits = [], 0
+
+    for query_vector, expected in zip(query_vectors, truth):
+        start = time.perf_counter()
+        result = client.query_points(collection_name=collection, query=query_vector.tolist(), limit=5, search_params=params)
+        latencies.append(time.perf_counter() - start)
+
+        hits += len({point.id for point in result.points} & set(expected.tolist()))
+
+    client.delete_collection(collection)
+    latencies.sort()
+
+    return hits / truth.size, statistics.median(latencies) * 1000, latencies[int(len(latencies) * 0.99) - 1] * 1000
+
+
+def main():
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Compares recall@5 and search latency of qdrant collection configurations on a synthetic corpus")
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--hnsw-ef", type=int, default=128)
+    parser.add_argument("--qdrant-url", default=os.getenv("QDRANT_HOST"))
+    parser.add_argument("--grpc-port", type=int, default=int(os.getenv("QDRANT_GRPC_PORT", "6334")))
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(19)
+    corpus, query_vectors = build_corpus(rng, args.points, args.queries, args.dim)
+
+    #Exact top-5 of every query
+    truth = np.argsort(-(query_vectors @ corpus.T), axis=1)[:, :5]
+
+    try:
+        clients = [
+            ("http", QdrantClient(url=args.qdrant_url, timeout=60)),
+            ("grpc", QdrantClient(url=args.qdrant_url, prefer_grpc=True, grpc_port=args.grpc_port, timeout=60)),
+        ]
+        clients[0][1].get_collections()
+    except Exception:
+        print(f"No qdrant server at {args.qdrant_url}, using the in-memory client (exact search, recall is always 1)")
+        clients = [("memory", QdrantClient(location=":memory:"))]
+
+    print(f"{'configuration':<24}{'transport':>10}{'recall@5':>10}{'p50':>10}{'p99':>10}")
+
+    for config in CONFIGS:
+        for transport, client in clients:
+            recall, p50, p99 = run_config(client, "bench_qdrant_tuning", corpus, query_vectors, truth, config, args.hnsw_ef)
+            print(f"{config[0]:<24}{transport:>10}{recall:>10.3f}{p50:>8.2f}ms{p99:>8.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
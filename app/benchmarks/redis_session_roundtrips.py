@@ -0,0 +1,125 @@
+####
+# Compares the QueryAgent redis session layer before and after the move to redis.asyncio.
+# Before: blocking client, load is GET + EXPIRE and delete is EXISTS + DELETE (two round trips each).
+# After: pooled async client, load is GETEX and delete is DELETE (one round trip each).
+# Uses a fakeredis TCP server unless --redis-host is given.
+# Usage: python -m benchmarks.redis_session_roundtrips --operations 2000 --concurrency 50
+####
+
+import argparse
+import asyncio
+import time
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis, ConnectionPool
+
+from benchmarks.server_utils import start_fake_redis
+from src.utils.session_codec import encode_session
+
+
+KEY_PREFIX = "bench_session:"
+TIMEOUT = 900
+
+
+async def legacy_load(client: Redis, key: str):
+    data = client.get(key)
+    if data:
+        client.expire(key, TIMEOUT)
+    return data
+
+
+async def legacy_delete(client: Redis, key: str):
+    if not client.exists(key):
+        return False
+    client.delete(key)
+    return True
+
+
+async def load(client: AsyncRedis, key: str):
+    return await client.getex(key, ex=TIMEOUT)
+
+
+async def delete(client: AsyncRedis, key: str):
+    return await client.delete(key) > 0
+
+
+async def run(operation, client, operations: int, concurrency: int, setup=None):
+    """
+    Runs the operation on distinct keys from concurrent tasks.
+    Returns ops/sec and the longest time the event loop was blocked (ms), which is what other requests feel
+    """
+    keys = [f"{KEY_PREFIX}{i}" for i in range(operations)]
+    longest_stall = 0
+    done = False
+
+    if setup:
+        await setup(keys)
+
+    async def heartbeat():
+        nonlocal longest_stall
+        while not done:
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            longest_stall = max(longest_stall, time.perf_counter() - start - 0.001)
+
+    async def worker(worker_keys):
+        for key in worker_keys:
+            await operation(client, key)
+
+    monitor = asyncio.create_task(heartbeat())
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker(keys[i::concurrency]) for i in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    done = True
+    await monitor
+
+    return operations / elapsed, longest_stall * 1000
+
+
+async def main_async(host: str, port: int, operations: int, concurrency: int):
+    sync_client = Redis(host=host, port=port)
+    async_client = AsyncRedis.from_pool(ConnectionPool(host=host, port=port, max_connections=concurrency))
+    payload = encode_session([{"role": "user", "content": "How do I buy credits?"}] * 10)
+
+    async def fill(keys):
+        async with async_client.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.set(key, payload, ex=TIMEOUT)
+            await pipe.execute()
+
+    print(f"{'operation':<28}{'ops/sec':>12}{'longest loop stall':>20}")
+
+    for name, operation, client in [
+        ("load (GET + EXPIRE, sync)", legacy_load, sync_client),
+        ("load (GETEX, async)", load, async_client),
+        ("delete (EXISTS + DEL, sync)", legacy_delete, sync_client),
+        ("delete (DEL, async)", delete, async_client),
+    ]:
+        ops, stall = await run(operation, client, operations, concurrency, setup=fill)
+        print(f"{name:<28}{ops:>12.0f}{stall:>18.1f}ms")
+
+    sync_client.close()
+    await async_client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares the QueryAgent redis session layer before and after the move to redis.asyncio")
+    parser.add_argument("--operations", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--redis-host", default=None)
+    parser.add_argument("--redis-port", type=int, default=6379)
+    args = parser.parse_args()
+
+    host = args.redis_host or "127.0.0.1"
+    port, process = (args.redis_port, None) if args.redis_host else start_fake_redis()
+
+    try:
+        asyncio.run(main_async(host, port, args.operations, args.concurrency))
+    finally:
+        if process:
+            process.terminate()
+
+
+if __name__ == "__main__":
+    main()
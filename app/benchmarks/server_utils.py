@@ -0,0 +1,63 @@
+####
+# Helper functions to run local stand-in servers next to a benchmark
+####
+
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uvicorn
+
+
+def get_free_port() -> int:
+    """
+    Asks the OS for a free local port
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def run_server_in_thread(app, port: int = None):
+    """
+    Starts a uvicorn server for the given app in a background thread.
+    Returns the base url and the server so it can be stopped with server.should_exit = True
+    """
+    port = port or get_free_port()
+
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="off")
+    server = uvicorn.Server(config)
+
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+
+    while not server.started:
+        time.sleep(0.01)
+
+    return f"http://127.0.0.1:{port}", server
+
+
+def start_fake_redis():
+    """
+    Starts a fakeredis TCP server in its own process, so it does not share the GIL with the benchmark.
+    Returns the port and the process, call process.terminate() when done
+    """
+    port = get_free_port()
+    code = (
+        "from fakeredis import TcpFakeServer;"
+        f"TcpFakeServer(('127.0.0.1', {port}), server_type='redis').serve_forever()"
+    )
+    #No shared stdout, a leftover server would otherwise keep the output pipe of the benchmark open
+    process = subprocess.Popen([sys.executable, "-c", code], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return port, process
+        except OSError:
+            time.sleep(0.1)
+
+    process.terminate()
+    raise RuntimeError("fakeredis server did not start")
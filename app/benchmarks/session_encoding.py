@@ -0,0 +1,105 @@
+####
+# Micro-benchmark of the QueryAgent session encoding.
+# Compares the old pickle of the full chat history (system prompt, RAG prompts and ChatCompletionMessage objects)
+# with the versioned compact encoding, at 5, 20 and 100 turns.
+# Usage: python -m benchmarks.session_encoding
+####
+
+import argparse
+import pickle
+import random
+import time
+from openai.types.chat import ChatCompletionMessage
+
+from src.utils.define_system_prompt import RAG_SYSTEM_PROMPT
+from src.utils import session_codec
+
+
+WORDS = ("uellosend bulk sms credits dashboard sender id approval payment mobile money card account verify "
+         "reset password customer support message delivery report contacts group schedule campaign api key "
+         "balance invoice transaction top up pricing network route unicode character limit").split()
+
+
+def random_text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def build_legacy_history(turns: int) -> list:
+    """
+    Builds a chat history shaped like QueryAgent.chat_history before the compact encoding
+    """
+    rng = random.Random(turns)
+    history = [{"role": "system", "content": [{"type": "text", "text": RAG_SYSTEM_PROMPT}]}]
+
+    for turn in range(turns):
+        context = "\n".join(f"[{i + 1}] {random_text(rng, 80)} (Source: Pricing - https://uellosend.com/pricing)" for i in range(5))
+        prompt = f"Answer the following question based on the provided context information.\n\nContext information:\n{context}\n\nQuestion: {random_text(rng, 10)}?\n\nAnswer:"
+
+        history.append({"role": "user", "content": [{"type": "text", "text": prompt}]})
+        history.append(ChatCompletionMessage(role="assistant", content=random_text(rng, 60)))
+
+    return history
+
+
+def compact(history: list) -> list:
+    """
+    Converts the old history to compact role/content dicts
+    """
+    result = []
+    for message in history:
+        if not isinstance(message, dict):
+            message = {"role": message.role, "content": message.content}
+        if message["role"] == "system":
+            continue
+        content = message["content"]
+        if isinstance(content, list):
+            content = "".join(part.get("text", "") for part in content)
+        result.append({"role": message["role"], "content": content})
+    return result
+
+
+def timed(func, arg, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func(arg)
+    return result, (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark of the QueryAgent session encoding")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'turns':>5} {'encoding':<22}{'bytes':>10}{'encode us':>12}{'decode us':>12}")
+
+    for turns in [5, 20, 100]:
+        legacy = build_legacy_history(turns)
+        history = compact(legacy)
+
+        variants = [("pickle (before)", pickle.dumps, pickle.loads, legacy)]
+
+        #Same history, forcing each compression choice
+        threshold = session_codec.SESSION_COMPRESS_THRESHOLD
+        zstd = session_codec.zstandard
+        for name, new_threshold, new_zstd in [("json", 10 ** 12, zstd), ("json + zlib", 0, None), ("json + zstd", 0, zstd)]:
+            if name == "json + zstd" and zstd is None:
+                continue
+
+            def encode(data, new_threshold=new_threshold, new_zstd=new_zstd):
+                session_codec.SESSION_COMPRESS_THRESHOLD = new_threshold
+                session_codec.zstandard = new_zstd
+                return session_codec.encode_session(data)
+
+            variants.append((name, encode, session_codec.decode_session, history))
+
+        for name, encode, decode, data in variants:
+            blob, encode_time = timed(encode, data, args.repeat)
+            _, decode_time = timed(decode, blob, args.repeat)
+            print(f"{turns:>5} {name:<22}{len(blob):>10}{encode_time:>12.1f}{decode_time:>12.1f}")
+
+        session_codec.SESSION_COMPRESS_THRESHOLD = threshold
+        session_codec.zstandard = zstd
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+####
+# Benchmark of the in-memory support session store at 100k synthetic sessions.
+# Compares the old dict store (cleanup scans every session once an hour) with the LRU ordered store:
+# - touch: get + save of random sessions
+# - cleanup: time to remove 1% expired sessions out of 100k
+# - traffic spike: a simulated two hours of traffic, reports the peak number of resident sessions and the
+#   longest idle time of a session still resident, with and without the count cap
+# Usage: python -m benchmarks.session_store --sessions 100000
+####
+
+import argparse
+import asyncio
+import heapq
+import random
+import time
+from types import SimpleNamespace
+from google.generativeai import protos
+
+from src.utils.manage_sessions import MemorySessionStore
+
+
+TIMEOUT = 15 * 60
+
+#Byte cap of the uncapped runs
+UNLIMITED = 2 ** 62
+
+
+class LegacyMemorySessionStore:
+    """
+    The store before the LRU order: a plain dict and a full scan on cleanup
+    """
+
+    def __init__(self, timeout: int, clock=time.monotonic):
+        self.timeout = timeout
+        self.clock = clock
+        self.sessions = {}
+
+    async def get(self, session_id):
+        session = self.sessions.get(session_id)
+        if session is None:
+            return None
+        session.last_accessed = self.clock()
+        return session.agent
+
+    async def save(self, session_id, agent):
+        if session_id in self.sessions:
+            self.sessions[session_id].last_accessed = self.clock()
+        else:
+            self.sessions[session_id] = SimpleNamespace(agent=agent, last_accessed=self.clock())
+
+    async def cleanup(self):
+        current_time = self.clock()
+        for session_id in list(self.sessions.keys()):
+            if current_time - self.sessions[session_id].last_accessed > self.timeout:
+                del self.sessions[session_id]
+
+    async def count(self):
+        return len(self.sessions)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def fake_agent(turns: int = 3):
+    """
+    Stands in for a UelloSendAgent, only the Gemini history is needed to estimate its size
+    """
+    history = []
+    for turn in range(turns):
+        history.append(protos.Content(role="user", parts=[protos.Part(text=f"My email is customer{turn}@example.com, I need help")]))
+        history.append(protos.Content(role="model", parts=[protos.Part(text="I have checked that for you, anything else I can help with?")]))
+
+    return SimpleNamespace(conversation=SimpleNamespace(history=history))
+
+
+def oldest_idle(store, now: float) -> float:
+    return max((now - session.last_accessed for session in store.sessions.values()), default=0.0)
+
+
+async def touch_benchmark(store, agent, sessions: int, operations: int) -> float:
+    """
+    Fills the store and returns get + save operations per second on random sessions
+    """
+    for i in range(sessions):
+        await store.save(f"session-{i}", agent)
+
+    rng = random.Random(22)
+    ids = [f"session-{rng.randrange(sessions)}" for _ in range(operations)]
+
+    start = time.perf_counter()
+    for session_id in ids:
+        await store.save(session_id, await store.get(session_id))
+
+    return operations / (time.perf_counter() - start)
+
+
+async def cleanup_benchmark(store, clock: FakeClock, agent, sessions: int) -> float:
+    """
+    Ages 1% of the sessions past the timeout and returns the cleanup time in ms
+    """
+    expired = sessions // 100
+
+    for i in range(sessions):
+        clock.now = 0.0 if i < expired else TIMEOUT
+        await store.save(f"session-{i}", agent)
+
+    clock.now = TIMEOUT + 1
+
+    start = time.perf_counter()
+    await store.cleanup()
+    elapsed = time.perf_counter() - start
+
+    assert await store.count() == sessions - expired
+
+    return elapsed * 1000
+
+
+async def spike_simulation(store, clock: FakeClock, agent, sessions: int, cleanup_interval: float) -> dict:
+    """
+    Two simulated hours: a spike brings in the given number of sessions over the first 10 minutes, then
+    a steady trickle. Every conversation has three turns one minute apart.
+    """
+    step = 10.0
+    spike_steps = int(600 / step)
+    per_step = max(1, sessions // spike_steps)
+    next_cleanup = cleanup_interval
+    peak = 0
+    longest_idle = 0.0
+    started = 0
+    turns = []
+
+    clock.now = 0.0
+    while clock.now < 7200:
+        arrivals = per_step if clock.now < 600 else max(1, per_step // 50)
+
+        for _ in range(arrivals):
+            session_id = f"session-{started}"
+            started += 1
+            await store.save(session_id, agent)
+            heapq.heappush(turns, (clock.now + 60, session_id))
+            heapq.heappush(turns, (clock.now + 120, session_id))
+
+        while turns and turns[0][0] <= clock.now:
+            _, session_id = heapq.heappop(turns)
+            await store.save(session_id, await store.get(session_id) or agent)
+
+        if clock.now >= next_cleanup:
+            await store.cleanup()
+            next_cleanup += cleanup_interval
+
+        peak = max(peak, await store.count())
+        longest_idle = max(longest_idle, oldest_idle(store, clock.now))
+        clock.now += step
+
+    return {"peak": peak, "longest_idle": longest_idle}
+
+
+async def main_async(args):
+    agent = fake_agent()
+
+    print(f"{'store':<30}{'touch ops/s':>14}{'cleanup 1%':>14}")
+    legacy_clock, ordered_clock = FakeClock(), FakeClock()
+    legacy_touch = await touch_benchmark(LegacyMemorySessionStore(TIMEOUT), agent, args.sessions, args.operations)
+    ordered_touch = await touch_benchmark(MemorySessionStore(TIMEOUT, max_sessions=args.sessions, max_bytes=UNLIMITED), agent, args.sessions, args.operations)
+    legacy_cleanup = await cleanup_benchmark(LegacyMemorySessionStore(TIMEOUT, clock=legacy_clock), legacy_clock, agent, args.sessions)
+    ordered_cleanup = await cleanup_benchmark(MemorySessionStore(TIMEOUT, max_sessions=args.sessions, max_bytes=UNLIMITED, clock=ordered_clock), ordered_clock, agent, args.sessions)
+
+    print(f"{'dict + full scan':<30}{legacy_touch:>14.0f}{legacy_cleanup:>12.2f}ms")
+    print(f"{'LRU ordered':<30}{ordered_touch:>14.0f}{ordered_cleanup:>12.2f}ms")
+
+    print(f"\nTraffic spike of {args.sessions} sessions, timeout {TIMEOUT // 60} min")
+    print(f"{'store':<30}{'peak resident':>14}{'longest idle':>14}{'evictions':>30}")
+
+    clock = FakeClock()
+    legacy = await spike_simulation(LegacyMemorySessionStore(TIMEOUT, clock=clock), clock, agent, args.sessions, cleanup_interval=3600)
+    print(f"{'dict, hourly cleanup':<30}{legacy['peak']:>14}{legacy['longest_idle'] / 60:>11.0f}min")
+
+    results = {}
+    for name, max_sessions, max_bytes in (("LRU ordered, 60s cleanup", UNLIMITED, UNLIMITED), (f"LRU ordered, cap {args.cap}", args.cap, args.max_bytes)):
+        clock = FakeClock()
+        store = MemorySessionStore(TIMEOUT, max_sessions=max_sessions, max_bytes=max_bytes, clock=clock)
+        results[name] = await spike_simulation(store, clock, agent, args.sessions, cleanup_interval=60)
+        results[name]["evictions"] = store.evictions
+        print(f"{name:<30}{results[name]['peak']:>14}{results[name]['longest_idle'] / 60:>11.0f}min{str(store.evictions):>30}")
+
+    assert ordered_cleanup < legacy_cleanup, "Cleanup of the ordered store should only visit expired sessions"
+    assert all(result["longest_idle"] <= TIMEOUT + 60 for result in results.values()), "Idle sessions outlived the timeout"
+    assert results[f"LRU ordered, cap {args.cap}"]["peak"] <= args.cap, "The count cap was exceeded"
+    print("OK: expired sessions leave within a minute and the cap holds")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the in-memory support session store at 100k synthetic sessions")
+    parser.add_argument("--sessions", type=int, default=100000)
+    parser.add_argument("--operations", type=int, default=200000, help="Random get + save operations")
+    parser.add_argument("--cap", type=int, default=20000, help="Session count cap of the capped run")
+    parser.add_argument("--max-bytes", type=int, default=512 * 1024 * 1024, help="Estimated bytes cap of the capped run")
+    args = parser.parse_args()
+
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+####
+# Measures time to first token of the streaming chat path against local fake streaming providers,
+# next to the time the non-streaming path makes the user wait for the full answer.
+# Usage: python -m benchmarks.streaming_ttfb --latency 0.3 --token-delay 0.02
+####
+
+import os
+import argparse
+import asyncio
+import tempfile
+import time
+from langchain_community.embeddings import DeterministicFakeEmbedding
+from qdrant_client import QdrantClient
+
+from benchmarks.server_utils import run_server_in_thread
+from benchmarks.fake_openai import create_fake_openai_app
+from benchmarks.fake_gemini import create_fake_gemini_app
+
+
+LONG_REPLY = " ".join(["UelloSend lets you buy SMS credits from the dashboard using mobile money or card."] * 4)
+
+
+async def measure_stream(tokens):
+    """
+    Consumes a token stream and returns (time to first token, total time)
+    """
+    start = time.perf_counter()
+    first = None
+
+    async for _ in tokens:
+        if first is None:
+            first = time.perf_counter() - start
+
+    return first, time.perf_counter() - start
+
+
+async def run_benchmark(rounds: int):
+    #Imported here so the environment is set before the clients are created
+    from src.utils.manage_resources import register_resource, close_resources
+    from src.utils.manage_db import create_QueryAgent_messages_table, create_UelloSendAgent_messages_table
+    from src.agents.rag_agent import QueryAgent
+    from src.agents.gemini_agent import UelloSendAgent
+
+    register_resource("embedding_client", DeterministicFakeEmbedding(size=768))
+    register_resource("qdrant_client", QdrantClient(location=":memory:"))
+    await create_QueryAgent_messages_table()
+    await create_UelloSendAgent_messages_table()
+
+    results = {}
+
+    for name, blocking, streaming in [
+        ("QueryAgent",
+            lambda i: QueryAgent([]).generate_response("How do I buy credits?", f"bench-q-{i}"),
+            lambda i: QueryAgent([]).generate_response_stream("How do I buy credits?", f"bench-qs-{i}")),
+        ("UelloSendAgent",
+            lambda i: UelloSendAgent().run_agent("Hello", f"bench-s-{i}"),
+            lambda i: UelloSendAgent().run_agent_stream("Hello", f"bench-ss-{i}")),
+    ]:
+        full_waits, first_tokens, stream_totals = [], [], []
+
+        for i in range(rounds):
+            start = time.perf_counter()
+            await blocking(i)
+            full_waits.append(time.perf_counter() - start)
+
+            first, total = await measure_stream(streaming(i))
+            first_tokens.append(first)
+            stream_totals.append(total)
+
+        results[name] = (sum(full_waits) / rounds, sum(first_tokens) / rounds, sum(stream_totals) / rounds)
+
+    await close_resources()
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures time to first token of the streaming chat path against local fake streaming providers")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.3, help="Time until the fake providers send the first token")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Time between tokens")
+    args = parser.parse_args()
+
+    openai_url, openai_server = run_server_in_thread(
+        create_fake_openai_app(latency=args.latency, reply=LONG_REPLY, token_delay=args.token_delay)
+    )
+    gemini_url, gemini_server = run_server_in_thread(
+        create_fake_gemini_app(latency=args.latency, token_delay=args.token_delay)
+    )
+
+    workdir = tempfile.mkdtemp()
+    os.environ["OPEN_ROUTER_URL"] = openai_url
+    os.environ["OPEN_ROUTER_KEY"] = "fake-key"
+    os.environ["GEMINI_API_ENDPOINT"] = gemini_url
+    os.environ["GEMINI_TRANSPORT"] = "rest"
+    os.environ["GEMINI_API_KEY"] = "fake-key"
+    os.environ["QUERY_AGENT_DB"] = os.path.join(workdir, "query_agent")
+    os.environ["UELLOSEND_AGENT_DB"] = os.path.join(workdir, "uellosend_agent")
+
+    results = asyncio.run(run_benchmark(args.rounds))
+    openai_server.should_exit = True
+    gemini_server.should_exit = True
+
+    print(f"{'agent':<16}{'non-streaming wait':>20}{'time to first token':>22}{'streamed total':>16}")
+    for name, (full_wait, first_token, stream_total) in results.items():
+        print(f"{name:<16}{full_wait * 1000:>18.1f}ms{first_token * 1000:>20.1f}ms{stream_total * 1000:>14.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+####
+# Runs the real server app with local stand-ins for the resources that cannot be reached over the network:
+# a fake embedding model (fixed cost per forward pass) and an in-memory qdrant seeded with a fixture corpus.
+# Gemini, OpenRouter, the UelloSend API and redis are pointed at through the usual environment variables.
+# Adds GET /_bench/stats with the RSS of the server process for the load driver.
+# Usage: python -m benchmarks.stub_server --port 8000 --embed-ms 12
+####
+
+import os
+import argparse
+import resource
+from langchain_core.documents import Document
+from qdrant_client import QdrantClient
+
+from benchmarks.embedding_batching import BatchCostFakeEmbedding
+from benchmarks.embedding_backends import CORPUS
+
+
+def rss_mb() -> dict:
+    """
+    Current and peak resident memory of this process in MB
+    """
+    #ru_maxrss is in KB on linux
+    stats = {"peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, "rss_mb": None}
+
+    try:
+        with open("/proc/self/statm") as statm:
+            stats["rss_mb"] = int(statm.read().split()[1]) * resource.getpagesize() / (1024 * 1024)
+    except OSError:
+        pass
+
+    return stats
+
+
+def seed_collection(client: QdrantClient, embedding, collection: str):
+    """
+    Indexes the fixture corpus as chunks of a few help pages
+    """
+    from src.utils.manage_index import index_documents
+
+    chunks = [
+        Document(page_content=text, metadata={"source": f"https://help.example.com/page-{i // 4}", "title": f"Help page {i // 4}", "start_index": i})
+        for i, text in enumerate(CORPUS)
+    ]
+
+    return index_documents(client, embedding, collection, chunks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the real server app with local stand-ins for the resources that cannot be reached over the network")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--embed-ms", type=float, default=12, help="Fixed cost of one fake forward pass")
+    parser.add_argument("--per-text-ms", type=float, default=1, help="Cost of every text in a fake forward pass")
+    args = parser.parse_args()
+
+    os.environ.setdefault("QDRANT_COLLECTION", "bench_load")
+
+    #Imported here so the environment is set before the clients are created
+    import uvicorn
+    from src.utils.manage_resources import register_resource
+    from main import app
+
+    embedding = BatchCostFakeEmbedding(size=768, base_ms=args.embed_ms, per_text_ms=args.per_text_ms)
+    qdrant = QdrantClient(location=":memory:")
+    seed_collection(qdrant, embedding, os.environ["QDRANT_COLLECTION"])
+
+    #The lifespan finds these already registered and skips loading the real ones
+    register_resource("embedding_client", embedding)
+    register_resource("qdrant_client", qdrant)
+
+    @app.get("/_bench/stats")
+    async def bench_stats():
+        return rss_mb()
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
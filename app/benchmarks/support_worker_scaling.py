@@ -0,0 +1,149 @@
+####
+# Load test for the support chat endpoint with sessions stored in redis.
+# Starts the server with 1, 2, 4... uvicorn workers against local stand-ins for Gemini and the UelloSend API
+# and runs multi-turn conversations, every turn may land on a different worker.
+# Throughput should grow roughly linearly with the worker count while the server is CPU bound.
+# Uses a fakeredis TCP server unless --redis-host is given (a real redis gives more accurate numbers).
+# Usage: python -m benchmarks.support_worker_scaling --workers 1 2 4 --clients 32 --duration 20
+####
+
+import os
+import sys
+import argparse
+import asyncio
+import subprocess
+import tempfile
+import time
+import uuid
+import httpx
+
+from benchmarks.server_utils import run_server_in_thread, get_free_port, start_fake_redis
+from benchmarks.fake_gemini import create_fake_gemini_app
+from benchmarks.fake_uellosend import create_fake_uellosend_app, set_tool_urls
+
+
+CONVERSATION = [
+    "Hello",
+    "I have an issue with my account, my email is customer@example.com",
+    "Thank you",
+]
+
+
+def start_server(workers: int, env: dict):
+    """
+    Starts the app with the given number of workers and waits until it answers
+    """
+    port = get_free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 120
+
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"{base_url}/", timeout=1).status_code == 200:
+                return base_url, process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+
+    process.terminate()
+    raise RuntimeError("Server did not start")
+
+
+async def drive_load(base_url: str, clients: int, duration: float) -> dict:
+    """
+    Runs conversations from concurrent clients for the given duration and counts completed turns
+    """
+    completed = 0
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def client(http):
+        nonlocal completed, errors
+
+        while time.perf_counter() < deadline:
+            session_id = str(uuid.uuid4())
+
+            for query in CONVERSATION:
+                response = await http.post(f"{base_url}/agent/support/chat", json={"query": query, "session_id": session_id})
+
+                if response.status_code == 200:
+                    completed += 1
+                else:
+                    errors += 1
+
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as http:
+        start = time.perf_counter()
+        await asyncio.gather(*[client(http) for _ in range(clients)])
+        elapsed = time.perf_counter() - start
+
+    return {"turns": completed, "errors": errors, "throughput": completed / elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for the support chat endpoint with sessions stored in redis")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=32, help="Concurrent conversations")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds of load per worker count")
+    parser.add_argument("--model-latency", type=float, default=0.05)
+    parser.add_argument("--tool-latency", type=float, default=0.02)
+    parser.add_argument("--redis-host", default=None)
+    parser.add_argument("--redis-port", type=int, default=6379)
+    args = parser.parse_args()
+
+    gemini_url, _ = run_server_in_thread(create_fake_gemini_app(latency=args.model_latency))
+    api_url, _ = run_server_in_thread(create_fake_uellosend_app(latency=args.tool_latency))
+
+    redis_host = args.redis_host or "127.0.0.1"
+    redis_port, redis_process = (args.redis_port, None) if args.redis_host else start_fake_redis()
+
+    workdir = tempfile.mkdtemp()
+    env = dict(os.environ)
+    env.update({
+        "SUPPORT_SESSION_BACKEND": "redis",
+        "RATE_LIMIT_ENABLED": "false",
+        "REDIS_HOST": redis_host,
+        "REDIS_PORT": str(redis_port),
+        "GEMINI_API_ENDPOINT": gemini_url,
+        "GEMINI_TRANSPORT": "rest",
+        "GEMINI_API_KEY": "fake-key",
+        "UELLOSEND_AGENT_DB": os.path.join(workdir, "uellosend_agent"),
+        "QUERY_AGENT_DB": os.path.join(workdir, "query_agent"),
+    })
+    set_tool_urls(api_url, env)
+
+    results = {}
+    try:
+        for workers in args.workers:
+            base_url, process = start_server(workers, env)
+
+            try:
+                results[workers] = asyncio.run(drive_load(base_url, args.clients, args.duration))
+            finally:
+                process.terminate()
+                process.wait()
+
+            print(f"{workers} worker(s): {results[workers]['throughput']:.1f} turns/sec "
+                  f"({results[workers]['turns']} turns, {results[workers]['errors']} errors)")
+
+    finally:
+        #A failed run must not leave the fakeredis server behind
+        if redis_process:
+            redis_process.terminate()
+            redis_process.wait()
+
+    baseline = results[args.workers[0]]["throughput"] / args.workers[0]
+    for workers, result in results.items():
+        print(f"{workers} worker(s): {result['throughput'] / (baseline * workers):.0%} of linear scaling")
+
+
+if __name__ == "__main__":
+    main()
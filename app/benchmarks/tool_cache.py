@@ -0,0 +1,98 @@
+####
+# Measures UelloSend API requests and tool latency of verify_customer_exist with the tool cache off and on.
+# Workload: conversations that check the same email several times (differently cased, as the model repeats it),
+# plus bursts of concurrent identical lookups that should share one request.
+# Also checks that the mutating tools are never cached.
+# Usage: python -m benchmarks.tool_cache --conversations 50 --repeats 3 --burst 20 --tool-latency 0.2
+####
+
+import os
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+
+from benchmarks.server_utils import run_server_in_thread
+from benchmarks.fake_uellosend import create_fake_uellosend_app, set_tool_urls
+
+
+async def run_workload(args, api_app) -> dict:
+    #Imported here so the environment is set before the tools read it
+    from src.tools.tool_set import verify_customer_exist, send_password_reset_link
+
+    api_app.state.requests.clear()
+    latencies = []
+
+    async def timed_lookup(email):
+        start = time.perf_counter()
+        await verify_customer_exist(customer_email=email)
+        latencies.append(time.perf_counter() - start)
+
+    async def conversation(i):
+        for repeat in range(args.repeats):
+            email = f"customer{i}@example.com"
+            await timed_lookup(email.upper() if repeat % 2 else email)
+
+    await asyncio.gather(*[conversation(i) for i in range(args.conversations)])
+
+    #Every client asks for the same email at the same moment
+    await asyncio.gather(*[timed_lookup("burst@example.com") for _ in range(args.burst)])
+
+    #A mutating tool called twice must reach the API twice
+    await send_password_reset_link(customer_email="customer0@example.com")
+    await send_password_reset_link(customer_email="customer0@example.com")
+
+    return {
+        "customer_requests": api_app.state.requests.get("customer", 0),
+        "reset_requests": api_app.state.requests.get("reset", 0),
+        "mean_ms": statistics.mean(latencies) * 1000,
+    }
+
+
+async def run_benchmark(args, api_app):
+    from src.utils.manage_tool_cache import tool_cache
+    from src.utils.manage_resources import close_resources
+
+    lookups = args.conversations * args.repeats + args.burst
+    print(f"{lookups} lookups: {args.conversations} conversations x {args.repeats} checks, and a burst of {args.burst}")
+    print(f"{'tool cache':<12}{'API requests':>14}{'mean latency':>15}{'hits':>7}{'shared':>8}{'misses':>8}")
+
+    results = {}
+    for enabled in (False, True):
+        tool_cache.enabled = enabled
+        tool_cache.clear()
+        tool_cache.hits = tool_cache.misses = tool_cache.shared = 0
+
+        results[enabled] = await run_workload(args, api_app)
+        print(f"{'on' if enabled else 'off':<12}{results[enabled]['customer_requests']:>14}{results[enabled]['mean_ms']:>13.1f}ms"
+              f"{tool_cache.hits:>7}{tool_cache.shared:>8}{tool_cache.misses:>8}")
+
+    await close_resources()
+
+    #One request per distinct email
+    assert results[True]["customer_requests"] == args.conversations + 1, "Repeated or concurrent lookups were not deduplicated"
+    assert results[True]["reset_requests"] == 2, "A mutating tool was cached"
+    print("OK: one API request per distinct email, mutating tools are not cached")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures UelloSend API requests and tool latency of verify_customer_exist with the tool cache off and on")
+    parser.add_argument("--conversations", type=int, default=50)
+    parser.add_argument("--repeats", type=int, default=3, help="Checks of the same email in one conversation")
+    parser.add_argument("--burst", type=int, default=20, help="Concurrent identical lookups")
+    parser.add_argument("--tool-latency", type=float, default=0.2, help="Latency of the fake UelloSend API in seconds")
+    args = parser.parse_args()
+
+    api_app = create_fake_uellosend_app(latency=args.tool_latency)
+    api_url, api_server = run_server_in_thread(api_app)
+
+    os.environ["UELLOSEND_AGENT_DB"] = os.path.join(tempfile.mkdtemp(), "uellosend_agent")
+    set_tool_urls(api_url, os.environ)
+
+    asyncio.run(run_benchmark(args, api_app))
+    api_server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -3,16 +3,16 @@
 # #################################################
 import os
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, Request, status
+from fastapi import FastAPI, HTTPException, Request, status, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, Response
 from pydantic import BaseModel
-from typing import List, Dict
+from typing import List, Dict, Optional, Literal
+import json
 import asyncio
 from contextlib import asynccontextmanager
-import pickle
 import time
 from datetime import date
-from redis import Redis
 import logfire
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
@@ -21,8 +21,14 @@ from slowapi.errors import RateLimitExceeded
 
 from src.agents.rag_agent import QueryAgent
 from src.agents.gemini_agent import UelloSendAgent
-from src.utils.manage_db import create_UelloSendAgent_messages_table, fetch_UelloSendAgent_messages
-from src.utils.manage_db import create_QueryAgent_messages_table, fetch_QueryAgent_messages
+from src.utils.manage_db import create_UelloSendAgent_messages_table, fetch_UelloSendAgent_messages, stream_UelloSendAgent_messages
+from src.utils.manage_db import create_QueryAgent_messages_table, fetch_QueryAgent_messages, stream_QueryAgent_messages
+from src.utils.manage_db import stop_message_writers, message_queue_depths
+from src.utils.manage_resources import init_resources, close_resources, get_redis_client, get_chat_router, get_gemini_router
+from src.utils.manage_metrics import record_duration, set_gauge, timed, prometheus_metrics
+from src.utils.manage_sessions import create_session_store
+from src.utils.session_codec import encode_session, decode_session
+from src.utils.manage_jobs import enqueue_index_job, get_index_job, queue_depth
 
 
 load_dotenv()
@@ -40,16 +46,28 @@ async def lifespan(app: FastAPI):
     Create lifespan function to start a background task
     """
     asyncio.create_task(cleanup_session())
+    asyncio.create_task(refresh_session_counts())
 
     await create_UelloSendAgent_messages_table()
     await create_QueryAgent_messages_table()
 
+    #Load embedding model and clients once for this worker
+    await init_resources()
+
     print("App is starting...")
     yield
     print("App is shutting down...")
 
-#set global request limit
-limiter = Limiter(key_func=get_remote_address, default_limits=["50 per day"])
+    #Write any queued chat messages before exiting
+    await stop_message_writers()
+    await close_resources()
+
+#set global request limit, RATE_LIMIT_ENABLED=false turns it off e.g. for load tests
+limiter = Limiter(
+    key_func=get_remote_address,
+    default_limits=["50 per day"],
+    enabled=os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+)
 
 #Initialize the server
 app = FastAPI(title= "UelloSend Support Agent Server", lifespan=lifespan)
@@ -78,21 +96,71 @@ class ChatRequest(BaseModel):
     session_id: str
 
 
-#Model for session
-class AgentSession:
-    def __init__(self, agent: UelloSendAgent):
-        self.agent = agent
-        self.last_accessed = time.time()
+#Set session timeout, 15 mins in seconds
+SESSION_TIMEOUT = 15*60
 
+#Cleanup only visits expired sessions, so it can run often
+SESSION_CLEANUP_INTERVAL = int(os.getenv("SESSION_CLEANUP_INTERVAL", "60"))
 
-#Create session in memory
-sessions: Dict[str, AgentSession] = {}
+#Counting redis sessions scans their keys, the live session gauges are refreshed this often instead of on every scrape
+SESSION_COUNT_INTERVAL = int(os.getenv("SESSION_COUNT_INTERVAL", "60"))
 
-#Set session timeout, 15 mins in seconds
-SESSION_TIMEOUT = 15*60
+#Create session store, in memory or redis depending on SUPPORT_SESSION_BACKEND
+sessions = create_session_store(SESSION_TIMEOUT)
 ADMIN_KEY = os.getenv("ADMIN_KEY")
 
 
+def sse_event(data: dict, event: str = None) -> str:
+    """
+    Formats data as a Server-Sent Event
+    """
+    message = f"event: {event}\n" if event else ""
+
+    return message + f"data: {json.dumps(data)}\n\n"
+
+
+async def stream_chat(tokens, agent_name: str, start: float, on_finish):
+    """
+    Forwards response tokens as Server-Sent Events and records the time to first token.
+    on_finish is awaited once the full response has been streamed, before the final "done" event.
+    """
+    response = []
+
+    try:
+        async for token in tokens:
+            if not response:
+                record_duration("chat.time_to_first_token", time.perf_counter() - start, agent=agent_name)
+
+            response.append(token)
+            yield sse_event({"token": token})
+
+        await on_finish()
+
+        record_duration("chat.stream_duration", time.perf_counter() - start, agent=agent_name)
+
+        yield sse_event({"status": "ok", "message": "".join(response)}, event="done")
+
+    except Exception as e:
+        logfire.error(
+            "Unhandled exception in streaming chat",
+            exc_info=e, 
+            extra={"agent": agent_name}
+        )
+
+        yield sse_event({"status": "error", "message": "An unexpected internal error occurred. Please try again later."}, event="error")
+
+
+#Headers that stop proxies from buffering the event stream
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+async def messages_to_ndjson(rows):
+    """
+    Turns streamed database rows into newline delimited JSON
+    """
+    async for row in rows:
+        yield json.dumps(row) + "\n"
+
 
 @app.get("/")
 @logfire.instrument()
@@ -116,6 +184,40 @@ async def root(request: Request):
 
 
 
+@app.get("/metrics")
+@limiter.exempt
+async def metrics(request: Request):
+    """
+    Endpoint for Prometheus, per-stage latency histograms, counters and gauges of this worker
+    """
+    await update_gauges()
+
+    content, content_type = prometheus_metrics()
+
+    return Response(content=content, media_type=content_type)
+
+
+async def update_gauges():
+    """
+    Reads queue depths and LLM endpoint stats into their gauges, a missing redis only skips its gauges.
+    The live session gauges are kept up to date by refresh_session_counts.
+    """
+    for database, depth in message_queue_depths().items():
+        set_gauge("message_writer.queue_depth", depth, database=os.path.basename(database))
+
+    get_chat_router().update_gauges()
+    get_gemini_router().update_gauges()
+
+    try:
+        set_gauge("index_jobs.queue_depth", await queue_depth())
+
+    except Exception as e:
+        logfire.error(
+            "Unhandled exception in reading metrics gauges",
+            exc_info=e
+        )
+
+
 @app.post("/agent/support/chat")
 @logfire.instrument()
 @limiter.limit("100 per day")
@@ -129,19 +231,17 @@ async def chat_support_agent(req: ChatRequest, request: Request):
     try:
 
         #check if session exists
-        if session_id not in sessions:
-        
-            agent = UelloSendAgent()
-
-            sessions[session_id] = AgentSession(agent)
-        else:
-            sessions[session_id].last_accessed = time.time()
+        agent = await sessions.get(session_id)
 
-        agent = sessions[session_id].agent
+        if agent is None:
+            agent = UelloSendAgent()
 
         #run the agent to process request
         response = await agent.run_agent(req.query, session_id)
 
+        #save the updated conversation
+        await sessions.save(session_id, agent)
+
         res_data = {
         "status": "ok",
         "message": response
@@ -170,26 +270,48 @@ async def chat_support_agent(req: ChatRequest, request: Request):
 @app.get("/agent/support/chat/messages/{admin_key}")
 @logfire.instrument()
 @limiter.limit("100 per day")
-async def support_messages(admin_key:str, request: Request):
+async def support_messages(
+    admin_key: str,
+    request: Request,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[int] = None,
+    session_id: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    format: Literal["json", "ndjson"] = "json"
+):
     """
     Endpoint to retrieve UelloSendAgent chat messages. These are messages that might involved tool calling
+    Returns one page of messages, pass next_cursor back as cursor to get the next page.
+    Use format=ndjson to stream every matching message instead.
     """
 
     try:
         result = {"status": "ok", "messages": "Unauthorized"}
+
         if admin_key == ADMIN_KEY:
-            data = await fetch_UelloSendAgent_messages()
+
+            if format == "ndjson":
+                rows = stream_UelloSendAgent_messages(session_id=session_id, start_date=start_date, end_date=end_date)
+
+                #log data to logfire dashboard
+                logfire.info("Streaming messages", extra={"session_id": session_id})
+
+                return StreamingResponse(messages_to_ndjson(rows), media_type="application/x-ndjson")
+
+            data, next_cursor = await fetch_UelloSendAgent_messages(limit, cursor, session_id, start_date, end_date)
             
             result = {
                 "status": "ok",
-                "messages": data
+                "messages": data,
+                "next_cursor": next_cursor
             }
 
-        #log data to logfire dashboard
-        logfire.info("Sending response", extra={"response_data_length": len(data)})
+            #log data to logfire dashboard
+            logfire.info("Sending response", extra={"response_data_length": len(data)})
 
         return result
-        
+
     except Exception as e:
         response = f"Error - {str(e)}"
 
@@ -204,6 +326,49 @@ async def support_messages(admin_key:str, request: Request):
         )
 
 
+@app.post("/agent/support/chat/stream")
+@logfire.instrument()
+@limiter.limit("100 per day")
+async def chat_support_agent_stream(req: ChatRequest, request: Request):
+    """
+    Streaming version of /agent/support/chat, the response is sent as Server-Sent Events while Gemini generates it.
+    Each token is sent as a "data" event, a final "done" event carries the full message.
+    """
+    start = time.perf_counter()
+    session_id = req.session_id
+
+    try:
+        #check if session exists
+        agent = await sessions.get(session_id)
+
+        if agent is None:
+            agent = UelloSendAgent()
+
+    except Exception as e:
+        logfire.error(
+            "Unhandled exception in chat support stream",
+            exc_info=e, 
+            extra={"session_id": req.session_id, "query": req.query}
+        )
+
+        raise HTTPException(
+            status_code= status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail= "An unexpected internal error occurred. Please try again later."
+        )
+
+    async def on_finish():
+        #save the updated conversation
+        await sessions.save(session_id, agent)
+
+    tokens = agent.run_agent_stream(req.query, session_id)
+
+    return StreamingResponse(
+        stream_chat(tokens, "UelloSendAgent", start, on_finish),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+
 @app.delete("/agent/sessions/support/{session_id}")
 @logfire.instrument()
 @limiter.limit("100 per day")
@@ -213,9 +378,8 @@ async def delete_uellosend_agent_session(session_id: str, request: Request):
     """
 
     try:
-        if session_id not in sessions:
+        if not await sessions.delete(session_id):
             raise HTTPException(status_code=404, detail= "Session not found")
-        del sessions[session_id]
 
         result = {
             "status": "ok",
@@ -241,22 +405,33 @@ async def delete_uellosend_agent_session(session_id: str, request: Request):
         )
     
 
+async def refresh_session_counts():
+    """
+    Counts the live sessions of both agents into their gauges every SESSION_COUNT_INTERVAL seconds
+    """
+    while True:
+        try:
+            set_gauge("sessions.live", await sessions.count(), agent="UelloSendAgent")
+            set_gauge("sessions.live", await count_query_sessions(), agent="QueryAgent")
+
+        except Exception as e:
+            logfire.error(
+                "Unhandled exception in counting live sessions",
+                exc_info=e
+            )
+
+        await asyncio.sleep(SESSION_COUNT_INTERVAL)
+
+
 async def cleanup_session():
     """
     Function to clean up idle sessions that were stored directly in memory
     """
     try:
         while True:
-            current_time = time.time()
+            await sessions.cleanup()
 
-            session_ids = list(sessions.keys())
-
-            for session_id in session_ids:
-                if current_time - sessions[session_id].last_accessed > SESSION_TIMEOUT:
-                    del sessions[session_id]
-
-            #Check every 1h
-            await asyncio.sleep(3600)
+            await asyncio.sleep(SESSION_CLEANUP_INTERVAL)
         
 
     except Exception as e:
@@ -278,21 +453,18 @@ class ScrapperRequest(BaseModel):
     admin_key: str
 
 
-#Create connection to redis
-redis_client = Redis(host=os.getenv("REDIS_HOST"), port=int(os.getenv("REDIS_PORT")), db=0, decode_responses=False)
-
-
 #Set session key for redis
 SESSION_PREFIX = "uelloagent_session:"
 
 @logfire.instrument()
-async def save_session_to_redis(session_id: str, messages: List[str]):
+@timed("redis")
+async def save_session_to_redis(session_id: str, messages: List[Dict]):
     """
     Stores QueryAgent message history into redis server
     """
     try:
-        serialized_message = pickle.dumps(messages)
-        redis_client.setex(
+        serialized_message = encode_session(messages)
+        await get_redis_client().setex(
             f"{SESSION_PREFIX}{session_id}",
             SESSION_TIMEOUT,
             serialized_message
@@ -305,22 +477,33 @@ async def save_session_to_redis(session_id: str, messages: List[str]):
         )
 
 
+async def count_query_sessions() -> int:
+    """
+    Counts the QueryAgent sessions stored in redis
+    """
+    count = 0
+
+    async for _ in get_redis_client().scan_iter(match=f"{SESSION_PREFIX}*", count=1000):
+        count += 1
+
+    return count
+
+
 @logfire.instrument()
+@timed("redis")
 async def load_messages_from_redis(session_id: str):
     """
     Loads QueryAgent message history from redis server
     """
     try:
-        deserialized_message = redis_client.get(f"{SESSION_PREFIX}{session_id}")
+        #GETEX loads the history and updates the session_timeout in one round trip
+        deserialized_message = await get_redis_client().getex(
+            f"{SESSION_PREFIX}{session_id}",
+            ex=SESSION_TIMEOUT
+        )
 
         if deserialized_message:
-            #Update the session_timeout
-            redis_client.expire(
-                f"{SESSION_PREFIX}{session_id}",
-                SESSION_TIMEOUT
-            )
-
-            return pickle.loads(deserialized_message)
+            return decode_session(deserialized_message)
         
 
     except Exception as e:
@@ -359,7 +542,7 @@ async def chat_query_agent(req: ChatRequest, request: Request):
         response = await agent.generate_response(req.query, session_id)
 
         #save the updated agent
-        await save_session_to_redis(session_id, agent.chat_history)
+        await save_session_to_redis(session_id, agent.export_history())
 
         res_data = {
             "status": "ok",
@@ -388,12 +571,66 @@ async def chat_query_agent(req: ChatRequest, request: Request):
     
 
 
+@app.post("/agent/query/chat/stream")
+@logfire.instrument()
+@limiter.limit("100 per day")
+async def chat_query_agent_stream(req: ChatRequest, request: Request):
+    """
+    Streaming version of /agent/query/chat, tokens are sent as Server-Sent Events as they arrive from the LLM.
+    Each token is sent as a "data" event, a final "done" event carries the full message.
+    The session is saved to redis once the stream finishes.
+    """
+    start = time.perf_counter()
+    session_id = req.session_id
+
+    try:
+        #Attempt to load agent
+        messages = await load_messages_from_redis(session_id)
+
+        agent = QueryAgent(messages or [])
+
+    except Exception as e:
+        logfire.error(
+            "Unhandled exception in query chat stream",
+            exc_info=e, 
+            extra={"session_id": req.session_id, "query": req.query}
+        )
+
+        raise HTTPException(
+            status_code= status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail= "An unexpected internal error occurred. Please try again later."
+        )
+
+    async def on_finish():
+        #save the updated agent
+        await save_session_to_redis(session_id, agent.export_history())
+
+    tokens = agent.generate_response_stream(req.query, session_id)
+
+    return StreamingResponse(
+        stream_chat(tokens, "QueryAgent", start, on_finish),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+
 @app.get("/agent/query/chat/messages/{admin_key}")
 @logfire.instrument()
 @limiter.limit("100 per day")
-async def query_messages(admin_key: str, request: Request):
+async def query_messages(
+    admin_key: str,
+    request: Request,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[int] = None,
+    session_id: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    format: Literal["json", "ndjson"] = "json"
+):
     """
     Endpoint to retrieve QueryAgent chat messages. These are messages that does not involve tool calling
+    Returns one page of messages, pass next_cursor back as cursor to get the next page.
+    Use format=ndjson to stream every matching message instead.
     """
 
     try:
@@ -401,19 +638,27 @@ async def query_messages(admin_key: str, request: Request):
 
         if admin_key == ADMIN_KEY:
 
-            data = await fetch_QueryAgent_messages()
+            if format == "ndjson":
+                rows = stream_QueryAgent_messages(session_id=session_id, start_date=start_date, end_date=end_date)
+
+                #log data to logfire dashboard
+                logfire.info("Streaming messages", extra={"session_id": session_id})
+
+                return StreamingResponse(messages_to_ndjson(rows), media_type="application/x-ndjson")
+
+            data, next_cursor = await fetch_QueryAgent_messages(limit, cursor, session_id, start_date, end_date)
             
             result = {
                 "status": "ok",
-                "messages": data
+                "messages": data,
+                "next_cursor": next_cursor
             }
 
-        #log data to logfire dashboard
-        logfire.info("Sending response", extra={"response_data_length": len(data)})
+            #log data to logfire dashboard
+            logfire.info("Sending response", extra={"response_data_length": len(data)})
 
         return result
 
-
     except Exception as e:
         response = f"Error - {str(e)}"
 
@@ -438,10 +683,9 @@ async def delete_query_agent_session(session_id: str, request: Request):
     try:
         key = f"{SESSION_PREFIX}{session_id}"
 
-        if not redis_client.exists(key) :
+        #DELETE returns the number of removed keys, so the check and delete is one round trip
+        if not await get_redis_client().delete(key):
             raise HTTPException(status_code=404, detail= "Session not found")
-        
-        redis_client.delete(key)
 
         result = {
             "status": "ok",
@@ -467,28 +711,27 @@ async def delete_query_agent_session(session_id: str, request: Request):
         )
 
  
-@app.post("/scraper")
+@app.post("/scraper", status_code=status.HTTP_202_ACCEPTED)
 @logfire.instrument()
 @limiter.limit("100 per day")
 async def scrapper(req: ScrapperRequest, request: Request):
     """
-    Endpoint takes a list of urls, scrape the content from the sites and index everything into a vector database
+    Endpoint takes a list of urls and queues a job that scrapes the sites and indexes everything into a vector database.
+    The job runs in the indexing worker (worker.py), its progress is reported by /scraper/jobs/{job_id}/{admin_key}
     """
 
     try:
-        res_data = {"status": "ok", "messages": "Unauthorized"}
-        if req.admin_key == ADMIN_KEY:
-
-            agent = QueryAgent([])
+        #The route answers 202, a wrong key must not look like an accepted job
+        if req.admin_key != ADMIN_KEY:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
 
-            docsuments = await agent.scrape_web_content(req.urls)
+        job = await enqueue_index_job(req.urls, os.getenv("QDRANT_COLLECTION"))
 
-            result = await agent.embed_and_save_documents(docsuments)
-
-            res_data = {
-                "status": "ok",
-                "message": result
-            }
+        res_data = {
+            "status": "ok",
+            "message": "Indexing job queued",
+            "job_id": job["id"]
+        }
 
         #log data to logfire dashboard
         logfire.info("Sending response", extra={"response_data": res_data})
@@ -496,6 +739,9 @@ async def scrapper(req: ScrapperRequest, request: Request):
         return res_data
         
 
+    except HTTPException:
+        raise
+
     except Exception as e:
         response = f"Error - {str(e)}"
 
@@ -509,3 +755,44 @@ async def scrapper(req: ScrapperRequest, request: Request):
             detail= f"An unexpected internal error occurred: {response}"
         )
 
+
+
+@app.get("/scraper/jobs/{job_id}/{admin_key}")
+@logfire.instrument()
+@limiter.limit("1000 per day")
+async def scrapper_job_status(job_id: str, admin_key: str, request: Request):
+    """
+    Endpoint reports the status, stage, progress and counts of an indexing job
+    """
+
+    try:
+        if admin_key != ADMIN_KEY:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
+
+        job = await get_index_job(job_id)
+
+        if job is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+
+        res_data = {
+            "status": "ok",
+            "job": job
+        }
+
+        return res_data
+
+    except HTTPException:
+        raise
+
+    except Exception as e:
+        response = f"Error - {str(e)}"
+
+        logfire.error(
+            "Unhandled exception in scraper job status",
+            exc_info=e
+        )
+
+        raise HTTPException(
+            status_code= status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail= f"An unexpected internal error occurred: {response}"
+        )
@@ -3,27 +3,66 @@
 ####
 
 import os
+import asyncio
 from dotenv import load_dotenv
 from google import generativeai as genai
-from google.generativeai import types
+from google.generativeai import types, protos
 import uuid
-from typing import Dict, Callable
+from typing import Dict, Callable, List
 
 
 from src.utils.define_tools import TOOLS_SCHEMA
 from src.utils.define_system_prompt import SYSTEM_PROMPT
 from src.tools.tool_set import verify_customer_exist, fix_credit_topup_issue, resend_account_verification_link, send_password_reset_link
+from src.tools.tool_set import CUSTOMER_DEADLINE, TRANSACTION_DEADLINE, VERIFICATION_DEADLINE, RESET_DEADLINE
 from src.utils.manage_db import insert_UelloSendAgent_messages
+from src.utils.manage_metrics import time_stage, increment_counter
+from src.utils.manage_resources import get_gemini_router
 
 load_dotenv()
 
+#Rounds of tool calls in one turn before the model has to answer
+TOOL_MAX_ROUNDS = int(os.getenv("TOOL_MAX_ROUNDS", "5"))
+
+#Sent instead of an answer when the model still calls tools after TOOL_MAX_ROUNDS rounds
+TOOL_ROUNDS_EXHAUSTED_MESSAGE = "Sorry, I could not finish checking this for you. Please try again or contact UelloSend support."
+
+
+#genai.configure drops the existing API clients, so it only runs once per worker
+_gemini_configured = False
+
+
+def configure_gemini(transport: str = None):
+    """
+    Configures the Gemini SDK the first time an agent is created
+    """
+    global _gemini_configured
+
+    if _gemini_configured:
+        return
+
+    #GEMINI_API_ENDPOINT and GEMINI_TRANSPORT allow pointing the agent at a local stand-in
+    api_endpoint = os.getenv("GEMINI_API_ENDPOINT")
+    genai.configure(
+        api_key=os.getenv("GEMINI_API_KEY"),
+        transport=transport,
+        client_options={"api_endpoint": api_endpoint} if api_endpoint else None
+    )
+
+    _gemini_configured = True
+
+
 class UelloSendAgent:
-    def __init__(self):
-        self.model = os.getenv("GEMINI_MODEL")
+    def __init__(self, history: List[Dict] = None):
+        #Models in order of preference, the router picks the one of each request
+        self.router = get_gemini_router()
+        self.model = self.router.endpoints[0].name
+        self.transport = os.getenv("GEMINI_TRANSPORT") or None
         self.system_prompt = SYSTEM_PROMPT
         self.available_tools = self._register_tools()
         self.config_tools = types.Tool(function_declarations=TOOLS_SCHEMA)
-        self.conversation = self._init_conversation_client()
+        self.clients = {}
+        self.conversation = self._init_conversation_client(history)
         self.chat_history = {}
 
 
@@ -34,68 +73,194 @@ class UelloSendAgent:
         available_tools = {}
         available_tools["verify_customer_exist"] = {
             "name": "verify_customer_exist",
-            "function": verify_customer_exist
+            "function": verify_customer_exist,
+            "timeout": CUSTOMER_DEADLINE
         }
 
         available_tools["fix_credit_topup_issue"] = {
             "name": "fix_credit_topup_issue",
-            "function": fix_credit_topup_issue
+            "function": fix_credit_topup_issue,
+            "timeout": TRANSACTION_DEADLINE
         }
 
         available_tools["resend_account_verification_link"] = {
             "name": "resend_account_verification_link",
-            "function": resend_account_verification_link
+            "function": resend_account_verification_link,
+            "timeout": VERIFICATION_DEADLINE
         }
 
         available_tools["send_password_reset_link"] = {
             "name": "send_password_reset_link",
-            "function": send_password_reset_link
+            "function": send_password_reset_link,
+            "timeout": RESET_DEADLINE
         }
 
         return available_tools
 
 
-    def _init_conversation_client(self):
+    def _init_conversation_client(self, history: List[Dict] = None, model: str = None):
         """
-        Initializes the chat client to be used by the agent
+        Initializes the chat client to be used by the agent, continuing from a stored history if given
         """
-        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-        client = genai.GenerativeModel(
-            model_name=self.model,
-            system_instruction=self.system_prompt,
-            tools=self.config_tools
-        )
+        configure_gemini(self.transport)
+        model = model or self.model
 
-        conversation = client.start_chat()
+        if model not in self.clients:
+            self.clients[model] = genai.GenerativeModel(
+                model_name=model,
+                system_instruction=self.system_prompt,
+                tools=self.config_tools
+            )
+
+        conversation = self.clients[model].start_chat(history=history or [])
 
         return conversation
     
 
-    async def execute_functions(self, function_to_call: Callable, func_args, func_name: str) -> Dict:
+    async def execute_functions(self, function_to_call: Callable, func_args, func_name: str, timeout: float) -> Dict:
         """
-        Executes functions called by the agent
+        Executes functions called by the agent, a call that takes longer than its timeout is cancelled
         """
         
         try:
-            function_response = function_to_call(**func_args)
-            
-            # Send tool result back to the model
-            
-            rs=f"Tool called: {func_name} and result is: {function_response}"
-            tool_response = {
-                "parts": rs
-            }
+            function_response = await asyncio.wait_for(function_to_call(**func_args), timeout)
+
+            tool_response = {"result": function_response}
+
+        except asyncio.TimeoutError:
+            increment_counter("tool.timeouts", tool=func_name)
+
+            tool_response = {"error": f"Timed out after {timeout} seconds"}
 
         except Exception as e:
 
-            rs=f"Tool called: {func_name} and result is: Error - {str(e)}"
-            tool_response = {
-                "parts": rs
-            }
+            #Some errors have no message (e.g. httpx.ReadTimeout), the model still needs to know what failed
+            tool_response = {"error": str(e) or type(e).__name__}
 
         return tool_response
+
+
+    async def execute_function_calls(self, function_calls: List, session_id: str) -> List[protos.Part]:
+        """
+        Runs all function calls of one model response at the same time.
+        Returns one function response part per call, they go back to the model in a single message.
+        """
+        calls = []
+
+        for function_call in function_calls:
+            func_name = function_call.name
+            print(f"Tool called: {func_name}")
+
+            ms = f"Tool called: {func_name}"
+            await insert_UelloSendAgent_messages(session_id, "model", ms)
+
+            tool = self.available_tools.get(func_name)
+
+            if tool is None:
+                calls.append(asyncio.sleep(0, result={"error": f"Unknown tool: {func_name}"}))
+            else:
+                calls.append(self.execute_functions(tool["function"], function_call.args, func_name, tool["timeout"]))
+
+        #The turn waits for the slowest tool instead of the sum of all of them
+        with time_stage("support_agent", "tool"):
+            tool_responses = await asyncio.gather(*calls)
+
+        parts = []
+
+        for function_call, tool_response in zip(function_calls, tool_responses):
+            await insert_UelloSendAgent_messages(session_id, "tool", f"Tool called: {function_call.name} and result is: {tool_response}")
+
+            parts.append(protos.Part(function_response=protos.FunctionResponse(name=function_call.name, response=tool_response)))
+
+        return parts
     
 
+    async def _send(self, conversation, content):
+        """
+        Sends a message on the given chat without blocking the event loop
+        """
+        if self.transport == "rest":
+            #The async Gemini client only supports gRPC, run the REST call in a worker thread
+            return await asyncio.to_thread(conversation.send_message, content)
+
+        return await conversation.send_message_async(content)
+
+
+    async def _open_stream(self, conversation, content):
+        """
+        Starts a streamed message on the given chat and waits for its first chunk.
+        Returns the first chunk and a coroutine function that returns the next one, None at the end.
+        """
+        if self.transport == "rest":
+            #Read the REST stream in a worker thread, one chunk at a time
+            response = await asyncio.to_thread(conversation.send_message, content, stream=True)
+            chunks = iter(response)
+
+            async def next_chunk():
+                return await asyncio.to_thread(next, chunks, None)
+
+        else:
+            response = await conversation.send_message_async(content, stream=True)
+            chunks = response.__aiter__()
+
+            async def next_chunk():
+                return await anext(chunks, None)
+
+        return await next_chunk(), next_chunk
+
+
+    async def send_message(self, content):
+        """
+        Sends a message to the model without blocking the event loop.
+        Every attempt of the router runs on its own copy of the chat, the chat of the attempt that
+        answered becomes the conversation, so a failed or cancelled attempt leaves no trace in the history.
+        """
+        history = list(self.conversation.history)
+
+        async def attempt(endpoint):
+            conversation = self._init_conversation_client(history, endpoint.name)
+
+            return conversation, await self._send(conversation, content)
+
+        self.conversation, response = await self.router.call(attempt)
+
+        return response
+
+
+    async def stream_message(self, content):
+        """
+        Sends a message to the model and yields the response chunks as they arrive.
+        The router can fail over until the first chunk arrives, after that the stream stays on its model.
+        """
+        history = list(self.conversation.history)
+
+        async def attempt(endpoint):
+            conversation = self._init_conversation_client(history, endpoint.name)
+
+            return conversation, await self._open_stream(conversation, content)
+
+        #No hedging, the losing stream would keep running in its worker thread
+        self.conversation, (chunk, next_chunk) = await self.router.call(attempt, hedge=False)
+
+        while chunk is not None:
+            yield chunk
+            chunk = await next_chunk()
+
+
+    def _end_unfinished_turn(self) -> str:
+        """
+        Ends a turn whose last response still asks for tools. The unanswered function calls are replaced
+        with the fallback message, so the history stays valid for the next turn.
+        """
+        increment_counter("tool.rounds_exhausted")
+
+        history = list(self.conversation.history)
+        history[-1] = protos.Content(role="model", parts=[protos.Part(text=TOOL_ROUNDS_EXHAUSTED_MESSAGE)])
+        self.conversation.history = history
+
+        return TOOL_ROUNDS_EXHAUSTED_MESSAGE
+
+
     async def run_agent(self, user_prompt: str, session_id: str):
         """
         Main function that combines everything in this class to generate responses.
@@ -103,45 +268,75 @@ class UelloSendAgent:
         """
         
         await insert_UelloSendAgent_messages(session_id, "user", user_prompt)
-        responses = self.conversation.send_message(user_prompt)
+
+        with time_stage("support_agent", "llm"):
+            responses = await self.send_message(user_prompt)
         
         
         # Process function calls made by the model
-        responses_list = []
-        responses_list.append(responses)
+        for _ in range(TOOL_MAX_ROUNDS):
 
-        while responses_list:
+            function_calls = [part.function_call for part in responses.candidates[0].content.parts if part.function_call.name]
 
-            tool_calls = responses.candidates[0].content.parts
+            if not function_calls:
+                break
 
-            
-            for part in tool_calls:
+            tool_responses = await self.execute_function_calls(function_calls, session_id)
 
-                if part.function_call.name:
-                    func_name = part.function_call.name
-                    function_to_call = self.available_tools[func_name]
-                    func_args = part.function_call.args
-                
-                    print(f"Tool called: {func_name}")
+            #Send all tool results back to the agent in one message
+            with time_stage("support_agent", "llm"):
+                responses = await self.send_message(tool_responses)
 
 
-                    ms = f"Tool called: {func_name}"
-                    await insert_UelloSendAgent_messages(session_id, "model", ms)
+        #The last round can still ask for tools, it has no text to read
+        if any(part.function_call.name for part in responses.candidates[0].content.parts):
+            text = self._end_unfinished_turn()
+        else:
+            text = responses.text
 
-                    tool_response = await self.execute_functions(function_to_call["function"], func_args, func_name)
-                    await insert_UelloSendAgent_messages(session_id, "tool", str(tool_response))
+        await insert_UelloSendAgent_messages(session_id, "model", text)
+        return text
 
 
-                    #Send tool call response to the agent
-                    responses = self.conversation.send_message(tool_response)
-                    await insert_UelloSendAgent_messages(session_id, "model", responses.text)
+    async def run_agent_stream(self, user_prompt: str, session_id: str):
+        """
+        Same as run_agent but yields the model text as it is generated.
+        Tool calls are executed as they come in and their results are streamed back to the model.
+        """
+
+        await insert_UelloSendAgent_messages(session_id, "user", user_prompt)
+
+        message = user_prompt
 
-            #remove response from list        
-            responses_list.pop(0)
+        #The first message plus TOOL_MAX_ROUNDS rounds of tool results, the same as run_agent
+        for tool_round in range(TOOL_MAX_ROUNDS + 1):
+            function_calls = []
+            text = []
 
+            async for chunk in self.stream_message(message):
+                for part in chunk.candidates[0].content.parts:
 
-        await insert_UelloSendAgent_messages(session_id, "model", responses.text)
-        return responses.text
+                    if part.function_call.name:
+                        function_calls.append(part.function_call)
+
+                    elif part.text:
+                        text.append(part.text)
+                        yield part.text
+
+            if text:
+                await insert_UelloSendAgent_messages(session_id, "model", "".join(text))
+
+            if not function_calls:
+                break
+
+            if tool_round == TOOL_MAX_ROUNDS:
+                fallback = self._end_unfinished_turn()
+                await insert_UelloSendAgent_messages(session_id, "model", fallback)
+                yield fallback
+                break
+
+            #Send all tool results back to the agent in one message on the next round
+            message = await self.execute_function_calls(function_calls, session_id)
 
 
     async def create_new_chat(self):
@@ -155,6 +350,16 @@ class UelloSendAgent:
         return chat_id
 
 
+    def export_history(self) -> List[Dict]:
+        """
+        Returns the conversation history as compact dicts, pass them back in as history to rehydrate the chat
+        """
+        return [
+            protos.Content.to_dict(content, always_print_fields_with_no_presence=False)
+            for content in self.conversation.history
+        ]
+
+
     async def return_chat_history(self):
         """Returns the chat history """
         return self.conversation.history
@@ -4,42 +4,85 @@ load_dotenv()
 USER_AGENT = os.getenv("USER_AGENT")
 
 
-from typing import List, Dict
-from langchain_community.document_loaders import WebBaseLoader
+import asyncio
+from typing import Callable, List, Dict
 from langchain.docstore.document import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_qdrant import QdrantVectorStore
-from qdrant_client import QdrantClient
-from openai import OpenAI
 
 from src.utils.define_system_prompt import RAG_SYSTEM_PROMPT
 from src.utils.manage_db import insert_QueryAgent_messages
+from src.utils.manage_resources import get_embedding_client, get_embedding_service, get_qdrant_client, get_chat_client, get_llm_semaphore, get_chat_router
+from src.utils.manage_history import HistoryManager, count_message_tokens
+from src.utils.manage_metrics import record_histogram, time_stage
+from src.utils.manage_answer_cache import answer_cache
+from src.utils.manage_embedding_cache import embedding_cache
+from src.utils.manage_index import index_documents, search_params
+from src.utils.manage_crawler import WebCrawler, CrawlResult
 
 
 class QueryAgent:
 
     def __init__(self, messages):
-        self.qdrant_url = os.getenv("QDRANT_HOST")
-        self.qdrant_client = QdrantClient(url=self.qdrant_url)
+        #Model and clients are shared by every session in this worker, only the chat history belongs to the agent
+        self.qdrant_client = get_qdrant_client()
         self.qdrant_collection = os.getenv("QDRANT_COLLECTION")
-        self.embedding_client = HuggingFaceEmbeddings(
-                    model_name = os.getenv("HUG_EMBED_MODEL"),
-                    model_kwargs={"device": "cpu"}
-                )
+        self.embedding_client = get_embedding_client()
+        self.embedding_service = get_embedding_service()
         self.system_prompt = RAG_SYSTEM_PROMPT
-        self.chat_client = OpenAI(
-            base_url=os.getenv("OPEN_ROUTER_URL"),
-            api_key=os.getenv("OPEN_ROUTER_KEY")
+        self.chat_client = get_chat_client()
+        self.history_manager = HistoryManager()
+        self.crawler = WebCrawler()
+
+        #The history only holds user/assistant turns, older turns are folded into the summary
+        self.summary = ""
+        self.chat_history = []
+        for message in messages:
+            if message["role"] == "summary":
+                self.summary = message["content"]
+            elif message["role"] != "system":
+                self.chat_history.append(message)
+
+        #Prompt (with retrieved context) for the turn in progress
+        self.current_prompt = None
+
+        #Query vector, retrieved chunk ids and cache generation of the turn in progress, used to cache its answer
+        self.cache_probe = None
+
+
+    def export_history(self) -> List[Dict]:
+        """
+        Returns the chat history as compact role/content dicts for storage, the summary is stored as the first entry
+        """
+        summary = [{"role": "summary", "content": self.summary}] if self.summary else []
+
+        return summary + self.chat_history
+
+
+    def build_messages(self) -> List[Dict]:
+        """
+        Builds the messages for the LLM within the token budget: system prompt, rolling summary, recent turns
+        and the current prompt with its retrieved context
+        """
+        self.chat_history, self.summary = self.history_manager.fit(
+            self.system_prompt, self.chat_history, self.summary, self.current_prompt
+        )
+
+        messages = self.history_manager.build_messages(
+            self.system_prompt, self.chat_history, self.summary, self.current_prompt
         )
-        self.chat_history = messages
+
+        record_histogram("query_agent.prompt_tokens", count_message_tokens(messages), unit="{token}")
+
+        return messages
         
 
-    async def scrape_web_content(self, url: List[str]) -> List[Document]:
+    async def scrape_web_content(self, url: List[str], on_progress: Callable[[int, int], None] = None) -> CrawlResult:
         """
-        Web scrapper, uses langchain web loader to scrape website content
+        Web scrapper, crawls the urls concurrently and splits the pages that changed since the last run into chunks.
+        Returns the crawl result with the chunks as its documents.
         """
-        loader = WebBaseLoader(web_path=url)
+        crawl = await self.crawler.crawl(url, on_progress=on_progress)
 
         text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=500,
@@ -49,30 +92,79 @@ class QueryAgent:
             separators=["\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n", "\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n", "\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\r\n","\n\n\n\n\n\n\n\n\n\n\n\n", "\n\n\n\n\n\n\n\n\n", "\n\n", "\n"] 
         )
 
-        doc = loader.load()
-
-        doc_chunks = text_splitter.split_documents(doc)
+        crawl.documents = await asyncio.to_thread(text_splitter.split_documents, crawl.documents)
 
-        return doc_chunks
+        return crawl
     
 
-    async def embed_and_save_documents(self, doc_chunks: List[Document]):
+    async def embed_and_save_documents(self, doc_chunks: List[Document], sources: List[str] = None, on_progress: Callable[[int, int], None] = None) -> Dict[str, int]:
         """
-        Embeds and stores embeddings to qdrant vector database
+        Embeds and stores embeddings to qdrant vector database.
+        Indexing is incremental: unchanged chunks are skipped and chunks that disappeared from the
+        scraped sources are deleted. Returns the added/updated/unchanged/removed counts.
         """
-        vector_store = QdrantVectorStore.from_documents(
-            documents=doc_chunks,
-            embedding=self.embedding_client,
-            url = self.qdrant_url,
-            collection_name = self.qdrant_collection
+        #Embedding and qdrant calls are blocking, run them off the event loop
+        return await asyncio.to_thread(
+            index_documents,
+            self.qdrant_client,
+            self.embedding_client,
+            self.qdrant_collection,
+            doc_chunks,
+            sources,
+            on_progress=on_progress
         )
 
-        return f"{len(doc_chunks)} documents have been indexed."
 
+    async def index_urls(self, urls: List[str], on_progress: Callable[[str, float], None] = None) -> Dict:
+        """
+        Runs the whole indexing pipeline for the urls: crawl, split, incremental index, save the crawl validators
+        and invalidate cached answers when the index changed.
+        on_progress is called with the current stage and the overall progress between 0 and 1.
+        """
+        def report(stage: str, low: float, high: float):
+            #Maps the progress of one stage onto its share of the whole job
+            def callback(done: int, total: int):
+                if on_progress:
+                    on_progress(stage, low + (high - low) * (done / total if total else 1))
+            return callback
+
+        crawl = await self.scrape_web_content(urls, on_progress=report("crawling", 0.0, 0.5))
+
+        if on_progress:
+            on_progress("indexing", 0.5)
 
-    async def retrieve_context(self, query: str):
+        counts = await self.embed_and_save_documents(
+            crawl.documents, sources=crawl.changed_sources, on_progress=report("indexing", 0.5, 0.95)
+        )
+
+        if on_progress:
+            on_progress("saving", 0.95)
+
+        await self.crawler.save_validators(crawl)
+
+        #Answers built on the old index must not be served anymore
+        if counts["added"] or counts["updated"] or counts["removed"]:
+            await answer_cache.invalidate()
+
+        return {
+            "chunks": len(crawl.documents),
+            "pages": crawl.summary(),
+            "counts": counts
+        }
+
+
+    async def embed_query(self, query: str) -> List[float]:
         """
-        Embeds query and then search for semantically similar contents
+        Returns the query vector, repeated and trivially different queries are served from the embedding cache
+        """
+        with time_stage("query_agent", "embedding"):
+            return await embedding_cache.get_or_embed(query, self.embedding_service.embed_query)
+
+
+    async def retrieve_context(self, query: str, query_vector: List[float] = None):
+        """
+        Embeds query and then search for semantically similar contents.
+        An already computed query vector can be passed in so the query is only embedded once.
         """
         vector_store = QdrantVectorStore(
             client=self.qdrant_client,
@@ -80,13 +172,18 @@ class QueryAgent:
             collection_name=self.qdrant_collection
         )
 
-        results = vector_store.similarity_search(query=query, k=5)
+        if query_vector is None:
+            query_vector = await self.embed_query(query)
+
+        with time_stage("query_agent", "qdrant_search"):
+            results = vector_store.similarity_search_by_vector(embedding=query_vector, k=5, search_params=search_params())
 
         if results:
             context = []
             
             for res in results:
                 data = {
+                    "id": res.metadata.get("_id"),
                     "text": res.page_content,
                     "url": res.metadata["source"],
                     "title": res.metadata["title"]
@@ -98,47 +195,43 @@ class QueryAgent:
             return context
         return None
     
-    async def generate_response(self, query: str, session_id: str):
+    async def prepare_prompt(self, query: str, session_id: str):
         """
-        Main function that combines everything in this class to generate responses.
-        uses free model from OPEN ROUTER and OpenAI API to interact with LLM
+        Adds the user query (with retrieved context) to the chat history.
+        Returns None when the LLM should be called, or a reply to send back directly when no context was found.
         """
 
-        #Check for first time agent call so that system prompt can be added to the message
+        #Check for first time agent call, the greeting does not need any context
         if len(self.chat_history) == 0:
-            self.chat_history.append({
-                "role": "system",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": self.system_prompt
-                    }
-                ]
-            })
-
-            self.chat_history.append({
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": query
-                    }
-                    ]
-                })
+            self.chat_history.append({"role": "user", "content": query})
+            self.current_prompt = query
 
             await insert_QueryAgent_messages(session_id, "user", query)
 
-
-            res_message = await self.generater(session_id= session_id)
-            
-
-            return res_message
+            return None
 
 
-        contexts = await self.retrieve_context(query)
+        query_vector = await self.embed_query(query)
+        contexts = await self.retrieve_context(query, query_vector)
 
         #If contextual information is found
         if contexts:
+            context_ids = [ctx["id"] for ctx in contexts]
+
+            #A similar question answered from the same chunks is served from the cache without calling the LLM
+            with time_stage("query_agent", "answer_cache"):
+                cached_answer, generation = await answer_cache.lookup(query_vector, context_ids)
+
+            if cached_answer is not None:
+                self.chat_history.append({"role": "user", "content": query})
+                self.chat_history.append({"role": "assistant", "content": cached_answer})
+
+                await insert_QueryAgent_messages(session_id, "user", query)
+                await insert_QueryAgent_messages(session_id, "model", cached_answer)
+
+                return cached_answer
+
+            self.cache_probe = (query_vector, context_ids, generation)
 
             # Construct prompt with retrieved contexts
             prompt = f"""Answer the following question based on the provided context information. If the answer cannot be found in the context, say "I don't have enough information to answer this question."
@@ -150,21 +243,13 @@ class QueryAgent:
 
             Answer:"""
 
-            self.chat_history.append({
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": prompt
-                    }
-                    ]
-                })
+            #Only the bare question is kept in the history, the context is sent with this turn only
+            self.chat_history.append({"role": "user", "content": query})
+            self.current_prompt = prompt
             
             await insert_QueryAgent_messages(session_id, "user", prompt)
 
-            res_message = await self.generater(session_id=session_id)
-
-            return res_message
+            return None
         
 
         #If no contextual information found
@@ -173,6 +258,33 @@ class QueryAgent:
         await insert_QueryAgent_messages(session_id, "model", res_message)
 
         return res_message
+
+
+    async def generate_response(self, query: str, session_id: str):
+        """
+        Main function that combines everything in this class to generate responses.
+        uses free model from OPEN ROUTER and OpenAI API to interact with LLM
+        """
+        res_message = await self.prepare_prompt(query, session_id)
+
+        if res_message is None:
+            res_message = await self.generater(session_id=session_id)
+
+        return res_message
+
+
+    async def generate_response_stream(self, query: str, session_id: str):
+        """
+        Same as generate_response but yields the response token by token as the LLM produces it
+        """
+        res_message = await self.prepare_prompt(query, session_id)
+
+        if res_message is not None:
+            yield res_message
+            return
+
+        async for token in self.generater_stream(session_id=session_id):
+            yield token
     
 
 
@@ -181,19 +293,105 @@ class QueryAgent:
         Generates responses uses free model from OPEN ROUTER and OpenAI API to interact with LLM
         """
 
-        responses = self.chat_client.chat.completions.create(
-                extra_body={},
-                model=os.getenv("OPEN_ROUTER_MODEL"),
-                messages=self.chat_history,
-                temperature=0.2,
-                seed=23
-            )
-        
-        self.chat_history.append(responses.choices[0].message)
+        messages = self.build_messages()
+
+        async def attempt(endpoint):
+            return await self.chat_client.chat.completions.create(
+                    extra_body={},
+                    model=endpoint.name,
+                    messages=messages,
+                    temperature=0.2,
+                    seed=23
+                )
+
+        #Await the completion so other requests keep running, the semaphore caps concurrent LLM calls
+        async with get_llm_semaphore():
+            with time_stage("query_agent", "llm"):
+                #Fails over to the next model in OPEN_ROUTER_MODELS and may hedge a slow request
+                responses = await get_chat_router().call(attempt)
 
         res_message = responses.choices[0].message.content
+
+        self.chat_history.append({
+            "role": "assistant",
+            "content": res_message
+        })
         #print(f"response - {res_message}")
         await insert_QueryAgent_messages(session_id, "model", res_message)
+        await self.cache_answer(res_message)
 
         return res_message
-        
\ No newline at end of file
+
+
+    async def generater_stream(self, session_id):
+        """
+        Streams the response from OPEN ROUTER, the chat history and database are updated once the stream finishes
+        """
+        tokens = []
+
+        messages = self.build_messages()
+
+        async def attempt(endpoint):
+            stream = await self.chat_client.chat.completions.create(
+                    extra_body={},
+                    model=endpoint.name,
+                    messages=messages,
+                    temperature=0.2,
+                    seed=23,
+                    stream=True
+                )
+
+            #A model that fails before its first chunk can still be replaced
+            chunks = stream.__aiter__()
+            try:
+                first_chunk = await chunks.__anext__()
+            except StopAsyncIteration:
+                first_chunk = None
+
+            return first_chunk, chunks
+
+        async with get_llm_semaphore():
+            #Covers the whole stream, the time to first token is recorded by the endpoint
+            with time_stage("query_agent", "llm"):
+                #No hedging, the losing stream would hold its connection open until it is read
+                first_chunk, chunks = await get_chat_router().call(attempt, hedge=False)
+
+                if first_chunk is not None:
+                    async for chunk in self._chain(first_chunk, chunks):
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            tokens.append(chunk.choices[0].delta.content)
+                            yield chunk.choices[0].delta.content
+
+        res_message = "".join(tokens)
+
+        self.chat_history.append({
+            "role": "assistant",
+            "content": res_message
+        })
+
+        await insert_QueryAgent_messages(session_id, "model", res_message)
+        await self.cache_answer(res_message)
+
+
+    @staticmethod
+    async def _chain(first_chunk, chunks):
+        """
+        Yields the chunk read by the router, then the rest of the stream
+        """
+        yield first_chunk
+
+        async for chunk in chunks:
+            yield chunk
+
+
+    async def cache_answer(self, res_message: str):
+        """
+        Stores the answer of a turn that retrieved context so similar questions can reuse it
+        """
+        if self.cache_probe is None:
+            return
+
+        query_vector, context_ids, generation = self.cache_probe
+        self.cache_probe = None
+
+        await answer_cache.store(query_vector, context_ids, res_message, generation)
@@ -0,0 +1,80 @@
+####
+# Shared HTTP layer used by the tools to call the UelloSend API.
+# Requests go through one pooled keep-alive client, every endpoint has its own timeouts
+# and only idempotent lookups are retried.
+####
+
+import os
+import asyncio
+import random
+import time
+import httpx
+import logfire
+from dotenv import load_dotenv
+
+from src.utils.manage_resources import get_tool_http_client
+from src.utils.manage_metrics import record_duration
+
+load_dotenv()
+
+TOOL_CONNECT_TIMEOUT = float(os.getenv("TOOL_CONNECT_TIMEOUT", "3"))
+TOOL_MAX_RETRIES = int(os.getenv("TOOL_MAX_RETRIES", "2"))
+TOOL_RETRY_BACKOFF = float(os.getenv("TOOL_RETRY_BACKOFF", "0.2"))
+
+#Gateway errors are worth another attempt, anything else is returned to the tool as is
+RETRY_STATUS_CODES = {502, 503, 504}
+
+
+def request_budget(read_timeout: float, idempotent: bool = False, connect_timeout: float = TOOL_CONNECT_TIMEOUT) -> float:
+    """
+    Longest time post_json can take for one call: every attempt running into its timeouts plus the
+    longest backoff between them. A caller that gives up earlier cuts off retries that could still succeed.
+    """
+    attempts = 1 + (TOOL_MAX_RETRIES if idempotent else 0)
+    backoff = sum(TOOL_RETRY_BACKOFF * (2 ** attempt) for attempt in range(attempts - 1))
+
+    return attempts * (connect_timeout + read_timeout) + backoff
+
+
+async def post_json(url: str, data: dict, tool: str, read_timeout: float, idempotent: bool = False) -> dict:
+    """
+    Sends a JSON POST request with the shared pooled client and returns the decoded JSON response.
+    Idempotent lookups are retried up to TOOL_MAX_RETRIES times with jittered exponential backoff,
+    mutating calls are sent exactly once.
+    """
+    client = get_tool_http_client()
+    timeout = httpx.Timeout(read_timeout, connect=TOOL_CONNECT_TIMEOUT)
+    attempts = 1 + (TOOL_MAX_RETRIES if idempotent else 0)
+
+    start = time.perf_counter()
+    outcome = "error"
+
+    try:
+        for attempt in range(attempts):
+            try:
+                response = await client.post(url=url, json=data, timeout=timeout)
+
+                if response.status_code in RETRY_STATUS_CODES and attempt < attempts - 1:
+                    raise httpx.HTTPStatusError(
+                        f"Server error {response.status_code}", request=response.request, response=response
+                    )
+
+                outcome = "ok"
+                return response.json()
+
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                if attempt == attempts - 1:
+                    raise
+
+                #Full jitter so retries from many conversations do not hit the API at the same moment
+                delay = random.uniform(0, TOOL_RETRY_BACKOFF * (2 ** attempt))
+
+                logfire.warn(
+                    "Retrying tool request",
+                    extra={"tool": tool, "attempt": attempt + 1, "delay": delay, "error": str(e)}
+                )
+
+                await asyncio.sleep(delay)
+
+    finally:
+        record_duration("tool.latency", time.perf_counter() - start, tool=tool, outcome=outcome)
@@ -4,9 +4,12 @@
 
 import os
 from pydantic import EmailStr, validate_call
-import requests
 from dotenv import load_dotenv
 
+from src.tools.http_client import post_json, request_budget
+from src.utils.manage_metrics import timed
+from src.utils.manage_tool_cache import cached_tool
+
 load_dotenv()
 
 #Retrieve environment variables
@@ -15,9 +18,25 @@ TRANSACTION_URL = os.getenv("TRANSACTION_URL")
 VERIFICATION_URL = os.getenv("VERIFICATION_URL")
 RESET_URL = os.getenv("RESET_URL")
 
+#Read timeouts (seconds) for each endpoint
+CUSTOMER_TIMEOUT = float(os.getenv("CUSTOMER_TIMEOUT", "10"))
+TRANSACTION_TIMEOUT = float(os.getenv("TRANSACTION_TIMEOUT", "30"))
+VERIFICATION_TIMEOUT = float(os.getenv("VERIFICATION_TIMEOUT", "15"))
+RESET_TIMEOUT = float(os.getenv("RESET_TIMEOUT", "15"))
+
+#How long the agent waits for each tool, covers the retries of the idempotent lookup
+CUSTOMER_DEADLINE = request_budget(CUSTOMER_TIMEOUT, idempotent=True)
+TRANSACTION_DEADLINE = request_budget(TRANSACTION_TIMEOUT)
+VERIFICATION_DEADLINE = request_budget(VERIFICATION_TIMEOUT)
+RESET_DEADLINE = request_budget(RESET_TIMEOUT)
 
+
+#Read-only lookup, repeated and concurrent checks of the same email share one request.
+#The other tools change data on UelloSend and must never be cached
+@timed("tool_set")
+@cached_tool
 @validate_call
-def verify_customer_exist(customer_email: EmailStr)-> dict:
+async def verify_customer_exist(customer_email: EmailStr)-> dict:
     """
     This function checks the database to see if a customer exists for the provided email address.
     :param customer_email: Valid email address of the customer
@@ -26,10 +45,8 @@ def verify_customer_exist(customer_email: EmailStr)-> dict:
     # Prepare request parameters
     url = CUSTOMER_URL
     data = {'email': customer_email}
-    header = {'Content-Type': 'application/json'}
 
-    response = requests.post(url=url, headers=header, json=data)
-    res = response.json()
+    res = await post_json(url, data, tool="verify_customer_exist", read_timeout=CUSTOMER_TIMEOUT, idempotent=True)
 
     
     if  int(res["code"]) == 404:
@@ -41,8 +58,9 @@ def verify_customer_exist(customer_email: EmailStr)-> dict:
         return f"Error with request - {res['result']}"
     
 
+@timed("tool_set")
 @validate_call
-def fix_credit_topup_issue(customer_id: int, transaction_id: str) -> str:
+async def fix_credit_topup_issue(customer_id: int, transaction_id: str) -> str:
     """
     This function resolves credit top up issues by verifying transactions and automatically crediting customer account with the correct amount.
     :param customer_id: The ID of the customer making the request
@@ -51,11 +69,9 @@ def fix_credit_topup_issue(customer_id: int, transaction_id: str) -> str:
     """
     url = TRANSACTION_URL
     data = {'user_id': customer_id, 'transaction_id': transaction_id}
-    header = {'Content-Type': 'application/json'}
-
-    response = requests.post(url=url, headers=header, json=data)
 
-    res = response.json()
+    #Not retried, the request changes data on UelloSend
+    res = await post_json(url, data, tool="fix_credit_topup_issue", read_timeout=TRANSACTION_TIMEOUT)
 
     if int(res["code"]) == 502:
         return "Not Resolved: Payment Gateway Error"
@@ -72,8 +88,9 @@ def fix_credit_topup_issue(customer_id: int, transaction_id: str) -> str:
 #print(verify_transaction(675, "LVC3V1VTR08H"))
 
 
+@timed("tool_set")
 @validate_call
-def resend_account_verification_link(customer_email: EmailStr)-> str:
+async def resend_account_verification_link(customer_email: EmailStr)-> str:
     """
     This function will resend a account verification link to the provided email address of the customer if it exists on record.
     :param customer_email: Valid email address of the customer
@@ -82,10 +99,9 @@ def resend_account_verification_link(customer_email: EmailStr)-> str:
     # Prepare request parameters
     url = VERIFICATION_URL
     data = {'email': customer_email}
-    header = {'Content-Type': 'application/json'}
 
-    response = requests.post(url=url, headers=header, json=data)
-    res = response.json()
+    #Not retried, the request changes data on UelloSend
+    res = await post_json(url, data, tool="resend_account_verification_link", read_timeout=VERIFICATION_TIMEOUT)
 
     
     if  int(res["code"]) == 404:
@@ -101,8 +117,9 @@ def resend_account_verification_link(customer_email: EmailStr)-> str:
     
 
 
+@timed("tool_set")
 @validate_call
-def send_password_reset_link(customer_email: EmailStr)-> str:
+async def send_password_reset_link(customer_email: EmailStr)-> str:
     """
     This function will send reset password link to the provided email address of the customer if it exists on record.
     :param customer_email: Valid email address of the customer
@@ -111,10 +128,9 @@ def send_password_reset_link(customer_email: EmailStr)-> str:
     # Prepare request parameters
     url = RESET_URL
     data = {'email': customer_email}
-    header = {'Content-Type': 'application/json'}
 
-    response = requests.post(url=url, headers=header, json=data)
-    res = response.json()
+    #Not retried, the request changes data on UelloSend
+    res = await post_json(url, data, tool="send_password_reset_link", read_timeout=RESET_TIMEOUT)
     
     if  int(res["code"]) == 404:
         return f"No customer found for email: {customer_email}"
@@ -0,0 +1,242 @@
+####
+# Defines the semantic answer cache used by the QueryAgent.
+# Answers are stored in redis keyed by the query embedding and the set of retrieved chunks, a new query
+# reuses a stored answer when it retrieved the same chunks and its embedding is close enough.
+# Every /scraper run bumps the generation number so answers built on the old index are never served.
+####
+
+import os
+import time
+import uuid
+import struct
+import hashlib
+from typing import List, Optional, Tuple
+import numpy as np
+import logfire
+from dotenv import load_dotenv
+
+from src.utils.manage_resources import get_redis_client
+from src.utils.manage_metrics import increment_counter
+
+load_dotenv()
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "86400"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000"))
+
+#Entry layout: created_at (double), vector dimension (uint32), float32 unit vector, utf-8 answer
+_ENTRY_HEADER = struct.Struct("<dI")
+
+
+def context_key(context_ids: List) -> str:
+    """
+    Returns a stable key for a set of retrieved chunks, the order they were retrieved in does not matter
+    """
+    joined = "|".join(sorted(str(context_id) for context_id in context_ids))
+
+    return hashlib.sha1(joined.encode("utf-8")).hexdigest()
+
+
+def _normalize(vector) -> np.ndarray:
+    """
+    Returns the vector as a float32 unit vector so the cosine similarity is a dot product
+    """
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+
+    return vector / norm if norm else vector
+
+
+def _pack_entry(vector: np.ndarray, answer: str, created_at: float) -> bytes:
+    return _ENTRY_HEADER.pack(created_at, len(vector)) + vector.tobytes() + answer.encode("utf-8")
+
+
+def _unpack_entry(blob: bytes) -> Tuple[np.ndarray, str, float]:
+    created_at, dimension = _ENTRY_HEADER.unpack_from(blob)
+    vector_end = _ENTRY_HEADER.size + dimension * 4
+
+    vector = np.frombuffer(blob[_ENTRY_HEADER.size:vector_end], dtype=np.float32)
+    answer = blob[vector_end:].decode("utf-8")
+
+    return vector, answer, created_at
+
+
+class AnswerCache:
+    """
+    Redis backed cache of generated answers.
+    Entries of one context set live in a hash, a sorted set ordered by last use caps the total number of entries.
+    """
+
+    def __init__(
+        self,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        ttl: int = ANSWER_CACHE_TTL,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        enabled: bool = ANSWER_CACHE_ENABLED,
+        prefix: str = "answer_cache:"
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.prefix = prefix
+
+        #Counts for this worker, the metrics carry the same numbers for the dashboard
+        self.hits = 0
+        self.misses = 0
+
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+
+        return self.hits / lookups if lookups else 0.0
+
+
+    def _bucket_key(self, generation: int, key: str) -> str:
+        return f"{self.prefix}{generation}:ctx:{key}"
+
+
+    def _lru_key(self, generation: int) -> str:
+        return f"{self.prefix}{generation}:lru"
+
+
+    async def generation(self) -> int:
+        """
+        Returns the current index generation
+        """
+        value = await get_redis_client().get(f"{self.prefix}generation")
+
+        return int(value) if value else 0
+
+
+    async def lookup(self, query_vector, context_ids: List) -> Tuple[Optional[str], Optional[int]]:
+        """
+        Returns a cached answer (or None) and the generation it was looked up in.
+        The generation has to be passed back to store so an answer started before a reindex is not cached after it.
+        """
+        if not self.enabled or not context_ids:
+            return None, None
+
+        try:
+            redis = get_redis_client()
+            generation = await self.generation()
+            key = context_key(context_ids)
+            bucket = self._bucket_key(generation, key)
+
+            entries = await redis.hgetall(bucket)
+
+            query_vector = _normalize(query_vector)
+            now = time.time()
+            best_score, best_id, best_answer = -1.0, None, None
+            expired = []
+
+            for entry_id, blob in entries.items():
+                vector, answer, created_at = _unpack_entry(blob)
+
+                if now - created_at > self.ttl:
+                    expired.append(entry_id)
+                    continue
+
+                if len(vector) != len(query_vector):
+                    continue
+
+                score = float(np.dot(vector, query_vector))
+                if score > best_score:
+                    best_score, best_id, best_answer = score, entry_id, answer
+
+            async with redis.pipeline(transaction=False) as pipe:
+                if expired:
+                    pipe.hdel(bucket, *expired)
+
+                if best_id is not None and best_score >= self.threshold:
+                    #Mark the entry as recently used
+                    pipe.zadd(self._lru_key(generation), {f"{key}:{best_id.decode()}": now})
+
+                await pipe.execute()
+
+            if best_id is not None and best_score >= self.threshold:
+                self.hits += 1
+                increment_counter("answer_cache.lookups", result="hit")
+
+                return best_answer, generation
+
+            self.misses += 1
+            increment_counter("answer_cache.lookups", result="miss")
+
+            return None, generation
+
+        except Exception as e:
+            #The cache is an optimization, a broken cache only costs an LLM call
+            logfire.error(
+                "Unhandled exception in answer cache lookup",
+                exc_info=e
+            )
+
+            return None, None
+
+
+    async def store(self, query_vector, context_ids: List, answer: str, generation: Optional[int]):
+        """
+        Stores a generated answer and evicts the least recently used entries above max_entries
+        """
+        if not self.enabled or not context_ids or generation is None or not answer:
+            return
+
+        try:
+            redis = get_redis_client()
+
+            #The index changed while the answer was generated
+            if generation != await self.generation():
+                return
+
+            key = context_key(context_ids)
+            bucket = self._bucket_key(generation, key)
+            lru = self._lru_key(generation)
+            entry_id = uuid.uuid4().hex
+            now = time.time()
+
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.hset(bucket, entry_id, _pack_entry(_normalize(query_vector), answer, now))
+                pipe.expire(bucket, self.ttl)
+                pipe.zadd(lru, {f"{key}:{entry_id}": now})
+                pipe.expire(lru, self.ttl)
+                pipe.zcard(lru)
+                results = await pipe.execute()
+
+            overflow = results[-1] - self.max_entries
+
+            if overflow > 0:
+                evicted = await redis.zpopmin(lru, overflow)
+
+                async with redis.pipeline(transaction=False) as pipe:
+                    for member, _ in evicted:
+                        evicted_key, evicted_id = member.decode().split(":")
+                        pipe.hdel(self._bucket_key(generation, evicted_key), evicted_id)
+
+                    await pipe.execute()
+
+                increment_counter("answer_cache.evictions", len(evicted))
+
+        except Exception as e:
+            logfire.error(
+                "Unhandled exception in answer cache store",
+                exc_info=e
+            )
+
+
+    async def invalidate(self) -> int:
+        """
+        Bumps the generation so every cached answer is ignored, the old entries expire with their TTL
+        """
+        generation = await get_redis_client().incr(f"{self.prefix}generation")
+
+        increment_counter("answer_cache.invalidations")
+        logfire.info("Answer cache invalidated", extra={"generation": generation})
+
+        return generation
+
+
+#Shared by every QueryAgent in this worker
+answer_cache = AnswerCache()
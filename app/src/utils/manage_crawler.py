@@ -0,0 +1,242 @@
+####
+# Defines the async web crawler used by the indexing pipeline.
+# Pages are fetched concurrently with a global limit and per-host politeness (concurrency and delay).
+# ETag / Last-Modified validators from the previous run are stored in redis and sent back as conditional
+# requests, so unchanged pages are answered with 304 and neither downloaded nor parsed again.
+####
+
+import os
+import json
+import time
+import asyncio
+from typing import Callable, Dict, List
+from urllib.parse import urlsplit
+import httpx
+import logfire
+from bs4 import BeautifulSoup
+from langchain_core.documents import Document
+from dotenv import load_dotenv
+
+from src.utils.manage_resources import get_redis_client
+from src.utils.manage_metrics import record_duration, record_histogram
+
+load_dotenv()
+
+CRAWL_MAX_CONCURRENCY = int(os.getenv("CRAWL_MAX_CONCURRENCY", "8"))
+CRAWL_PER_HOST_CONCURRENCY = int(os.getenv("CRAWL_PER_HOST_CONCURRENCY", "4"))
+CRAWL_HOST_DELAY = float(os.getenv("CRAWL_HOST_DELAY", "0.05"))
+CRAWL_TIMEOUT = float(os.getenv("CRAWL_TIMEOUT", "20"))
+
+VALIDATORS_KEY = "crawler:validators"
+
+#Pages that no longer exist, their chunks are removed from the index
+GONE_STATUS_CODES = {404, 410}
+
+
+def parse_page(url: str, html: str) -> Document:
+    """
+    Parses a page into a document, text and metadata match langchain's WebBaseLoader
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    metadata = {"source": url}
+
+    title = soup.find("title")
+    metadata["title"] = title.get_text() if title else url
+
+    if description := soup.find("meta", attrs={"name": "description"}):
+        metadata["description"] = description.get("content", "No description found.")
+    if page := soup.find("html"):
+        metadata["language"] = page.get("lang", "No language found.")
+
+    return Document(page_content=soup.get_text(), metadata=metadata)
+
+
+class CrawlResult:
+    """
+    Outcome of a crawl: parsed documents and what happened to every url
+    """
+
+    def __init__(self):
+        self.documents: List[Document] = []
+        self.fetched: List[str] = []
+        self.not_modified: List[str] = []
+        self.gone: List[str] = []
+        self.failed: List[str] = []
+        self.validators: Dict[str, dict] = {}
+
+
+    @property
+    def changed_sources(self) -> List[str]:
+        """
+        Urls whose chunks have to be brought in line with the index: fetched pages and pages that are gone
+        """
+        return self.fetched + self.gone
+
+
+    def summary(self) -> Dict[str, int]:
+        return {
+            "fetched": len(self.fetched),
+            "not_modified": len(self.not_modified),
+            "gone": len(self.gone),
+            "failed": len(self.failed)
+        }
+
+
+class WebCrawler:
+    """
+    Fetches pages concurrently, politely and conditionally
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = CRAWL_MAX_CONCURRENCY,
+        per_host_concurrency: int = CRAWL_PER_HOST_CONCURRENCY,
+        host_delay: float = CRAWL_HOST_DELAY,
+        timeout: float = CRAWL_TIMEOUT,
+        use_validators: bool = True
+    ):
+        self.max_concurrency = max_concurrency
+        self.per_host_concurrency = per_host_concurrency
+        self.host_delay = host_delay
+        self.timeout = timeout
+        self.use_validators = use_validators
+
+
+    async def load_validators(self, urls: List[str]) -> Dict[str, dict]:
+        """
+        Returns the ETag / Last-Modified of the previous run for the given urls
+        """
+        if not self.use_validators or not urls:
+            return {}
+
+        try:
+            values = await get_redis_client().hmget(VALIDATORS_KEY, urls)
+
+            return {url: json.loads(value) for url, value in zip(urls, values) if value}
+
+        except Exception as e:
+            #Without validators every page is downloaded again, the crawl still works
+            logfire.error(
+                "Unhandled exception in loading crawl validators",
+                exc_info=e
+            )
+
+            return {}
+
+
+    async def save_validators(self, result: CrawlResult):
+        """
+        Stores the validators of the fetched pages, call it once their chunks are indexed
+        so a failed indexing run does not turn into 304s on the next crawl
+        """
+        if not self.use_validators:
+            return
+
+        try:
+            redis = get_redis_client()
+
+            if result.validators:
+                await redis.hset(VALIDATORS_KEY, mapping={url: json.dumps(value) for url, value in result.validators.items()})
+
+            if result.gone:
+                await redis.hdel(VALIDATORS_KEY, *result.gone)
+
+        except Exception as e:
+            logfire.error(
+                "Unhandled exception in saving crawl validators",
+                exc_info=e
+            )
+
+
+    async def crawl(self, urls: List[str], on_progress: Callable[[int, int], None] = None) -> CrawlResult:
+        """
+        Fetches and parses the given urls, unchanged pages are skipped with conditional requests.
+        on_progress is called with (pages done, total pages) after every page.
+        """
+        start = time.perf_counter()
+        result = CrawlResult()
+        urls = list(dict.fromkeys(urls))
+
+        validators = await self.load_validators(urls)
+
+        global_limit = asyncio.Semaphore(self.max_concurrency)
+        host_limits = {}
+        host_next_request = {}
+
+        done = 0
+
+        async def fetch_and_report(client: httpx.AsyncClient, url: str):
+            nonlocal done
+
+            try:
+                await fetch(client, url)
+            finally:
+                done += 1
+                if on_progress:
+                    on_progress(done, len(urls))
+
+        async def fetch(client: httpx.AsyncClient, url: str):
+            host = urlsplit(url).netloc
+            host_limit = host_limits.setdefault(host, asyncio.Semaphore(self.per_host_concurrency))
+
+            headers = {}
+            previous = validators.get(url, {})
+            if previous.get("etag"):
+                headers["If-None-Match"] = previous["etag"]
+            if previous.get("last_modified"):
+                headers["If-Modified-Since"] = previous["last_modified"]
+
+            async with global_limit, host_limit:
+                #Requests to the same host are spaced by host_delay
+                now = time.monotonic()
+                wait = host_next_request.get(host, now) - now
+                host_next_request[host] = max(now, host_next_request.get(host, now)) + self.host_delay
+
+                if wait > 0:
+                    await asyncio.sleep(wait)
+
+                try:
+                    response = await client.get(url, headers=headers)
+
+                except httpx.HTTPError as e:
+                    logfire.warn("Failed to crawl page", extra={"url": url, "error": str(e)})
+                    result.failed.append(url)
+                    return
+
+            if response.status_code == 304:
+                result.not_modified.append(url)
+                return
+
+            if response.status_code in GONE_STATUS_CODES:
+                result.gone.append(url)
+                return
+
+            if response.status_code >= 400:
+                logfire.warn("Failed to crawl page", extra={"url": url, "status_code": response.status_code})
+                result.failed.append(url)
+                return
+
+            #Parsing is CPU bound, keep it off the event loop
+            document = await asyncio.to_thread(parse_page, url, response.text)
+
+            result.documents.append(document)
+            result.fetched.append(url)
+
+            etag = response.headers.get("etag")
+            last_modified = response.headers.get("last-modified")
+            if etag or last_modified:
+                result.validators[url] = {"etag": etag, "last_modified": last_modified}
+
+        async with httpx.AsyncClient(
+            headers={"User-Agent": os.getenv("USER_AGENT") or "uellosend-support-crawler"},
+            timeout=httpx.Timeout(self.timeout),
+            limits=httpx.Limits(max_connections=self.max_concurrency),
+            follow_redirects=True
+        ) as client:
+            await asyncio.gather(*[fetch_and_report(client, url) for url in urls])
+
+        record_duration("crawler.crawl", time.perf_counter() - start)
+        record_histogram("crawler.pages", len(urls))
+        logfire.info("Crawl finished", extra=result.summary())
+
+        return result
@@ -3,13 +3,230 @@
 ####
 
 import os
+import asyncio
 from dotenv import load_dotenv
 import sqlite3
 import logfire
 
+from src.utils.manage_metrics import time_stage
+
 load_dotenv()
 logfire.configure(send_to_logfire="if-token-present", scrubbing=False, )
 
+
+####
+# Background writer for chat messages
+####
+
+class MessageWriter:
+    """
+    Writes chat messages in the background so the request path only has to enqueue them.
+    Uses one long lived connection in WAL mode and commits rows in batches (group commit),
+    a batch is flushed every MESSAGE_FLUSH_INTERVAL seconds or as soon as MESSAGE_BATCH_SIZE rows are waiting.
+    """
+
+    def __init__(self, db_name: str):
+        self.db_name = db_name
+        self.batch_size = int(os.getenv("MESSAGE_BATCH_SIZE", "100"))
+        self.flush_interval = float(os.getenv("MESSAGE_FLUSH_INTERVAL", "0.005"))
+        self.queue = asyncio.Queue()
+        self.conn = None
+        self.task = None
+
+
+    def start(self):
+        """
+        Opens the connection and starts the background task
+        """
+        self.conn = sqlite3.connect(f"{self.db_name}.db", check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL;")
+        self.conn.execute("PRAGMA synchronous=NORMAL;")
+
+        self.task = asyncio.create_task(self._run())
+
+
+    def enqueue(self, message_session_id, message_role, message_text):
+        """
+        Queues a message to be written with the next batch
+        """
+        self.queue.put_nowait((message_session_id, message_role, message_text))
+
+
+    async def _run(self):
+        """
+        Collects queued messages into batches and writes them until stopped
+        """
+        running = True
+
+        while running:
+            batch = [await self.queue.get()]
+
+            #Give other requests a few milliseconds to add to this batch
+            if self.queue.qsize() < self.batch_size:
+                await asyncio.sleep(self.flush_interval)
+
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            #None is the stop signal, write what was collected and exit
+            if None in batch:
+                batch = [message for message in batch if message is not None]
+                running = False
+
+            if batch:
+                with time_stage("manage_db", "write_batch"):
+                    await asyncio.to_thread(self._write, batch)
+
+
+    def _write(self, batch):
+        """
+        Inserts a batch of messages in a single transaction
+        """
+        try:
+            self.conn.executemany("INSERT INTO messages(message_session_id, message_role, message_text) VALUES(?, ?, ?)", batch)
+            self.conn.commit()
+
+        except Exception as e:
+            response = f"Error - {str(e)}"
+
+            logfire.error(
+                "Unhandled exception in writing messages batch",
+                exc_info=e, 
+                extra={"info": response, "database": self.db_name, "batch_size": len(batch)}
+            )
+
+
+    async def stop(self):
+        """
+        Flushes every queued message and closes the connection
+        """
+        if self.task is None:
+            return
+
+        self.queue.put_nowait(None)
+        await self.task
+
+        self.conn.close()
+        self.task = None
+
+
+#One writer per database file
+_writers = {}
+
+
+def get_message_writer(db_name: str) -> MessageWriter:
+    """
+    Returns the writer for a database, starting it the first time it is used
+    """
+    if db_name not in _writers:
+        writer = MessageWriter(db_name)
+        writer.start()
+        _writers[db_name] = writer
+
+    return _writers[db_name]
+
+
+def message_queue_depths() -> dict:
+    """
+    Returns the number of messages waiting to be written for every database
+    """
+    return {db_name: writer.queue.qsize() for db_name, writer in _writers.items()}
+
+
+async def stop_message_writers():
+    """
+    Flushes and stops all writers, called when the server shuts down
+    """
+    for writer in list(_writers.values()):
+        await writer.stop()
+
+    _writers.clear()
+
+
+####
+# Shared helpers for reading messages
+####
+
+def create_messages_indexes(cursor):
+    """
+    Creates the indexes used by the paginated and filtered message queries
+    """
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_session ON messages(message_session_id, message_id);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_created_at ON messages(created_at, message_id);")
+
+
+def _build_messages_query(limit, cursor=None, session_id=None, start_date=None, end_date=None):
+    """
+    Builds a keyset paginated query, newest messages first.
+    cursor is the message_id of the last message of the previous page, dates are inclusive (YYYY-MM-DD)
+    """
+    conditions = []
+    params = []
+
+    if cursor is not None:
+        conditions.append("message_id < ?")
+        params.append(cursor)
+
+    if session_id:
+        conditions.append("message_session_id = ?")
+        params.append(session_id)
+
+    if start_date:
+        conditions.append("created_at >= ?")
+        params.append(str(start_date))
+
+    if end_date:
+        conditions.append("created_at < date(?, '+1 day')")
+        params.append(str(end_date))
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    params.append(limit)
+
+    return f"SELECT * FROM messages {where} ORDER BY message_id DESC LIMIT ?;", params
+
+
+def _read_messages_page(db_name, limit, cursor=None, session_id=None, start_date=None, end_date=None):
+    """
+    Reads one page of messages, runs in a worker thread
+    """
+    query, params = _build_messages_query(limit, cursor, session_id, start_date, end_date)
+
+    conn = sqlite3.connect(f"{db_name}.db")
+
+    try:
+        return conn.execute(query, params).fetchall()
+    finally:
+        conn.close()
+
+
+async def fetch_messages_page(db_name, limit=100, cursor=None, session_id=None, start_date=None, end_date=None):
+    """
+    Retrieves one page of messages and the cursor for the next page (None when there are no more messages)
+    """
+    with time_stage("manage_db", "read_page"):
+        result = await asyncio.to_thread(_read_messages_page, db_name, limit, cursor, session_id, start_date, end_date)
+
+    next_cursor = result[-1][0] if len(result) == limit else None
+
+    return result, next_cursor
+
+
+async def stream_messages(db_name, session_id=None, start_date=None, end_date=None, page_size=1000):
+    """
+    Yields every matching message page by page so the full history can be exported at constant memory
+    """
+    cursor = None
+
+    while True:
+        page, cursor = await fetch_messages_page(db_name, page_size, cursor, session_id, start_date, end_date)
+
+        for row in page:
+            yield row
+
+        if cursor is None:
+            break
+
+
 ####
 # UelloSendAgent Database Functions
 ####
@@ -33,6 +250,8 @@ async def create_UelloSendAgent_messages_table():
             );
         """)
 
+        create_messages_indexes(cursor)
+
         conn.commit()
         cursor.close()
         conn.close()
@@ -55,17 +274,9 @@ async def insert_UelloSendAgent_messages(message_session_id, message_role, messa
     Insert chat messages into the UelloSendAgent database.
     """
     try:
-        conn = sqlite3.connect(f"{os.getenv('UELLOSEND_AGENT_DB')}.db")
-
-        cursor = conn.cursor()
-
-        cursor.execute("INSERT INTO messages(message_session_id, message_role, message_text) VALUES(?, ?, ?)",
-                    (message_session_id, message_role, message_text))
+        #Only enqueue here, the background writer commits the message with the next batch
+        get_message_writer(os.getenv('UELLOSEND_AGENT_DB')).enqueue(message_session_id, message_role, message_text)
 
-        conn.commit()
-        cursor.close()
-        conn.close()
-        
     except Exception as e:
         response = f"Error - {str(e)}"
 
@@ -78,23 +289,13 @@ async def insert_UelloSendAgent_messages(message_session_id, message_role, messa
     return True # I am returning true because the system does not require the database aspect to function
 
 
-async def fetch_UelloSendAgent_messages():
+async def fetch_UelloSendAgent_messages(limit=100, cursor=None, session_id=None, start_date=None, end_date=None):
     """
-    Retrieves chat messages from the UelloSendAgent database.
+    Retrieves one page of chat messages from the UelloSendAgent database, newest first.
+    Returns the messages and the cursor to pass in to get the next page.
     """
     try:
-        conn = sqlite3.connect(f"{os.getenv('UELLOSEND_AGENT_DB')}.db")
-
-        cursor = conn.cursor()
-
-        cursor.execute("""SELECT * FROM messages ORDER BY message_id DESC ;""")
-        result = cursor.fetchall()
-
-        conn.commit()
-        cursor.close()
-        conn.close()
-
-        return result
+        return await fetch_messages_page(os.getenv('UELLOSEND_AGENT_DB'), limit, cursor, session_id, start_date, end_date)
     
     except Exception as e:
         response = f"Error - {str(e)}"
@@ -107,6 +308,14 @@ async def fetch_UelloSendAgent_messages():
         raise Exception(response)
 
 
+async def stream_UelloSendAgent_messages(session_id=None, start_date=None, end_date=None):
+    """
+    Yields all chat messages from the UelloSendAgent database, newest first, one row at a time.
+    """
+    async for row in stream_messages(os.getenv('UELLOSEND_AGENT_DB'), session_id=session_id, start_date=start_date, end_date=end_date):
+        yield row
+
+
 ####
 # QueryAgent Database Functions
 ####
@@ -130,6 +339,8 @@ async def create_QueryAgent_messages_table():
             );
         """)
 
+        create_messages_indexes(cursor)
+
         conn.commit()
         cursor.close()
         conn.close()
@@ -153,17 +364,8 @@ async def insert_QueryAgent_messages(message_session_id, message_role, message_t
     """
 
     try:
-        conn = sqlite3.connect(f"{os.getenv('QUERY_AGENT_DB')}.db")
-
-        cursor = conn.cursor()
-
-        cursor.execute("INSERT INTO messages(message_session_id, message_role, message_text) VALUES(?, ?, ?)",
-                    (message_session_id, message_role, message_text))
-
-        conn.commit()
-        cursor.close()
-        conn.close()
-
+        #Only enqueue here, the background writer commits the message with the next batch
+        get_message_writer(os.getenv('QUERY_AGENT_DB')).enqueue(message_session_id, message_role, message_text)
 
     except Exception as e:
         response = f"Error - {str(e)}"
@@ -178,24 +380,14 @@ async def insert_QueryAgent_messages(message_session_id, message_role, message_t
 
 
 
-async def fetch_QueryAgent_messages():
+async def fetch_QueryAgent_messages(limit=100, cursor=None, session_id=None, start_date=None, end_date=None):
     """
-    Retrieves chat messages from the QueryAgent database.
+    Retrieves one page of chat messages from the QueryAgent database, newest first.
+    Returns the messages and the cursor to pass in to get the next page.
     """
     try:
-        conn = sqlite3.connect(f"{os.getenv('QUERY_AGENT_DB')}.db")
-
-        cursor = conn.cursor()
-
-        cursor.execute("""SELECT * FROM messages ORDER BY message_id DESC;""")
-        result = cursor.fetchall()
-
-        conn.commit()
-        cursor.close()
-        conn.close()
-
-        return result
-
+        return await fetch_messages_page(os.getenv('QUERY_AGENT_DB'), limit, cursor, session_id, start_date, end_date)
+    
     except Exception as e:
 
         response = f"Error - {str(e)}"
@@ -207,4 +399,12 @@ async def fetch_QueryAgent_messages():
         )
         raise Exception(response)
 
+
+async def stream_QueryAgent_messages(session_id=None, start_date=None, end_date=None):
+    """
+    Yields all chat messages from the QueryAgent database, newest first, one row at a time.
+    """
+    async for row in stream_messages(os.getenv('QUERY_AGENT_DB'), session_id=session_id, start_date=start_date, end_date=end_date):
+        yield row
+
     
\ No newline at end of file
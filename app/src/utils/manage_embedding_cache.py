@@ -0,0 +1,140 @@
+####
+# Defines the query embedding cache used by the QueryAgent.
+# Vectors are kept in a bounded in-process LRU, with an optional redis tier shared by all workers
+# that stores them as packed float32 bytes. Keys include the embedding model name and backend so a model
+# change never serves vectors of the old model.
+####
+
+import os
+import re
+import hashlib
+from collections import OrderedDict
+from typing import Awaitable, Callable, List, Optional
+import numpy as np
+import logfire
+from dotenv import load_dotenv
+
+from src.utils.manage_resources import get_redis_client, embedding_model_id
+from src.utils.manage_metrics import increment_counter
+
+load_dotenv()
+
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "2048"))
+EMBED_CACHE_REDIS = os.getenv("EMBED_CACHE_REDIS", "true").lower() == "true"
+EMBED_CACHE_TTL = int(os.getenv("EMBED_CACHE_TTL", "604800"))
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """
+    Normalizes a query so trivially different strings ("Hi", " hi!", "pricing?") share one embedding
+    """
+    return _WHITESPACE.sub(" ", text).strip().strip("?!.,;: ").lower()
+
+
+class EmbeddingCache:
+    """
+    Two tier cache of query vectors: an in-process LRU in front of an optional shared redis tier
+    """
+
+    def __init__(
+        self,
+        model_name: str = None,
+        max_entries: int = EMBED_CACHE_SIZE,
+        use_redis: bool = EMBED_CACHE_REDIS,
+        ttl: int = EMBED_CACHE_TTL,
+        prefix: str = "embedding_cache:"
+    ):
+        self.model_name = model_name or embedding_model_id() or ""
+        self.max_entries = max_entries
+        self.use_redis = use_redis
+        self.ttl = ttl
+        self.prefix = prefix
+        self._entries = OrderedDict()
+
+
+    def _key(self, normalized: str) -> str:
+        digest = hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+        return f"{self.prefix}{self.model_name}:{digest}"
+
+
+    def _remember(self, key: str, vector: List[float]):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+    async def _redis_get(self, key: str) -> Optional[List[float]]:
+        try:
+            blob = await get_redis_client().get(key)
+
+            return np.frombuffer(blob, dtype=np.float32).tolist() if blob else None
+
+        except Exception as e:
+            #The redis tier is optional, the query is embedded locally instead
+            logfire.error(
+                "Unhandled exception in reading embedding cache",
+                exc_info=e
+            )
+
+            return None
+
+
+    async def _redis_set(self, key: str, vector: List[float]):
+        try:
+            await get_redis_client().set(key, np.asarray(vector, dtype=np.float32).tobytes(), ex=self.ttl)
+
+        except Exception as e:
+            logfire.error(
+                "Unhandled exception in writing embedding cache",
+                exc_info=e
+            )
+
+
+    async def get_or_embed(self, text: str, embed: Callable[[str], Awaitable[List[float]]]) -> List[float]:
+        """
+        Returns the cached vector of the normalized text, embedding it with embed on a miss
+        """
+        normalized = normalize_query(text) or text
+        key = self._key(normalized)
+
+        vector = self._entries.get(key)
+        if vector is not None:
+            self._entries.move_to_end(key)
+            increment_counter("embedding_cache.lookups", result="memory")
+
+            return vector
+
+        if self.use_redis:
+            vector = await self._redis_get(key)
+
+            if vector is not None:
+                self._remember(key, vector)
+                increment_counter("embedding_cache.lookups", result="redis")
+
+                return vector
+
+        increment_counter("embedding_cache.lookups", result="miss")
+
+        vector = await embed(normalized)
+        self._remember(key, vector)
+
+        if self.use_redis:
+            await self._redis_set(key, vector)
+
+        return vector
+
+
+    def clear(self):
+        """
+        Drops the in-process entries, the redis tier expires on its own
+        """
+        self._entries.clear()
+
+
+#Shared by every QueryAgent in this worker
+embedding_cache = EmbeddingCache()
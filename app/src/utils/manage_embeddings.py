@@ -0,0 +1,119 @@
+####
+# Defines the embedding service used by the agents.
+# The sentence-transformer runs in a thread pool instead of the event loop thread, and concurrent
+# embed_query calls are collected for up to EMBED_MAX_WAIT_MS and run as one batched forward pass.
+# An idle pool does not wait, so a single query pays no batching delay.
+####
+
+import os
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from dotenv import load_dotenv
+
+from src.utils.manage_metrics import record_histogram
+
+load_dotenv()
+
+EMBED_MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH_SIZE", "32"))
+EMBED_MAX_WAIT_MS = float(os.getenv("EMBED_MAX_WAIT_MS", "5"))
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "1"))
+
+
+class EmbeddingService:
+    """
+    Micro-batching wrapper around an embedding model.
+    A batch is sent to the pool when it reaches max_batch_size, when the pool is idle
+    or max_wait_ms after its first query.
+    """
+
+    def __init__(
+        self,
+        embedding,
+        max_batch_size: int = EMBED_MAX_BATCH_SIZE,
+        max_wait_ms: float = EMBED_MAX_WAIT_MS,
+        workers: int = EMBED_WORKERS
+    ):
+        self.embedding = embedding
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embedding")
+
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+
+
+    async def embed_query(self, text: str) -> List[float]:
+        """
+        Returns the vector of one query, batched with the queries that arrive at the same time
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            #An idle pool takes the batch right away (queries of the same loop iteration still join it),
+            #while a batch is running new queries wait up to max_wait for more to arrive
+            delay = 0 if not self._tasks else self.max_wait
+            self._timer = loop.call_later(delay, self._flush)
+
+        return await future
+
+
+    async def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds a list of texts in the pool, the texts already form a batch
+        """
+        loop = asyncio.get_running_loop()
+
+        return await loop.run_in_executor(self.executor, self.embedding.embed_documents, texts)
+
+
+    def _flush(self):
+        """
+        Sends the pending queries to the pool in batches of at most max_batch_size
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._pending:
+            batch = self._pending[:self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size:]
+
+            task = asyncio.create_task(self._run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+
+    async def _run_batch(self, batch):
+        texts = [text for text, _ in batch]
+        start = time.perf_counter()
+
+        try:
+            vectors = await self.embed_documents(texts)
+
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        record_histogram("embedding.batch_size", len(batch))
+        record_histogram("embedding.batch_duration", time.perf_counter() - start, unit="s")
+
+        for (_, future), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector)
+
+        #Queries that arrived during this batch do not have to wait for their timer
+        if self._pending and len(self._tasks) <= 1:
+            self._flush()
+
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,96 @@
+####
+# Defines the history window used by QueryAgent to keep prompts within a token budget.
+# The LLM gets the system prompt, a rolling summary of older turns and the most recent turns.
+# Only the latest user message carries the retrieved context, past user messages are kept as the bare question.
+####
+
+import os
+from typing import List, Dict, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count (about 4 characters per token for English text), good enough for budgeting
+    """
+    return len(text) // 4 + 1
+
+
+def count_message_tokens(messages: List[Dict]) -> int:
+    """
+    Estimated prompt tokens for a list of chat messages, including a small overhead per message
+    """
+    return sum(estimate_tokens(message["content"]) + 4 for message in messages)
+
+
+def _shorten(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit].rstrip() + "..."
+
+
+class HistoryManager:
+    """
+    Keeps the QueryAgent history within HISTORY_MAX_TURNS turns and HISTORY_TOKEN_BUDGET prompt tokens.
+    Turns that fall out of the window are folded into a rolling summary capped at SUMMARY_MAX_TOKENS.
+    The summary is extractive so it does not cost an extra LLM call.
+    """
+
+    def __init__(self):
+        self.max_turns = int(os.getenv("HISTORY_MAX_TURNS", "6"))
+        self.token_budget = int(os.getenv("HISTORY_TOKEN_BUDGET", "3000"))
+        self.summary_max_tokens = int(os.getenv("SUMMARY_MAX_TOKENS", "300"))
+
+
+    def build_messages(self, system_prompt: str, history: List[Dict], summary: str, current_prompt: str) -> List[Dict]:
+        """
+        Builds the messages sent to the LLM, the last user message in history is replaced by current_prompt
+        """
+        system = system_prompt
+        if summary:
+            system += f"\n\nSummary of the earlier conversation:\n{summary}"
+
+        return [{"role": "system", "content": system}] + history[:-1] + [{"role": "user", "content": current_prompt}]
+
+
+    def fit(self, system_prompt: str, history: List[Dict], summary: str, current_prompt: str) -> Tuple[List[Dict], str]:
+        """
+        Folds the oldest turns into the summary until the prompt fits the turn limit and token budget.
+        Returns the trimmed history and the updated summary
+        """
+        history = list(history)
+
+        while len(history) > 1:
+            past = history[:-1]
+            turns = sum(1 for message in past if message["role"] == "user")
+            tokens = count_message_tokens(self.build_messages(system_prompt, history, summary, current_prompt))
+
+            if turns <= self.max_turns and tokens <= self.token_budget:
+                break
+
+            #The oldest turn is the first message and every reply up to the next user message
+            end = 1
+            while end < len(past) and past[end]["role"] != "user":
+                end += 1
+
+            summary = self._fold(summary, history[:end])
+            history = history[end:]
+
+        return history, summary
+
+
+    def _fold(self, summary: str, turn: List[Dict]) -> str:
+        """
+        Adds a one line digest of a turn to the summary, dropping the oldest lines once it is over its budget
+        """
+        question = next((message["content"] for message in turn if message["role"] == "user"), "")
+        answer = " ".join(message["content"] for message in turn if message["role"] == "assistant")
+
+        lines = summary.split("\n") if summary else []
+        lines.append(f"- User asked: {_shorten(question, 200)} Assistant answered: {_shorten(answer, 300)}")
+
+        while len(lines) > 1 and estimate_tokens("\n".join(lines)) > self.summary_max_tokens:
+            lines.pop(0)
+
+        return "\n".join(lines)
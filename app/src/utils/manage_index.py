@@ -0,0 +1,242 @@
+####
+# Defines helper functions for incremental indexing of scraped pages into qdrant.
+# Every chunk gets a content hash and a deterministic point id (source url + start index + hash),
+# so a re-scrape only embeds new or changed chunks and removes chunks that disappeared.
+# Points use the same payload layout as langchain's QdrantVectorStore so retrieval is unchanged.
+# The collection is provisioned explicitly: HNSW parameters, optional int8 scalar quantization,
+# on-disk vectors and payload indexes on the source and title of the chunks.
+####
+
+import os
+import hashlib
+import uuid
+from typing import Callable, Dict, Iterable, List, Tuple
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+from qdrant_client import QdrantClient
+from qdrant_client.models import (
+    Disabled, Distance, FieldCondition, Filter, HnswConfigDiff, MatchAny, PayloadSchemaType, PointIdsList, PointStruct,
+    QuantizationSearchParams, ScalarQuantization, ScalarQuantizationConfig, ScalarType, SearchParams, VectorParams, VectorParamsDiff
+)
+
+load_dotenv()
+
+QDRANT_HNSW_M = int(os.getenv("QDRANT_HNSW_M", "16"))
+QDRANT_HNSW_EF_CONSTRUCT = int(os.getenv("QDRANT_HNSW_EF_CONSTRUCT", "100"))
+QDRANT_SEARCH_HNSW_EF = int(os.getenv("QDRANT_SEARCH_HNSW_EF", "128"))
+QDRANT_QUANTIZATION = os.getenv("QDRANT_QUANTIZATION", "none").lower()
+QDRANT_RESCORE = os.getenv("QDRANT_RESCORE", "true").lower() == "true"
+QDRANT_OVERSAMPLING = float(os.getenv("QDRANT_OVERSAMPLING", "2.0"))
+QDRANT_ON_DISK = os.getenv("QDRANT_ON_DISK", "false").lower() == "true"
+
+
+CONTENT_KEY = "page_content"
+METADATA_KEY = "metadata"
+
+#Filters and scrolls by page use these fields
+PAYLOAD_INDEXES = [f"{METADATA_KEY}.source", f"{METADATA_KEY}.title"]
+
+#Namespace of the point ids, changing it would re-create every point
+POINT_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "uellosend-support/qdrant-chunks")
+
+
+def chunk_hash(text: str) -> str:
+    """
+    Returns the content hash of a chunk
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_point_id(source: str, start_index: int, content_hash: str) -> str:
+    """
+    Returns the deterministic point id of a chunk
+    """
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{source}#{start_index}#{content_hash}"))
+
+
+def _quantization_config(quantization: str):
+    if quantization == "scalar":
+        #int8 vectors stay in RAM, the original vectors are used for rescoring
+        return ScalarQuantization(scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True))
+
+    return None
+
+
+def provision_collection(
+    client: QdrantClient,
+    collection: str,
+    vector_size: int = None,
+    m: int = QDRANT_HNSW_M,
+    ef_construct: int = QDRANT_HNSW_EF_CONSTRUCT,
+    quantization: str = QDRANT_QUANTIZATION,
+    on_disk: bool = QDRANT_ON_DISK
+):
+    """
+    Creates the collection with the configured index settings, or brings an existing collection in line
+    with them. Missing payload indexes are created, settings that already match are left alone.
+    vector_size is only needed to create the collection.
+    """
+    if not client.collection_exists(collection):
+        if vector_size is None:
+            raise ValueError(f"Collection {collection} does not exist and no vector size was given to create it")
+
+        client.create_collection(
+            collection_name=collection,
+            vectors_config=VectorParams(size=vector_size, distance=Distance.COSINE, on_disk=on_disk),
+            hnsw_config=HnswConfigDiff(m=m, ef_construct=ef_construct),
+            quantization_config=_quantization_config(quantization)
+        )
+
+    else:
+        config = client.get_collection(collection).config
+
+        if config.hnsw_config.m != m or config.hnsw_config.ef_construct != ef_construct:
+            client.update_collection(collection_name=collection, hnsw_config=HnswConfigDiff(m=m, ef_construct=ef_construct))
+
+        if (config.quantization_config is None) != (quantization == "none"):
+            client.update_collection(
+                collection_name=collection,
+                quantization_config=_quantization_config(quantization) or Disabled.DISABLED
+            )
+
+        #The collection uses a single unnamed vector, its diff goes under the "" key
+        if bool(config.params.vectors.on_disk) != on_disk:
+            client.update_collection(collection_name=collection, vectors_config={"": VectorParamsDiff(on_disk=on_disk)})
+
+    payload_schema = client.get_collection(collection).payload_schema
+
+    for field in PAYLOAD_INDEXES:
+        if field not in payload_schema:
+            client.create_payload_index(collection_name=collection, field_name=field, field_schema=PayloadSchemaType.KEYWORD)
+
+
+def search_params(
+    hnsw_ef: int = QDRANT_SEARCH_HNSW_EF,
+    quantization: str = QDRANT_QUANTIZATION,
+    rescore: bool = QDRANT_RESCORE,
+    oversampling: float = QDRANT_OVERSAMPLING
+) -> SearchParams:
+    """
+    Returns the search parameters matching the collection settings
+    """
+    if quantization == "none":
+        return SearchParams(hnsw_ef=hnsw_ef)
+
+    return SearchParams(
+        hnsw_ef=hnsw_ef,
+        quantization=QuantizationSearchParams(rescore=rescore, oversampling=oversampling if rescore else None)
+    )
+
+
+def fetch_indexed_chunks(client: QdrantClient, collection: str, sources: Iterable[str]) -> Dict[Tuple[str, int], List[Tuple[str, str]]]:
+    """
+    Returns the points already indexed for the given sources as (source, start_index) -> [(point id, content hash)].
+    Points indexed before content hashes existed have an empty hash, duplicates show up as several points.
+    """
+    indexed = {}
+    sources = list(sources)
+
+    if not sources or not client.collection_exists(collection):
+        return indexed
+
+    scroll_filter = Filter(must=[FieldCondition(key=f"{METADATA_KEY}.source", match=MatchAny(any=sources))])
+    offset = None
+
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection,
+            scroll_filter=scroll_filter,
+            limit=256,
+            offset=offset,
+            with_payload=[METADATA_KEY],
+            with_vectors=False
+        )
+
+        for point in points:
+            metadata = point.payload.get(METADATA_KEY) or {}
+            position = (metadata.get("source"), metadata.get("start_index"))
+            indexed.setdefault(position, []).append((str(point.id), metadata.get("content_hash", "")))
+
+        if offset is None:
+            return indexed
+
+
+def index_documents(client: QdrantClient, embedding, collection: str, doc_chunks: List[Document], sources: Iterable[str] = None, batch_size: int = 64, on_progress: Callable[[int, int], None] = None) -> Dict[str, int]:
+    """
+    Brings the collection in line with the scraped chunks of the given sources (by default the sources of the chunks).
+    Only new and changed chunks are embedded, points of chunks or pages that disappeared are deleted.
+    on_progress is called with (chunks embedded, chunks to embed) after every batch.
+    Returns the added/updated/unchanged/removed counts.
+    """
+    sources = set(sources or []) | {chunk.metadata["source"] for chunk in doc_chunks}
+    indexed = fetch_indexed_chunks(client, collection, sources)
+
+    counts = {"added": 0, "updated": 0, "unchanged": 0, "removed": 0}
+    to_embed = []
+    stale_ids = []
+    seen_positions = set()
+
+    for chunk in doc_chunks:
+        content_hash = chunk_hash(chunk.page_content)
+        position = (chunk.metadata["source"], chunk.metadata.get("start_index", 0))
+
+        #Two identical chunks at the same position are stored once
+        if position in seen_positions:
+            continue
+        seen_positions.add(position)
+
+        point_id = chunk_point_id(position[0], position[1], content_hash)
+        existing = indexed.get(position, [])
+
+        if any(existing_id == point_id for existing_id, _ in existing):
+            counts["unchanged"] += 1
+        else:
+            counts["updated" if existing else "added"] += 1
+            to_embed.append((point_id, content_hash, chunk))
+
+        #Older versions and duplicates of this position
+        stale_ids.extend(existing_id for existing_id, _ in existing if existing_id != point_id)
+
+    for position, existing in indexed.items():
+        if position not in seen_positions:
+            counts["removed"] += 1
+            stale_ids.extend(existing_id for existing_id, _ in existing)
+
+    #An existing collection gets the configured settings even when no chunk needs embedding,
+    #a new one is created once the first batch tells the vector size
+    provisioned = client.collection_exists(collection)
+
+    if provisioned:
+        provision_collection(client, collection)
+
+    for i in range(0, len(to_embed), batch_size):
+        batch = to_embed[i:i + batch_size]
+        vectors = embedding.embed_documents([chunk.page_content for _, _, chunk in batch])
+
+        if not provisioned:
+            provision_collection(client, collection, len(vectors[0]))
+            provisioned = True
+
+        client.upsert(
+            collection_name=collection,
+            points=[
+                PointStruct(
+                    id=point_id,
+                    vector=vector,
+                    payload={
+                        CONTENT_KEY: chunk.page_content,
+                        METADATA_KEY: {**chunk.metadata, "content_hash": content_hash}
+                    }
+                )
+                for (point_id, content_hash, chunk), vector in zip(batch, vectors)
+            ]
+        )
+
+        if on_progress:
+            on_progress(i + len(batch), len(to_embed))
+
+    #New versions are written before the old ones are removed, so searches never see a page without chunks
+    if stale_ids:
+        client.delete(collection_name=collection, points_selector=PointIdsList(points=stale_ids))
+
+    return counts
@@ -0,0 +1,271 @@
+####
+# Defines the background job queue used for indexing (/scraper).
+# Jobs and their state live in redis so they survive restarts of the server and the worker.
+# The server only enqueues jobs, a separate worker process (worker.py) runs them one per collection at a time.
+# Every worker keeps the jobs it claimed in its own processing list next to a liveness key, jobs of a
+# worker whose liveness key expired are put back at the front of the queue by the other workers.
+####
+
+import os
+import json
+import time
+import uuid
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional
+import logfire
+from dotenv import load_dotenv
+
+from src.utils.manage_resources import get_redis_client
+from src.utils.manage_metrics import record_duration
+
+load_dotenv()
+
+INDEX_JOB_TTL = int(os.getenv("INDEX_JOB_TTL", "604800"))
+INDEX_JOB_HEARTBEAT_TIMEOUT = int(os.getenv("INDEX_JOB_HEARTBEAT_TIMEOUT", "60"))
+
+JOB_PREFIX = "index_jobs:job:"
+QUEUE_KEY = "index_jobs:queue"
+PROCESSING_PREFIX = "index_jobs:processing:"
+WORKER_PREFIX = "index_jobs:worker:"
+LOCK_PREFIX = "index_jobs:lock:"
+
+
+async def save_index_job(job: Dict):
+    """
+    Stores the state of a job, finished jobs expire after INDEX_JOB_TTL
+    """
+    await get_redis_client().set(f"{JOB_PREFIX}{job['id']}", json.dumps(job), ex=INDEX_JOB_TTL)
+
+
+async def get_index_job(job_id: str) -> Optional[Dict]:
+    """
+    Returns the state of a job, None when it does not exist (or expired)
+    """
+    data = await get_redis_client().get(f"{JOB_PREFIX}{job_id}")
+
+    return json.loads(data) if data else None
+
+
+async def enqueue_index_job(urls: List[str], collection: str) -> Dict:
+    """
+    Creates an indexing job and puts it at the back of the queue
+    """
+    job = {
+        "id": uuid.uuid4().hex,
+        "collection": collection,
+        "urls": urls,
+        "status": "queued",
+        "stage": "queued",
+        "progress": 0.0,
+        "result": None,
+        "error": None,
+        "attempts": 0,
+        "created_at": time.time(),
+        "started_at": None,
+        "finished_at": None
+    }
+
+    await save_index_job(job)
+    await get_redis_client().lpush(QUEUE_KEY, job["id"])
+
+    return job
+
+
+async def queue_depth() -> int:
+    """
+    Returns the number of jobs waiting to be picked up
+    """
+    return await get_redis_client().llen(QUEUE_KEY)
+
+
+class IndexJobWorker:
+    """
+    Takes jobs off the queue and runs them with the given handler.
+    The handler is called with the job and a progress callback (stage, progress) and returns the job result.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Dict, Callable[[str, float], None]], Awaitable[Dict]],
+        heartbeat_timeout: int = INDEX_JOB_HEARTBEAT_TIMEOUT,
+        poll_timeout: int = 5
+    ):
+        self.handler = handler
+        self.heartbeat_timeout = heartbeat_timeout
+        self.heartbeat_interval = max(1, heartbeat_timeout / 4)
+        self.poll_timeout = poll_timeout
+        self.worker_id = uuid.uuid4().hex
+        self.processing_key = f"{PROCESSING_PREFIX}{self.worker_id}"
+        self.current_job = None
+        self.stopped = False
+        self.pending_saves = set()
+
+
+    async def recover(self):
+        """
+        Puts the jobs of workers that stopped sending heartbeats back at the front of the queue
+        """
+        redis = get_redis_client()
+
+        async for key in redis.scan_iter(match=f"{PROCESSING_PREFIX}*"):
+            worker_id = key.decode().removeprefix(PROCESSING_PREFIX)
+
+            if worker_id == self.worker_id or await redis.exists(f"{WORKER_PREFIX}{worker_id}"):
+                continue
+
+            #Moving one job at a time keeps it in one of the lists if this worker dies halfway
+            while (job_id := await redis.lmove(key, QUEUE_KEY, "LEFT", "RIGHT")) is not None:
+                logfire.warn("Recovered indexing job of a stopped worker", extra={"job_id": job_id.decode(), "worker_id": worker_id})
+
+
+    async def heartbeat(self):
+        """
+        Keeps the worker liveness key and the collection lock alive and persists the progress of the running job
+        """
+        redis = get_redis_client()
+
+        while not self.stopped:
+            try:
+                await redis.set(f"{WORKER_PREFIX}{self.worker_id}", 1, ex=self.heartbeat_timeout)
+
+                #run_job can finish the job while this waits on redis
+                job = self.current_job
+
+                if job:
+                    await redis.expire(f"{LOCK_PREFIX}{job['collection']}", self.heartbeat_timeout)
+                    await save_index_job(job)
+
+                await self.recover()
+
+            except Exception as e:
+                logfire.error(
+                    "Unhandled exception in indexing worker heartbeat",
+                    exc_info=e
+                )
+
+            await asyncio.sleep(self.heartbeat_interval)
+
+
+    async def save_progress(self, job: Dict):
+        """
+        Stores a progress snapshot of a running job, a failed save is retried by the next heartbeat
+        """
+        try:
+            await save_index_job(job)
+
+        except Exception as e:
+            logfire.error(
+                "Unhandled exception in saving indexing job progress",
+                exc_info=e,
+                extra={"job_id": job["id"]}
+            )
+
+
+    async def run_job(self, job: Dict):
+        """
+        Runs one job and records its outcome.
+        The job is saved whenever it moves to a new stage, progress within a stage is saved by the heartbeat.
+        """
+        loop = asyncio.get_running_loop()
+
+        def start_save(snapshot: Dict):
+            task = loop.create_task(self.save_progress(snapshot))
+            self.pending_saves.add(task)
+            task.add_done_callback(self.pending_saves.discard)
+
+        def on_progress(stage: str, progress: float):
+            stage_changed = stage != job["stage"]
+            job["stage"] = stage
+            job["progress"] = round(progress, 3)
+
+            if not stage_changed:
+                return
+
+            try:
+                on_loop = asyncio.get_running_loop() is loop
+            except RuntimeError:
+                on_loop = False
+
+            if on_loop:
+                start_save(dict(job))
+            else:
+                #Indexing reports progress from a worker thread, the save runs on the event loop
+                loop.call_soon_threadsafe(start_save, dict(job))
+
+        job.update({"status": "running", "stage": "starting", "started_at": time.time(), "attempts": job["attempts"] + 1})
+        self.current_job = job
+        await save_index_job(job)
+
+        start = time.perf_counter()
+
+        try:
+            job["result"] = await self.handler(job, on_progress)
+            job.update({"status": "done", "stage": "done", "progress": 1.0})
+
+        except Exception as e:
+            logfire.error(
+                "Unhandled exception in indexing job",
+                exc_info=e,
+                extra={"job_id": job["id"]}
+            )
+            job.update({"status": "failed", "error": str(e)})
+
+        job["finished_at"] = time.time()
+        self.current_job = None
+
+        #A stage save that lands after the final one would bring back the running state
+        if self.pending_saves:
+            await asyncio.gather(*self.pending_saves, return_exceptions=True)
+
+        record_duration("index_job.duration", time.perf_counter() - start, status=job["status"])
+        await save_index_job(job)
+
+
+    async def run(self):
+        """
+        Main loop of the worker process
+        """
+        redis = get_redis_client()
+
+        #Register as alive before claiming anything so other workers never recover our jobs
+        await redis.set(f"{WORKER_PREFIX}{self.worker_id}", 1, ex=self.heartbeat_timeout)
+        heartbeat = asyncio.create_task(self.heartbeat())
+
+        logfire.info("Indexing worker started", extra={"worker_id": self.worker_id})
+
+        try:
+            while not self.stopped:
+                #Claim the oldest job, it stays in our processing list until it is finished
+                job_id = await redis.blmove(QUEUE_KEY, self.processing_key, self.poll_timeout, "RIGHT", "LEFT")
+
+                if job_id is None:
+                    continue
+
+                job = await get_index_job(job_id.decode())
+
+                if job is None or job["status"] in ("done", "failed"):
+                    await redis.lrem(self.processing_key, 1, job_id)
+                    continue
+
+                lock_key = f"{LOCK_PREFIX}{job['collection']}"
+
+                #One job per collection at a time, otherwise the job goes back to the queue
+                if not await redis.set(lock_key, self.worker_id, nx=True, ex=self.heartbeat_timeout):
+                    await redis.lmove(self.processing_key, QUEUE_KEY, "LEFT", "LEFT")
+                    await asyncio.sleep(1)
+                    continue
+
+                try:
+                    await self.run_job(job)
+
+                    #A job interrupted by a shutdown stays in the processing list and is recovered
+                    await redis.lrem(self.processing_key, 1, job_id)
+
+                finally:
+                    if await redis.get(lock_key) == self.worker_id.encode():
+                        await redis.delete(lock_key)
+
+        finally:
+            self.stopped = True
+            heartbeat.cancel()
+            await redis.delete(f"{WORKER_PREFIX}{self.worker_id}")
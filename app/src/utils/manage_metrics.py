@@ -0,0 +1,128 @@
+####
+# Defines helper functions to record metrics for the server.
+# Every metric is sent to logfire and mirrored into a Prometheus registry that is served on /metrics,
+# so per-stage latencies can be scraped without any outside service.
+####
+
+import re
+import time
+import functools
+from contextlib import contextmanager
+import logfire
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+
+
+#Instruments are created once and reused for every recording
+_histograms = {}
+_counters = {}
+_gauges = {}
+_prometheus = {}
+
+#Latency buckets from 1ms to 1 minute, other histograms (sizes, token counts) use powers of two
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = tuple(2 ** i for i in range(17))
+
+_INVALID_NAME_CHARACTERS = re.compile(r"[^a-zA-Z0-9_]")
+
+
+def _prometheus_metric(kind, name: str, unit: str, attributes: dict):
+    """
+    Returns the Prometheus child for a metric name and its attributes, creating the metric on first use.
+    The label names are taken from the first recording, later attributes are matched to them.
+    """
+    if name not in _prometheus:
+        metric_name = _INVALID_NAME_CHARACTERS.sub("_", name)
+        if unit == "s":
+            metric_name += "_seconds"
+
+        labelnames = sorted(attributes)
+
+        if kind is Histogram:
+            buckets = DURATION_BUCKETS if unit == "s" else SIZE_BUCKETS
+            metric = Histogram(metric_name, name, labelnames, buckets=buckets)
+        else:
+            metric = kind(metric_name, name, labelnames)
+
+        _prometheus[name] = (metric, labelnames)
+
+    metric, labelnames = _prometheus[name]
+
+    if not labelnames:
+        return metric
+
+    return metric.labels(**{label: str(attributes.get(label, "")) for label in labelnames})
+
+
+def record_histogram(name: str, value: float, unit: str = "", **attributes):
+    """
+    Records a value into a histogram, e.g. prompt sizes
+    """
+    if name not in _histograms:
+        _histograms[name] = logfire.metric_histogram(name, unit=unit)
+
+    _histograms[name].record(value, attributes=attributes)
+    _prometheus_metric(Histogram, name, unit, attributes).observe(value)
+
+
+def record_duration(name: str, seconds: float, **attributes):
+    """
+    Records how long an operation took (in seconds) into a histogram.
+    """
+    record_histogram(name, seconds, unit="s", **attributes)
+
+
+def increment_counter(name: str, amount: int = 1, **attributes):
+    """
+    Adds to a counter, e.g. cache hits and misses
+    """
+    if name not in _counters:
+        _counters[name] = logfire.metric_counter(name)
+
+    _counters[name].add(amount, attributes=attributes)
+    _prometheus_metric(Counter, name, "", attributes).inc(amount)
+
+
+def set_gauge(name: str, value: float, **attributes):
+    """
+    Sets the current value of a gauge, e.g. live sessions or queue depths
+    """
+    if name not in _gauges:
+        _gauges[name] = logfire.metric_gauge(name)
+
+    _gauges[name].set(value, attributes=attributes)
+    _prometheus_metric(Gauge, name, "", attributes).set(value)
+
+
+@contextmanager
+def time_stage(component: str, stage: str):
+    """
+    Records the time spent in the with block as stage.duration{component, stage}
+    """
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        record_duration("stage.duration", time.perf_counter() - start, component=component, stage=stage)
+
+
+def timed(component: str, stage: str = None):
+    """
+    Decorator version of time_stage for async functions, the stage defaults to the function name
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            with time_stage(component, stage or function.__name__):
+                return await function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def prometheus_metrics():
+    """
+    Returns the Prometheus text exposition of every metric of this process and its content type
+    """
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,47 @@
+####
+# Exports the embedding model to ONNX, optionally with int8 dynamic quantization, for HUG_EMBED_BACKEND=onnx.
+# Needs the optional ONNX packages: pip install "optimum[onnxruntime]"
+# Usage (from /app): python -m src.utils.manage_onnx --output ./models/bge-onnx --quantize avx512_vnni
+# then set HUG_EMBED_MODEL=./models/bge-onnx and HUG_EMBED_ONNX_FILE=onnx/model_qint8_avx512_vnni.onnx
+####
+
+import os
+import argparse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def export_onnx_model(model_name: str, output_dir: str, quantize: str = None) -> str:
+    """
+    Saves an ONNX export of the model to output_dir and returns the ONNX file to set as HUG_EMBED_ONNX_FILE
+    """
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+    model = SentenceTransformer(model_name, device="cpu", backend="onnx")
+    model.save(output_dir)
+
+    if not quantize:
+        return "onnx/model.onnx"
+
+    export_dynamic_quantized_onnx_model(model, quantize, output_dir)
+
+    return f"onnx/model_qint8_{quantize}.onnx"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exports the embedding model to ONNX")
+    parser.add_argument("--model", default=os.getenv("HUG_EMBED_MODEL"))
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--quantize", default=None, choices=["arm64", "avx2", "avx512", "avx512_vnni"])
+    args = parser.parse_args()
+
+    onnx_file = export_onnx_model(args.model, args.output, args.quantize)
+
+    print(f"HUG_EMBED_BACKEND=onnx")
+    print(f"HUG_EMBED_MODEL={args.output}")
+    print(f"HUG_EMBED_ONNX_FILE={onnx_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+####
+# Defines the provider router used for LLM calls.
+# A router holds an ordered list of model endpoints (e.g. OPEN_ROUTER_MODELS) with rolling latency and error
+# stats for each. Requests go to the first healthy endpoint and fail over to the next one on an error,
+# an endpoint that keeps failing is skipped by its circuit breaker until LLM_BREAKER_COOLDOWN has passed.
+# With hedging on, a second request is sent to the next endpoint once the first one runs past its p95,
+# the first answer wins and the other request is cancelled.
+####
+
+import os
+import time
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, List, Optional
+from dotenv import load_dotenv
+
+from src.utils.manage_metrics import record_duration, increment_counter, set_gauge
+
+load_dotenv()
+
+LLM_ATTEMPT_TIMEOUT = float(os.getenv("LLM_ATTEMPT_TIMEOUT", "30"))
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "3"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+LLM_STATS_WINDOW = int(os.getenv("LLM_STATS_WINDOW", "100"))
+
+
+def parse_models(value: Optional[str]) -> List[str]:
+    """
+    Splits a comma separated list of models, keeping the order and dropping duplicates
+    """
+    models = []
+
+    for model in (value or "").split(","):
+        model = model.strip()
+        if model and model not in models:
+            models.append(model)
+
+    return models
+
+
+class Endpoint:
+    """
+    One model endpoint with its rolling stats and circuit breaker.
+    The breaker opens after failure_threshold consecutive failures. Once cooldown has passed a single
+    trial request is let through (half open), its success closes the breaker and its failure opens it again.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window: int = LLM_STATS_WINDOW,
+        failure_threshold: int = LLM_BREAKER_FAILURES,
+        cooldown: float = LLM_BREAKER_COOLDOWN,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.clock = clock
+
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+
+    def is_available(self) -> bool:
+        """
+        True when the breaker is closed, or when it is open, the cooldown has passed and no trial is running.
+        Only checks, the trial is reserved when a request is actually sent.
+        """
+        if self.opened_at is None:
+            return True
+
+        return not self.trial_running and self.clock() - self.opened_at >= self.cooldown
+
+
+    def record_success(self, latency: float):
+        self.latencies.append(latency)
+        self.outcomes.append(True)
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+
+    def record_failure(self) -> bool:
+        """
+        Counts a failed request, returns True when it opened the breaker
+        """
+        self.outcomes.append(False)
+        self.consecutive_failures += 1
+        was_open = self.opened_at is not None
+        self.trial_running = False
+
+        if self.consecutive_failures >= self.failure_threshold:
+            self.opened_at = self.clock()
+            return not was_open
+
+        return False
+
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+
+        latencies = sorted(self.latencies)
+
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+
+        return self.outcomes.count(False) / len(self.outcomes)
+
+
+    def snapshot(self) -> dict:
+        return {
+            "endpoint": self.name,
+            "requests": len(self.outcomes),
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "error_rate": self.error_rate(),
+            "circuit_open": self.is_open,
+        }
+
+
+class ProviderRouter:
+    """
+    Sends requests to an ordered list of endpoints with failover, circuit breakers and optional hedging.
+    A request is an async function that takes the endpoint and calls the provider with endpoint.name as the model.
+    It can be run more than once (failover) or twice at the same time (hedging), so it must not change shared state.
+    """
+
+    def __init__(
+        self,
+        provider: str,
+        models: List[str],
+        hedge: bool = LLM_HEDGE_ENABLED,
+        hedge_min_delay: float = LLM_HEDGE_MIN_DELAY,
+        hedge_min_samples: int = LLM_HEDGE_MIN_SAMPLES,
+        attempt_timeout: float = LLM_ATTEMPT_TIMEOUT,
+        **endpoint_settings
+    ):
+        if not models:
+            raise ValueError(f"No models configured for {provider}")
+
+        self.provider = provider
+        self.endpoints = [Endpoint(model, **endpoint_settings) for model in models]
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.attempt_timeout = attempt_timeout
+
+
+    def candidates(self) -> List[Endpoint]:
+        """
+        Endpoints to try in order: the ones whose breaker lets the request through, then the open ones as a last resort
+        """
+        allowed = [endpoint for endpoint in self.endpoints if endpoint.is_available()]
+
+        return allowed + [endpoint for endpoint in self.endpoints if endpoint not in allowed]
+
+
+    def hedge_delay(self, endpoint: Endpoint) -> Optional[float]:
+        """
+        How long to wait for the endpoint before hedging, None until it has enough samples
+        """
+        if len(endpoint.latencies) < self.hedge_min_samples:
+            return None
+
+        return max(self.hedge_min_delay, endpoint.percentile(0.95))
+
+
+    async def _attempt(self, endpoint: Endpoint, request: Callable[[Endpoint], Awaitable[Any]]) -> Any:
+        """
+        Runs one request against one endpoint and updates its stats
+        """
+        start = time.perf_counter()
+        outcome = "error"
+
+        #A request to an open endpoint past its cooldown is its half open trial
+        trial = endpoint.is_open and endpoint.is_available()
+        if trial:
+            endpoint.trial_running = True
+
+        try:
+            result = await asyncio.wait_for(request(endpoint), self.attempt_timeout)
+            outcome = "ok"
+
+        except asyncio.CancelledError:
+            #Lost a hedge race or the caller went away, says nothing about the endpoint
+            outcome = "cancelled"
+            raise
+
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            raise
+
+        finally:
+            elapsed = time.perf_counter() - start
+
+            #A cancelled trial is not recorded, it frees the trial for the next request
+            if trial:
+                endpoint.trial_running = False
+
+            if outcome == "ok":
+                endpoint.record_success(elapsed)
+            elif outcome != "cancelled" and endpoint.record_failure():
+                increment_counter("llm.circuit_opened", provider=self.provider, endpoint=endpoint.name)
+
+            increment_counter("llm.attempts", provider=self.provider, endpoint=endpoint.name, outcome=outcome)
+            record_duration("llm.attempt_duration", elapsed, provider=self.provider, endpoint=endpoint.name, outcome=outcome)
+
+        return result
+
+
+    async def call(self, request: Callable[[Endpoint], Awaitable[Any]], hedge: bool = None) -> Any:
+        """
+        Returns the first successful result of the request, trying the endpoints in order.
+        Raises the last error when every endpoint failed.
+        """
+        hedge = self.hedge if hedge is None else hedge
+        candidates = self.candidates()
+        next_candidate = 0
+        running = {}
+        hedged = False
+        last_error = None
+
+        def launch():
+            nonlocal next_candidate
+            endpoint = candidates[next_candidate]
+            next_candidate += 1
+
+            task = asyncio.create_task(self._attempt(endpoint, request))
+            running[task] = (endpoint, time.perf_counter())
+
+        launch()
+
+        try:
+            while running:
+                timeout = None
+
+                #Hedge once, while a single request runs and there is another endpoint to race it against
+                if hedge and not hedged and len(running) == 1 and next_candidate < len(candidates):
+                    endpoint, started = next(iter(running.values()))
+                    delay = self.hedge_delay(endpoint)
+
+                    if delay is not None:
+                        timeout = max(0.0, started + delay - time.perf_counter())
+
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    hedged = True
+                    increment_counter("llm.hedges", provider=self.provider)
+                    launch()
+                    continue
+
+                for task in done:
+                    running.pop(task)
+
+                    if task.exception() is None:
+                        #The losing request took at least this long, so an endpoint that keeps losing raises its own hedge delay
+                        now = time.perf_counter()
+                        for endpoint, started in running.values():
+                            endpoint.latencies.append(now - started)
+
+                        return task.result()
+
+                    last_error = task.exception()
+
+                #Fail over when nothing else is running
+                if not running and next_candidate < len(candidates):
+                    launch()
+
+            raise last_error
+
+        finally:
+            for task in running:
+                task.cancel()
+
+            #Lets the cancelled attempts settle their stats and trial before the caller moves on
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+
+    def snapshot(self) -> List[dict]:
+        return [endpoint.snapshot() for endpoint in self.endpoints]
+
+
+    def update_gauges(self):
+        """
+        Reads the rolling stats of every endpoint into their gauges
+        """
+        for endpoint in self.endpoints:
+            labels = {"provider": self.provider, "endpoint": endpoint.name}
+
+            if endpoint.latencies:
+                set_gauge("llm.latency_p95", endpoint.percentile(0.95), **labels)
+
+            set_gauge("llm.error_rate", endpoint.error_rate(), **labels)
+            set_gauge("llm.circuit_open", int(endpoint.is_open), **labels)
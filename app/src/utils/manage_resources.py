@@ -0,0 +1,308 @@
+####
+# Defines the shared resources (embedding model and service clients) used by the agents.
+# Each worker process creates them once at startup instead of on every request.
+####
+
+import os
+import asyncio
+import time
+from dotenv import load_dotenv
+import logfire
+from langchain_huggingface import HuggingFaceEmbeddings
+from qdrant_client import QdrantClient
+from openai import AsyncOpenAI
+import httpx
+from redis.asyncio import Redis, ConnectionPool
+
+from src.utils.manage_metrics import record_duration
+from src.utils.manage_embeddings import EmbeddingService
+from src.utils.manage_providers import ProviderRouter, parse_models
+
+load_dotenv()
+
+
+#Holds the resources created for this worker process
+_resources = {}
+
+
+def embedding_model_id() -> str:
+    """
+    Identifies the configured embedding model and backend, vectors of different backends are not mixed in caches
+    """
+    backend = os.getenv("HUG_EMBED_BACKEND", "torch")
+
+    if backend == "onnx":
+        return f"{os.getenv('HUG_EMBED_MODEL')}:onnx:{os.getenv('HUG_EMBED_ONNX_FILE') or 'onnx/model.onnx'}"
+
+    return os.getenv("HUG_EMBED_MODEL")
+
+
+def _create_embedding_client():
+    """
+    Loads the embedding model into memory.
+    HUG_EMBED_BACKEND=onnx runs it with ONNX Runtime, HUG_EMBED_ONNX_FILE picks the (e.g. int8 quantized) export to load
+    """
+    model_kwargs = {"device": "cpu"}
+
+    if os.getenv("HUG_EMBED_BACKEND", "torch") == "onnx":
+        model_kwargs["backend"] = "onnx"
+
+        if os.getenv("HUG_EMBED_ONNX_FILE"):
+            model_kwargs["model_kwargs"] = {"file_name": os.getenv("HUG_EMBED_ONNX_FILE")}
+
+    return HuggingFaceEmbeddings(
+        model_name = os.getenv("HUG_EMBED_MODEL"),
+        model_kwargs=model_kwargs
+    )
+
+
+def _create_embedding_service():
+    """
+    Wraps the embedding model in the micro-batching service that runs it off the event loop
+    """
+    return EmbeddingService(get_embedding_client())
+
+
+def _create_qdrant_client():
+    """
+    Creates the client used to talk to qdrant vector database.
+    QDRANT_PREFER_GRPC=true sends searches and upserts over gRPC (QDRANT_GRPC_PORT) instead of HTTP
+    """
+    return QdrantClient(
+        url=os.getenv("QDRANT_HOST"),
+        prefer_grpc=os.getenv("QDRANT_PREFER_GRPC", "false").lower() == "true",
+        grpc_port=int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+    )
+
+
+def _create_chat_client():
+    """
+    Creates the async OpenAI client used to talk to OPEN ROUTER.
+    Connections are pooled and kept alive so requests do not pay a new TLS handshake.
+    """
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "20")),
+            max_keepalive_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "20")),
+            keepalive_expiry=60
+        ),
+        timeout=httpx.Timeout(
+            float(os.getenv("LLM_TIMEOUT", "60")),
+            connect=float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+        )
+    )
+
+    return AsyncOpenAI(
+        base_url=os.getenv("OPEN_ROUTER_URL"),
+        api_key=os.getenv("OPEN_ROUTER_KEY"),
+        http_client=http_client,
+        max_retries=int(os.getenv("LLM_MAX_RETRIES", "1"))
+    )
+
+
+def _create_tool_http_client():
+    """
+    Creates the pooled async HTTP client used by the tools to call the UelloSend API
+    """
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=int(os.getenv("TOOL_MAX_CONNECTIONS", "20")),
+            max_keepalive_connections=int(os.getenv("TOOL_MAX_CONNECTIONS", "20")),
+            keepalive_expiry=60
+        ),
+        headers={'Content-Type': 'application/json'}
+    )
+
+
+def _create_redis_client():
+    """
+    Creates the async redis client with an explicit connection pool
+    """
+    pool = ConnectionPool(
+        host=os.getenv("REDIS_HOST"),
+        port=int(os.getenv("REDIS_PORT")),
+        db=0,
+        max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", "50")),
+        decode_responses=False
+    )
+
+    return Redis.from_pool(pool)
+
+
+def _create_llm_semaphore():
+    """
+    Caps the number of LLM calls running at the same time in this worker
+    """
+    return asyncio.Semaphore(int(os.getenv("LLM_MAX_CONCURRENCY", "10")))
+
+
+def _create_chat_router():
+    """
+    Creates the router over the OPEN ROUTER models, OPEN_ROUTER_MODELS lists them in order of preference
+    """
+    return ProviderRouter("open_router", parse_models(os.getenv("OPEN_ROUTER_MODELS") or os.getenv("OPEN_ROUTER_MODEL")))
+
+
+def _create_gemini_router():
+    """
+    Creates the router over the Gemini models, GEMINI_MODELS lists them in order of preference
+    """
+    return ProviderRouter("gemini", parse_models(os.getenv("GEMINI_MODELS") or os.getenv("GEMINI_MODEL")))
+
+
+_factories = {
+    "embedding_client": _create_embedding_client,
+    "embedding_service": _create_embedding_service,
+    "qdrant_client": _create_qdrant_client,
+    "chat_client": _create_chat_client,
+    "llm_semaphore": _create_llm_semaphore,
+    "chat_router": _create_chat_router,
+    "gemini_router": _create_gemini_router,
+    "tool_http_client": _create_tool_http_client,
+    "redis_client": _create_redis_client,
+}
+
+
+def _get_resource(name: str):
+    """
+    Returns a shared resource, creating it the first time it is requested
+    """
+    if name not in _resources:
+        _resources[name] = _factories[name]()
+
+    return _resources[name]
+
+
+def get_embedding_client() -> HuggingFaceEmbeddings:
+    """
+    Returns the shared embedding model
+    """
+    return _get_resource("embedding_client")
+
+
+def get_embedding_service() -> EmbeddingService:
+    """
+    Returns the shared embedding service
+    """
+    return _get_resource("embedding_service")
+
+
+def get_qdrant_client() -> QdrantClient:
+    """
+    Returns the shared qdrant client
+    """
+    return _get_resource("qdrant_client")
+
+
+def get_chat_client() -> AsyncOpenAI:
+    """
+    Returns the shared OPEN ROUTER chat client
+    """
+    return _get_resource("chat_client")
+
+
+def get_llm_semaphore() -> asyncio.Semaphore:
+    """
+    Returns the semaphore that limits concurrent LLM calls
+    """
+    return _get_resource("llm_semaphore")
+
+
+def get_chat_router() -> ProviderRouter:
+    """
+    Returns the router that picks the OPEN ROUTER model of each request
+    """
+    return _get_resource("chat_router")
+
+
+def get_gemini_router() -> ProviderRouter:
+    """
+    Returns the router that picks the Gemini model of each request
+    """
+    return _get_resource("gemini_router")
+
+
+def get_tool_http_client() -> httpx.AsyncClient:
+    """
+    Returns the shared HTTP client used by the tools
+    """
+    return _get_resource("tool_http_client")
+
+
+def get_redis_client() -> Redis:
+    """
+    Returns the shared async redis client
+    """
+    return _get_resource("redis_client")
+
+
+def register_resource(name: str, resource):
+    """
+    Replaces a shared resource, e.g. to point the agents at local stand-ins when benchmarking
+    """
+    _resources[name] = resource
+
+
+async def init_resources():
+    """
+    Creates all shared resources and warms up the embedding model with a dummy embed.
+    Called once from the server lifespan so that the first request does not pay the loading cost.
+    """
+    start = time.perf_counter()
+
+    try:
+        #Loading the model is CPU bound, run it off the event loop
+        await asyncio.to_thread(get_embedding_client)
+        await get_embedding_service().embed_query("warm up")
+
+        get_qdrant_client()
+        get_chat_client()
+        get_llm_semaphore()
+        get_tool_http_client()
+        get_redis_client()
+        get_chat_router()
+        get_gemini_router()
+
+    except Exception as e:
+        #Missing resources are created again on first use, the server can still start
+        logfire.error(
+            "Unhandled exception in warming up shared resources",
+            exc_info=e
+        )
+
+    warmup_time = time.perf_counter() - start
+    _resources["warmup_seconds"] = warmup_time
+
+    record_duration("resources.warmup", warmup_time)
+    logfire.info("Shared resources are ready", extra={"warmup_seconds": round(warmup_time, 3)})
+
+    return warmup_time
+
+
+async def close_resources():
+    """
+    Closes the shared clients when the worker shuts down
+    """
+    try:
+        if "qdrant_client" in _resources:
+            _resources["qdrant_client"].close()
+
+        if "chat_client" in _resources:
+            await _resources["chat_client"].close()
+
+        if "tool_http_client" in _resources:
+            await _resources["tool_http_client"].aclose()
+
+        if "redis_client" in _resources:
+            await _resources["redis_client"].aclose()
+
+        if "embedding_service" in _resources:
+            _resources["embedding_service"].close()
+
+    except Exception as e:
+        logfire.error(
+            "Unhandled exception in closing shared resources",
+            exc_info=e
+        )
+
+    _resources.clear()
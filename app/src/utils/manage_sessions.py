@@ -0,0 +1,249 @@
+####
+# Defines the session stores used to keep UelloSendAgent conversations between requests.
+# The memory store keeps live agents in this worker, the redis store keeps the conversation
+# history in redis so that any worker or replica can continue a conversation.
+####
+
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+from dotenv import load_dotenv
+
+from src.agents.gemini_agent import UelloSendAgent
+from src.utils.manage_resources import get_redis_client
+from src.utils.session_codec import encode_session, decode_session
+from src.utils.manage_metrics import timed, increment_counter
+
+load_dotenv()
+
+
+SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", "20000"))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(512 * 1024 * 1024)))
+
+#Rough resident size of an agent without its history (model client, tool declarations)
+SESSION_BASE_BYTES = 16 * 1024
+
+
+def estimate_agent_bytes(agent: UelloSendAgent) -> int:
+    """
+    Estimates the memory held by an agent from the serialized size of its Gemini history
+    """
+    return SESSION_BASE_BYTES + sum(type(content).pb(content).ByteSize() for content in agent.conversation.history)
+
+
+#Model for session
+class AgentSession:
+    def __init__(self, agent: UelloSendAgent, size: int, last_accessed: float):
+        self.agent = agent
+        self.size = size
+        self.last_accessed = last_accessed
+
+
+class MemorySessionStore:
+    """
+    Keeps agents in the memory of this worker.
+    Sessions are not shared between workers and are lost when the server restarts.
+    Sessions are kept in least recently used order, every session has the same timeout so that is also
+    expiry order: a touch moves the session to the end and expired sessions are popped from the front.
+    The store holds at most max_sessions sessions and max_bytes estimated bytes, the least recently used
+    sessions are evicted first.
+    """
+
+    def __init__(
+        self,
+        timeout: int,
+        max_sessions: int = SESSION_MAX_COUNT,
+        max_bytes: int = SESSION_MAX_BYTES,
+        estimate_size: Callable[[UelloSendAgent], int] = estimate_agent_bytes,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.timeout = timeout
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.estimate_size = estimate_size
+        self.clock = clock
+        self.sessions: OrderedDict[str, AgentSession] = OrderedDict()
+        self.bytes = 0
+        self.evictions = {"expired": 0, "count": 0, "bytes": 0}
+
+
+    def _remove(self, session_id: str):
+        session = self.sessions.pop(session_id)
+        self.bytes -= session.size
+
+
+    def _record_evictions(self, reason: str, evicted: int):
+        if evicted:
+            self.evictions[reason] += evicted
+            increment_counter("sessions.evictions", evicted, reason=reason)
+
+
+    def _evict_expired(self, now: float):
+        """
+        Pops sessions from the front while they are expired, stops at the first live one
+        """
+        evicted = 0
+
+        while self.sessions:
+            session_id, session = next(iter(self.sessions.items()))
+
+            if now - session.last_accessed <= self.timeout:
+                break
+
+            self._remove(session_id)
+            evicted += 1
+
+        self._record_evictions("expired", evicted)
+
+
+    async def get(self, session_id: str) -> Optional[UelloSendAgent]:
+        """
+        Returns the agent for a session and marks the session as used, None if there is no session
+        """
+        session = self.sessions.get(session_id)
+
+        if session is None:
+            return None
+
+        now = self.clock()
+
+        #Expiry is exact, a session past its timeout is gone even if cleanup has not run yet
+        if now - session.last_accessed > self.timeout:
+            self._remove(session_id)
+            self._record_evictions("expired", 1)
+            return None
+
+        session.last_accessed = now
+        self.sessions.move_to_end(session_id)
+
+        return session.agent
+
+
+    async def save(self, session_id: str, agent: UelloSendAgent):
+        """
+        Stores the agent after a turn, then evicts expired sessions and sessions over the caps
+        """
+        now = self.clock()
+        size = self.estimate_size(agent)
+        session = self.sessions.get(session_id)
+
+        if session is None:
+            self.sessions[session_id] = AgentSession(agent, size, now)
+        else:
+            self.bytes -= session.size
+            session.agent = agent
+            session.size = size
+            session.last_accessed = now
+            self.sessions.move_to_end(session_id)
+
+        self.bytes += size
+        self._evict_expired(now)
+
+        #The session just saved is the most recent one, the bytes cap never evicts it
+        evicted = 0
+        while len(self.sessions) > self.max_sessions:
+            self._remove(next(iter(self.sessions)))
+            evicted += 1
+        self._record_evictions("count", evicted)
+
+        evicted = 0
+        while self.bytes > self.max_bytes and len(self.sessions) > 1:
+            self._remove(next(iter(self.sessions)))
+            evicted += 1
+        self._record_evictions("bytes", evicted)
+
+
+    async def delete(self, session_id: str) -> bool:
+        """
+        Removes a session, returns False if it did not exist
+        """
+        if session_id not in self.sessions:
+            return False
+
+        self._remove(session_id)
+
+        return True
+
+
+    async def cleanup(self):
+        """
+        Removes sessions that have been idle for longer than the timeout, only the expired sessions are visited
+        """
+        self._evict_expired(self.clock())
+
+
+    async def count(self) -> int:
+        return len(self.sessions)
+
+
+class RedisSessionStore:
+    """
+    Keeps the Gemini conversation history of each session in redis.
+    The agent is rebuilt from the stored history on whichever worker gets the next request.
+    """
+
+    def __init__(self, timeout: int, prefix: str = "uellosend_support_session:"):
+        self.timeout = timeout
+        self.prefix = prefix
+
+
+    @timed("redis", "load_support_session")
+    async def get(self, session_id: str) -> Optional[UelloSendAgent]:
+        """
+        Loads the history and refreshes the session timeout in one round trip, None if there is no session
+        """
+        data = await get_redis_client().getex(f"{self.prefix}{session_id}", ex=self.timeout)
+
+        if data is None:
+            return None
+
+        return UelloSendAgent(history=decode_session(data))
+
+
+    @timed("redis", "save_support_session")
+    async def save(self, session_id: str, agent: UelloSendAgent):
+        """
+        Stores the conversation history after a turn
+        """
+        data = encode_session(agent.export_history())
+
+        await get_redis_client().set(f"{self.prefix}{session_id}", data, ex=self.timeout)
+
+
+    async def delete(self, session_id: str) -> bool:
+        """
+        Removes a session, returns False if it did not exist
+        """
+        return await get_redis_client().delete(f"{self.prefix}{session_id}") > 0
+
+
+    async def cleanup(self):
+        """
+        Nothing to do, redis expires idle sessions by itself
+        """
+        return None
+
+
+    async def count(self) -> int:
+        count = 0
+
+        async for _ in get_redis_client().scan_iter(match=f"{self.prefix}*", count=1000):
+            count += 1
+
+        return count
+
+
+def create_session_store(timeout: int):
+    """
+    Creates the session store selected with SUPPORT_SESSION_BACKEND (memory or redis)
+    """
+    backend = os.getenv("SUPPORT_SESSION_BACKEND", "memory")
+
+    if backend == "redis":
+        return RedisSessionStore(timeout)
+
+    if backend == "memory":
+        return MemorySessionStore(timeout)
+
+    raise ValueError(f"Unknown SUPPORT_SESSION_BACKEND: {backend}")
@@ -0,0 +1,164 @@
+####
+# Defines the result cache for read-only UelloSend tools.
+# Results are kept for TOOL_CACHE_TTL seconds in a bounded in-process LRU, keyed by the tool name and its
+# normalized arguments. Concurrent identical lookups share one backend request (single flight).
+# Only use it for tools that do not change data on UelloSend.
+####
+
+import os
+import time
+import asyncio
+import functools
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+from dotenv import load_dotenv
+
+from src.utils.manage_metrics import increment_counter
+
+load_dotenv()
+
+TOOL_CACHE_ENABLED = os.getenv("TOOL_CACHE_ENABLED", "true").lower() == "true"
+TOOL_CACHE_TTL = float(os.getenv("TOOL_CACHE_TTL", "60"))
+TOOL_CACHE_MAX_ENTRIES = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "1024"))
+
+
+def normalize_argument(value):
+    """
+    Normalizes an argument so equivalent lookups share a key: emails and ids are case and whitespace
+    insensitive, and whole floats (the model sends every number as a float) equal their int
+    """
+    if isinstance(value, str):
+        return value.strip().lower()
+
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+
+    return value
+
+
+def cache_key(tool: str, args: tuple, kwargs: dict) -> Hashable:
+    return (
+        tool,
+        tuple(normalize_argument(arg) for arg in args),
+        tuple(sorted((name, normalize_argument(value)) for name, value in kwargs.items()))
+    )
+
+
+class ToolResultCache:
+    """
+    TTL and size bounded cache of tool results with single flight dedup of concurrent lookups.
+    Exceptions are passed to every waiting caller and never cached.
+    """
+
+    def __init__(
+        self,
+        ttl: float = TOOL_CACHE_TTL,
+        max_entries: int = TOOL_CACHE_MAX_ENTRIES,
+        enabled: bool = TOOL_CACHE_ENABLED,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+
+
+    def _lookup(self, key: Hashable):
+        """
+        Returns (True, result) for a live entry, expired entries are dropped
+        """
+        entry = self._entries.get(key)
+
+        if entry is None:
+            return False, None
+
+        expires_at, result = entry
+
+        if expires_at <= self.clock():
+            del self._entries[key]
+            return False, None
+
+        self._entries.move_to_end(key)
+
+        return True, result
+
+
+    def _remember(self, key: Hashable, result: Any):
+        self._entries[key] = (self.clock() + self.ttl, result)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        """
+        Stores the result of a finished backend call and ends its flight
+        """
+        self._inflight.pop(key, None)
+
+        if task.cancelled():
+            return
+
+        #Reading the exception marks it as retrieved even when every caller has given up waiting
+        if task.exception() is None:
+            self._remember(key, task.result())
+
+
+    async def get_or_call(self, tool: str, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Returns the cached result for the key, joins a running lookup with the same key,
+        or runs call and caches its result
+        """
+        if not self.enabled:
+            return await call()
+
+        found, result = self._lookup(key)
+
+        if found:
+            self.hits += 1
+            increment_counter("tool_cache.lookups", tool=tool, result="hit")
+
+            return result
+
+        task = self._inflight.get(key)
+
+        if task is not None:
+            self.shared += 1
+            increment_counter("tool_cache.lookups", tool=tool, result="shared")
+        else:
+            self.misses += 1
+            increment_counter("tool_cache.lookups", tool=tool, result="miss")
+
+            #The backend call runs as its own task, a caller that times out does not cancel it for the others
+            task = asyncio.ensure_future(call())
+            self._inflight[key] = task
+            task.add_done_callback(functools.partial(self._finish, key))
+
+        return await asyncio.shield(task)
+
+
+    def clear(self):
+        self._entries.clear()
+
+
+#Shared by every read-only tool in this worker
+tool_cache = ToolResultCache()
+
+
+def cached_tool(function: Callable[..., Awaitable[Any]]):
+    """
+    Decorator that serves a read-only async tool from the tool cache
+    """
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        key = cache_key(function.__name__, args, kwargs)
+
+        return await tool_cache.get_or_call(function.__name__, key, lambda: function(*args, **kwargs))
+
+    return wrapper
@@ -0,0 +1,67 @@
+####
+# Defines the encoding used to store session histories in redis.
+# Sessions are stored as compact JSON behind a two byte header (schema version, compression),
+# histories larger than SESSION_COMPRESS_THRESHOLD bytes are compressed with zstd if available, otherwise zlib.
+####
+
+import os
+import json
+import zlib
+from dotenv import load_dotenv
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+load_dotenv()
+
+SCHEMA_VERSION = 1
+
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+COMPRESSION_ZSTD = 2
+
+SESSION_COMPRESS_THRESHOLD = int(os.getenv("SESSION_COMPRESS_THRESHOLD", "1024"))
+
+
+def encode_session(data) -> bytes:
+    """
+    Encodes a JSON serializable session history into bytes for storage
+    """
+    payload = json.dumps(data, separators=(",", ":")).encode("utf-8")
+    compression = COMPRESSION_NONE
+
+    if len(payload) > SESSION_COMPRESS_THRESHOLD:
+        if zstandard is not None:
+            payload = zstandard.ZstdCompressor(level=1).compress(payload)
+            compression = COMPRESSION_ZSTD
+        else:
+            payload = zlib.compress(payload, 1)
+            compression = COMPRESSION_ZLIB
+
+    return bytes([SCHEMA_VERSION, compression]) + payload
+
+
+def decode_session(blob: bytes):
+    """
+    Decodes bytes written by encode_session, raises ValueError for data in an unknown format
+    """
+    if len(blob) < 2 or blob[0] != SCHEMA_VERSION:
+        raise ValueError("Unknown session format")
+
+    compression = blob[1]
+    payload = blob[2:]
+
+    if compression == COMPRESSION_ZSTD:
+        if zstandard is None:
+            raise ValueError("Session is zstd compressed but zstandard is not installed")
+        payload = zstandard.ZstdDecompressor().decompress(payload)
+
+    elif compression == COMPRESSION_ZLIB:
+        payload = zlib.decompress(payload)
+
+    elif compression != COMPRESSION_NONE:
+        raise ValueError("Unknown session compression")
+
+    return json.loads(payload)
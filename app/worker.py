@@ -0,0 +1,49 @@
+####
+# Background worker that runs the indexing jobs queued by the /scraper endpoint.
+# Runs as its own process (see docker-compose.yml) so crawling and embedding do not compete with chat traffic.
+# Usage: python worker.py
+####
+
+import asyncio
+import signal
+import logfire
+from dotenv import load_dotenv
+
+from src.agents.rag_agent import QueryAgent
+from src.utils.manage_jobs import IndexJobWorker
+from src.utils.manage_resources import init_resources, close_resources
+
+
+load_dotenv()
+logfire.configure(send_to_logfire="if-token-present", scrubbing=False, service_name="indexing-worker")
+
+
+async def index_job_handler(job: dict, on_progress) -> dict:
+    """
+    Indexes the urls of a job into its collection
+    """
+    agent = QueryAgent([])
+    agent.qdrant_collection = job["collection"]
+
+    return await agent.index_urls(job["urls"], on_progress=on_progress)
+
+
+async def main():
+    #Load embedding model and clients once for this worker
+    await init_resources()
+
+    worker = IndexJobWorker(index_job_handler)
+
+    #Finish the running job on shutdown, a job cut short by a hard kill is recovered by the next worker
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, lambda: setattr(worker, "stopped", True))
+
+    try:
+        await worker.run()
+    finally:
+        await close_resources()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())